@@ -0,0 +1,626 @@
+"""
+性能测试。直接运行 `python benchmark.py` 即可，结果输出到标准输出。
+"""
+import gc
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from font_cache import FontMetricsCache, FontNameCache
+from font_library import Font, FontconfigResolver, FontLibrary, Type4CmapTable, Type12CmapTable
+from incremental import Document
+import gpos
+import gsub
+import parser
+import parser_jianpu
+import shaping
+import parser_lyric
+import parser_staff
+import timeline
+import lyric_alignment
+import token_process
+from item_type import ItemType, TokenNode
+from parse_tree import ITEM_TYPES
+from parser import parse, predict_table
+from tokenizer import tokenize, tokenize_with_braces
+
+
+def make_document(num_blocks: int, seed: int = 0) -> str:
+    """
+    生成测试用的大文档，各类谱行、歌词、谱表随机交替出现。
+    :param num_blocks: 块的数目
+    :param seed: 随机数种子
+    :return: 文档全文
+    """
+    rand = random.Random(seed)
+    parts = ['版面 {\n  宽度 = 170mm\n  音符字号 = 15\n  字体 = "思源宋体 Light"\n  每拍宽度 = 5 % 即5个半角数字\n}\n']
+    for i in range(num_blocks):
+        kind = rand.randrange(4)
+        if kind == 0:
+            notes = ' '.join(str(rand.randrange(8)) + rand.choice(['', "'", ',', '_', '=']) for _ in range(32))
+            parts.append('谱行%d = 简谱 { 拍号 = 4/4 } {\n  %s\n}\n' % (i, notes))
+        elif kind == 1:
+            notes = ' '.join(rand.choice('abcdefg') + rand.choice(['', 'is', 'es']) + rand.choice(['', "'", ','])
+                             + rand.choice(['', '4', '8']) for _ in range(32))
+            parts.append('谱行%d = 五线谱 { 调号 = D; 拍号 = 4/4 } {\n  %s\n}\n' % (i, notes))
+        elif kind == 2:
+            parts.append('歌词%d = 歌词中 {\n  我是笨蛋，我是傻子。“天上”人间。\n}\n' % i)
+        else:
+            parts.append('谱表 {\n  谱行%d, 谱行%d{歌词%d}\n}\n' % (i, i - 1, i - 2))
+    return ''.join(parts)
+
+
+def measure(function, *args, repeat: int = 3):
+    """
+    取多次运行中最快的一次。
+    :return: (最短用时（秒）, 函数返回值)
+    """
+    best = None
+    result = None
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - begin
+        if best is None or elapsed < best:
+            best = elapsed
+    return best, result
+
+
+def bench_tokenize(num_blocks: int):
+    content = make_document(num_blocks)
+    elapsed, tokens = measure(tokenize, content)
+    print('tokenize: %d 字符, %d 个 Token, %.3f 秒, %.0f Token/秒'
+          % (len(content), len(tokens), elapsed, len(tokens) / elapsed))
+
+
+def bench_parse(num_blocks: int):
+    # 块数翻两番，用时也应只翻两番左右
+    for blocks in (num_blocks // 4, num_blocks):
+        content = make_document(blocks)
+        tokens = tokenize(content)
+        elapsed, _ = measure(parse, tokens, content)
+        print('parse: %d 块, %d 个 Token, %.3f 秒, %.0f Token/秒'
+              % (blocks, len(tokens), elapsed, len(tokens) / elapsed))
+
+
+def bench_parse_parallel(num_blocks: int):
+    content = make_document(num_blocks)
+    tokens = tokenize(content)
+    elapsed_serial, _ = measure(parse, tokens, content)
+    elapsed_parallel, _ = measure(lambda: parse(tokens, content, parallel=True))
+    print('parse (并行): %d 块, 串行 %.3f 秒, 并行 %.3f 秒（%d 个 CPU）'
+          % (num_blocks, elapsed_serial, elapsed_parallel, os.cpu_count() or 1))
+
+
+def parse_impl_dict(tokens, begin: int = 0, end: int = None) -> int:
+    """
+    原来的分析驱动：每一步用 (栈顶, 下一个符号) 的 ItemType 元组查 predict_table，再把推导式右侧倒过来入栈。
+    除查表外与 `parser.parse_impl` 相同，用来替换它以比较整篇文档的分析用时。
+    """
+    if end is None:
+        end = len(tokens) - 1
+    tree = parser.tree
+    end_of_file = TokenNode(ItemType.END_OF_FILE, None)
+    tree_root = tree.add_node(ItemType.DOCUMENT)
+    types = tree.types
+    pred_stack = [-1, tree_root]
+    offset = begin
+    current = tokens[offset] if offset < end else end_of_file
+    next_offset = offset + 1
+    type_next = current.type
+    while len(pred_stack) > 1:
+        if type_next == ItemType.KEYWORD and current.content in parser.str_to_type:
+            type_next, fun_next = parser.str_to_type[current.content]
+            if current.content[0] == '歌':
+                current, next_offset = parser.match_lyric(offset + 1, tokens, type_next, fun_next)
+            else:
+                current, next_offset = parser.match_music(offset + 1, tokens, type_next, fun_next)
+
+        top = pred_stack[-1]
+        type_top = ITEM_TYPES[types[top]]
+        if type_top == type_next:
+            if type_next == ItemType.JIANPU or type_next == ItemType.STAFF:
+                tree.attach(top, current.content[0])
+                tree.set_value(top, current.content[1], current.start, current.end)
+            else:
+                tree.set_value(top, current.content, current.start, current.end)
+            pred_stack.pop()
+            offset = next_offset
+            current = tokens[offset] if offset < end else end_of_file
+            next_offset = offset + 1
+            type_next = current.type
+            continue
+        if type_top.is_terminal():
+            print('需要 %s 类型，但相应的 Token 为 %s' % (type_top.name, current))
+            exit(1)
+
+        if (type_top, type_next) not in predict_table.keys():
+            print('代码语法有错误，但是报错部分还没写')
+            exit(1)
+        pred_stack.pop()
+        list_nodes = list(reversed(predict_table[(type_top, type_next)]))
+        first = tree.add_children(top, list_nodes)
+        if list_nodes[0] != ItemType.EMPTY:
+            pred_stack.extend(range(first + len(list_nodes) - 1, first - 1, -1))
+
+    return tree_root
+
+
+def bench_predict_table(num_blocks: int):
+    # 整篇文档的分析：原来用元组作键查字典的驱动与现在查稠密二维表的 parse_impl
+    content = make_document(num_blocks)
+    tokens, pairs = tokenize_with_braces(content)
+    parse_impl_dense = parser.parse_impl
+
+    def parse_with(driver):
+        parser.parse_impl = driver
+        try:
+            return parse(tokens, content, pairs)
+        finally:
+            parser.parse_impl = parse_impl_dense
+
+    elapsed_dict, root_dict = measure(parse_with, parse_impl_dict)
+    elapsed_dense, root_dense = measure(parse_with, parse_impl_dense)
+    assert root_dict.tree.types == root_dense.tree.types
+    print('predict table: %d 块, %d 个 Token, 字典 %.3f 秒, 稠密表 %.3f 秒, 加速 %.2f 倍'
+          % (num_blocks, len(tokens), elapsed_dict, elapsed_dense, elapsed_dict / elapsed_dense))
+
+
+def bench_tree_memory(num_blocks: int):
+    # 比较数组存储的语法树与 TokenNode 组成的语法树（即原来的表示）中结点本身所占的内存，
+    # 两者共用的内容（字符串、音符等）不计在内
+    content = make_document(num_blocks)
+    tokens = tokenize(content)
+    root = parse(tokens, content)
+    tree = root.tree
+    arena_size = sum(sys.getsizeof(buffer) for buffer in (tree.types, tree.parents, tree.first_child,
+                                                         tree.child_count, tree.starts, tree.ends, tree.payloads))
+    arena_size += sys.getsizeof(tree.values)
+
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    tracemalloc.start()
+    token_tree = root.to_token_node()
+    node_size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    objects = len(gc.get_objects()) - objects_before
+    print('语法树内存: %d 个结点, 数组 %.2f MB, TokenNode %.2f MB（另有 %d 个 GC 跟踪的对象）'
+          % (len(tree), arena_size / 2 ** 20, node_size / 2 ** 20, objects))
+    del token_tree
+
+
+def bench_jianpu(num_blocks: int):
+    # 比较逐个字符分析、每个音符两个对象的 tokenize 与数组存储的 tokenize_sequence
+    rand = random.Random(0)
+    content = ' '.join(str(rand.randrange(8)) + rand.choice(['', "'", ',', '_', '=', "'_"])
+                       for _ in range(num_blocks * 16))
+    elapsed_list, _ = measure(parser_jianpu.tokenize, content)
+    elapsed_sequence, _ = measure(parser_jianpu.tokenize_sequence, content)
+    sizes = []
+    for function in (parser_jianpu.tokenize, parser_jianpu.tokenize_sequence):
+        tracemalloc.start()
+        result = function(content)
+        sizes.append(tracemalloc.get_traced_memory()[0] / len(result))
+        tracemalloc.stop()
+        del result
+    print('简谱: %d 个音符, 列表 %.3f 秒 %.0f 字节/音符, 数组 %.3f 秒 %.1f 字节/音符'
+          % (num_blocks * 16, elapsed_list, sizes[0], elapsed_sequence, sizes[1]))
+
+
+def bench_staff(num_blocks: int):
+    # 比较逐个音符建立对象的 tokenize 与整列计算的 tokenize_sequence
+    rand = random.Random(0)
+    content = ' '.join(rand.choice('abcdefg') + rand.choice(['', 'is', 'es']) + rand.choice(['', "'", ','])
+                       + rand.choice(['', '4', '8']) for _ in range(num_blocks * 16))
+    elapsed_list, _ = measure(parser_staff.tokenize, content)
+    elapsed_sequence, _ = measure(parser_staff.tokenize_sequence, content)
+    print('五线谱: %d 个音符, 列表 %.3f 秒, 数组 %.3f 秒, 加速 %.2f 倍'
+          % (num_blocks * 16, elapsed_list, elapsed_sequence, elapsed_list / elapsed_sequence))
+
+
+def bench_lyric(num_blocks: int):
+    # 比较每个音节一个字符串和 TokenNode 的 tokenize_cn 与只记录位置的 segment_cn
+    content = '  我是笨蛋，我是傻子。“天上”人间。\n' * num_blocks * 2
+    elapsed_list, _ = measure(parser_lyric.tokenize_cn, content)
+    elapsed_spans, _ = measure(parser_lyric.segment_cn, content)
+    sizes = []
+    for function in (parser_lyric.tokenize_cn, parser_lyric.segment_cn):
+        tracemalloc.start()
+        result = function(content)
+        sizes.append(tracemalloc.get_traced_memory()[0] / len(result))
+        tracemalloc.stop()
+        del result
+    print('歌词: %d 字符, 列表 %.3f 秒 %.0f 字节/音节, 位置 %.3f 秒 %.1f 字节/音节'
+          % (len(content), elapsed_list, sizes[0], elapsed_spans, sizes[1]))
+
+
+def bench_timeline(num_blocks: int):
+    # 同一谱表中的一行简谱和一行五线谱：算时间轴并上下对齐
+    rand = random.Random(0)
+    num_notes = num_blocks * 16
+    jianpu = parser_jianpu.tokenize_sequence(' '.join(str(rand.randrange(1, 8)) + rand.choice(['', '_', '='])
+                                                      for _ in range(num_notes)))
+    staff = parser_staff.tokenize_sequence(' '.join(rand.choice('abcdefg') + rand.choice(['', '4', '8', '16'])
+                                                    for _ in range(num_notes)))
+
+    def build():
+        return [timeline.build_timeline(timeline.note_durations(sequence, 4), 4, 4) for sequence in (jianpu, staff)]
+
+    elapsed_build, timelines = measure(build)
+    elapsed_align, _ = measure(timeline.align, timelines)
+    print('时间轴: 2 行共 %d 个音符, 计算 %.3f 秒, 对齐 %.3f 秒'
+          % (num_notes * 2, elapsed_build, elapsed_align))
+
+
+def bench_lyric_alignment(num_blocks: int):
+    # 数百段歌词配同一行数千个音符的简谱（含休止符和增时线），与逐个音节配对的做法比较
+    rand = random.Random(0)
+    num_notes = max(num_blocks // 4, 1)
+    num_verses = 300
+    notes = ' '.join(rand.choice('12345670-') for _ in range(num_notes))
+    sequence = parser_jianpu.tokenize_sequence(notes)
+    verse = parser_lyric.segment_cn('我是笨蛋，我是傻子。“天上”人间。' * (num_notes // 12 + 1))
+    verses = [verse] * num_verses
+
+    def align_pairs():
+        result = []
+        for lyric in verses:
+            pairs = []
+            syllable = 0
+            for index, note in enumerate(sequence):
+                if syllable >= len(lyric):
+                    break
+                if note.content.note > 0:
+                    pairs.append((syllable, index))
+                    syllable += 1
+            result.append(pairs)
+        return result
+
+    elapsed_pairs, _ = measure(align_pairs, repeat=1)
+    elapsed_batched, _ = measure(lyric_alignment.align_lyrics, sequence, verses)
+    print('配歌词: %d 段 × %d 个音符, 逐个配对 %.3f 秒, 成批 %.4f 秒'
+          % (num_verses, num_notes, elapsed_pairs, elapsed_batched))
+
+
+def make_type4_cmap(num_segments: int, seed: int = 0) -> bytes:
+    """
+    生成 4 型 cmap 子表，段数与中文字体相当：各段随机分布在 0x4E00 之后，一半用 id_range_offset。
+    """
+    rand = random.Random(seed)
+    points = sorted(rand.sample(range(0x4E00, 0xFFFE), 2 * num_segments))
+    segments = [(points[2 * i], points[2 * i + 1]) for i in range(num_segments)] + [(0xFFFF, 0xFFFF)]
+    count = len(segments)
+    starts, ends, deltas, offsets, glyphs = [], [], [], [], []
+    for i, (start, end) in enumerate(segments):
+        starts.append(start)
+        ends.append(end)
+        deltas.append(rand.randrange(65536))
+        if i < count - 1 and i % 2 == 0:
+            offsets.append(2 * (count - i) + 2 * len(glyphs))
+            glyphs += [rand.randrange(1, 30000) for _ in range(end - start + 1)]
+        else:
+            offsets.append(0)
+    body = struct.pack('>%dH' % count, *ends) + bytes(2) + struct.pack('>%dH' % count, *starts)\
+        + struct.pack('>%dH' % count, *deltas) + struct.pack('>%dH' % count, *offsets)\
+        + struct.pack('>%dH' % len(glyphs), *glyphs)
+    return struct.pack('>7H', 4, 14 + len(body), 0, 2 * count, 0, 0, 0) + body
+
+
+def bench_cmap(num_blocks: int):
+    # 逐段查找（原来的做法）、二分查找与整表查找
+    cmap = Type4CmapTable(make_type4_cmap(3000))
+    rand = random.Random(0)
+    text = ''.join(chr(rand.randrange(0x4E00, 0xA000)) for _ in range(num_blocks))
+
+    def get_gid_linear(uid):
+        segment = 0
+        while segment < cmap.seg_count and cmap.end_code[segment] < uid:
+            segment += 1
+        return segment
+
+    elapsed_linear, _ = measure(lambda: [get_gid_linear(ord(char)) for char in text[:num_blocks // 20]], repeat=1)
+    elapsed_linear *= 20
+    elapsed_bisect, _ = measure(lambda: [cmap.get_gid(ord(char)) for char in text])
+    elapsed_build, _ = measure(cmap.gid_table, repeat=1)
+    elapsed_bulk, _ = measure(cmap.get_gids, text)
+    print('cmap: %d 段, %d 个字符, 逐段 %.3f 秒（估计）, 二分 %.3f 秒, 建表 %.3f 秒, 整表 %.4f 秒'
+          % (cmap.seg_count, len(text), elapsed_linear, elapsed_bisect, elapsed_build, elapsed_bulk))
+
+
+def make_type12_cmap(num_groups: int, seed: int = 0) -> bytes:
+    """
+    生成 12 型 cmap 子表，组数与思源黑体等泛 Unicode 字体相当。
+    """
+    rand = random.Random(seed)
+    points = sorted(rand.sample(range(0x20, 0x30000), 2 * num_groups))
+    groups = array('I')
+    for i in range(num_groups):
+        groups.extend((points[2 * i], points[2 * i + 1], rand.randrange(1, 65000)))
+    if sys.byteorder == 'little':
+        groups.byteswap()
+    return struct.pack('>HHIII', 12, 0, 16 + 12 * num_groups, 0, num_groups) + groups.tobytes()
+
+
+def bench_cmap12(num_blocks: int):
+    # 读入：逐组读三次（原来的做法）与一次读入；查找：逐个二分与成批查找
+    data = make_type12_cmap(40000)
+
+    def load_per_group():
+        in_file = io.BytesIO(data)
+        in_file.seek(12, 1)
+        num_group = struct.unpack('>I', in_file.read(4))[0]
+        start_code, end_code, start_gid = [], [], []
+        for i in range(num_group):
+            start_code.extend(struct.unpack('>I', in_file.read(4)))
+            end_code.extend(struct.unpack('>I', in_file.read(4)))
+            start_gid.extend(struct.unpack('>I', in_file.read(4)))
+
+    elapsed_old, _ = measure(load_per_group)
+    elapsed_new, cmap = measure(Type12CmapTable, data)
+    rand = random.Random(0)
+    text = ''.join(chr(rand.randrange(0x4E00, 0x6000)) for _ in range(num_blocks * 10))
+    elapsed_single, _ = measure(lambda: [cmap.get_gid(ord(char)) for char in text])
+    elapsed_bulk, _ = measure(cmap.get_gids, text)
+    print('cmap 12: %d 组, 逐组读入 %.3f 秒, 一次读入 %.4f 秒; %d 个字符, 逐个查找 %.3f 秒, 成批 %.3f 秒'
+          % (cmap.num_group, elapsed_old, elapsed_new, len(text), elapsed_single, elapsed_bulk))
+
+
+def make_font_file(filename: str, num_faces: int):
+    """
+    生成一个 TTC 字体文件，其中各字体共用同一组表（head、hhea、OS/2、hmtx、cmap），cmap 与中文字体大小相当。
+    """
+    cmap_subtable = make_type4_cmap(3000)
+    num_glyphs = 30000
+    tables = {
+        'OS/2': bytes(68) + struct.pack('>h', 880) + bytes(18) + struct.pack('>h', 700) + bytes(6),
+        'cmap': struct.pack('>HHHHI', 0, 1, 3, 1, 12) + cmap_subtable,
+        'head': bytes(18) + struct.pack('>H', 1000) + bytes(34),
+        'hhea': bytes(34) + struct.pack('>H', num_glyphs),
+        'hmtx': struct.pack('>%dH' % (2 * num_glyphs), *([500, 0] * num_glyphs)),
+    }
+    directory_size = 12 + 16 * len(tables)
+    header_size = 12 + 4 * num_faces
+    data_offset = header_size + directory_size * num_faces
+    records = b''
+    data = b''
+    for tag in sorted(tables):
+        records += struct.pack('>4sIII', tag.encode('latin-1'), 0, data_offset + len(data), len(tables[tag]))
+        data += tables[tag] + bytes(-len(tables[tag]) % 4)
+    directory = struct.pack('>IHHHH', 0x10000, len(tables), 0, 0, 0) + records
+    with open(filename, 'wb') as f:
+        f.write(b'ttcf' + struct.pack('>II', 0x10000, num_faces))
+        f.write(struct.pack('>%dI' % num_faces, *(header_size + directory_size * i for i in range(num_faces))))
+        f.write(directory * num_faces + data)
+
+
+def bench_font_startup(num_blocks: int):
+    # 只打开字体（各表在用到时才读）与打开后立即读入 cmap、hmtx 等（原来的做法）
+    num_faces = 16
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.ttc')
+        make_font_file(filename, num_faces)
+
+        def open_fonts():
+            return [Font(filename, i, True) for i in range(num_faces)]
+
+        def open_fonts_eager():
+            fonts = open_fonts()
+            for font in fonts:
+                font.cmap, font.upm, font.ascent, font.caps_height, font.hmtx
+            return fonts
+
+        elapsed_lazy, fonts = measure(open_fonts)
+        elapsed_eager, _ = measure(open_fonts_eager)
+        shared = len(set(id(font.mapping) for font in fonts))
+        print('字体: %d 个字体（共 %d 个文件映射）, 按需读取 %.4f 秒, 全部读入 %.3f 秒'
+              % (num_faces, shared, elapsed_lazy, elapsed_eager))
+        del fonts
+
+
+def bench_font_cache(num_blocks: int):
+    # 不用缓存（解析各表）、第一次用缓存（解析后写入缓存）与第二次起用缓存（只读缓存文件）的启动用时
+    num_faces = 16
+    text = make_document(num_blocks // 10)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.ttc')
+        make_font_file(filename, num_faces)
+
+        def start(cache):
+            fonts = [Font(filename, i, True, cache) for i in range(num_faces)]
+            for font in fonts:
+                font.get_gids(text[:1000]), font.upm, font.ascent, font.caps_height, font.hmtx
+            return fonts
+
+        elapsed_plain, _ = measure(lambda: start(None))
+        elapsed_cold, _ = measure(lambda: start(FontMetricsCache(tempfile.mkdtemp(dir=directory))))
+        cache_dir = os.path.join(directory, 'cache')
+        start(FontMetricsCache(cache_dir))
+        elapsed_warm, _ = measure(lambda: start(FontMetricsCache(cache_dir)))
+        print('字体缓存: %d 个字体, 不用缓存 %.3f 秒, 写入缓存 %.3f 秒, 读缓存 %.4f 秒'
+              % (num_faces, elapsed_plain, elapsed_cold, elapsed_warm))
+
+
+def bench_glyph_widths(num_blocks: int):
+    # 逐个字符查宽度与整段一次查出
+    text = ''.join(random.choice('abcdefghijklmnopqrstuvwxyz ,.') for _ in range(num_blocks * 100))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.ttc')
+        make_font_file(filename, 1)
+        font = Font(filename, 0, True)
+        elapsed_hmtx, _ = measure(font.read_hmtx)
+        gids = font.get_gids(text)
+        elapsed_single, _ = measure(lambda: [font.get_glyph_width(gid) for gid in gids])
+        elapsed_batch, _ = measure(font.get_glyph_widths, gids)
+        print('字形宽度: 读 hmtx %.4f 秒, %d 个字符, 逐个 %.3f 秒, 成批 %.3f 秒'
+              % (elapsed_hmtx, len(gids), elapsed_single, elapsed_batch))
+
+
+def make_gsub(num_firsts: int, num_ligatures: int) -> bytes:
+    """
+    生成一个 GSUB 表：DFLT 文种的 liga 特性，一个连字 lookup，以 GID 1～num_firsts 开头的各有 num_ligatures 个双字连字。
+    """
+    script_list = struct.pack('>H4sHHHHHHH', 1, b'DFLT', 8, 4, 0, 0, 0xFFFF, 1, 0)
+    feature_list = struct.pack('>H4sHHHH', 1, b'liga', 8, 0, 1, 0)
+    coverage = struct.pack('>HH%dH' % num_firsts, 1, num_firsts, *range(1, num_firsts + 1))
+    set_size = 2 + 8 * num_ligatures
+    ligature_set = struct.pack('>H%dH' % num_ligatures, num_ligatures,
+                               *(2 + 2 * num_ligatures + 6 * i for i in range(num_ligatures)))
+    subtable_header = 6 + 2 * num_firsts
+    subtable = struct.pack('>HHH%dH' % num_firsts, 1, subtable_header, num_firsts,
+                           *(subtable_header + len(coverage) + set_size * i for i in range(num_firsts))) + coverage
+    for first in range(1, num_firsts + 1):
+        subtable += ligature_set + b''.join(struct.pack('>HHH', 1000 + first * num_ligatures + second, 2, second)
+                                            for second in range(1, num_ligatures + 1))
+    lookup_list = struct.pack('>HHHHHH', 1, 4, 4, 0, 1, 8) + subtable
+    header_size = 10
+    return struct.pack('>IHHH', 0x10000, header_size, header_size + len(script_list),
+                       header_size + len(script_list) + len(feature_list)) + script_list + feature_list + lookup_list
+
+
+def bench_gsub(num_blocks: int):
+    # 编译 GSUB 与对长串字形做连字替换
+    data = make_gsub(200, 30)
+    elapsed_compile, lookups = measure(gsub.compile_gsub, data)
+    gids = [random.randint(1, 240) for _ in range(num_blocks * 100)]
+    elapsed_apply, result = measure(gsub.apply_lookups, lookups, gids)
+    print('GSUB: %d 个连字, 编译 %.4f 秒, %d 个字形替换后为 %d 个, %.3f 秒'
+          % (200 * 30, elapsed_compile, len(gids), len(result), elapsed_apply))
+
+
+def bench_kerning(num_blocks: int):
+    # 逐对查字偶距与整串一次查出（按类的字偶距，与常见西文字体规模相当）
+    num_glyphs = 1000
+    num_class1 = 60
+    num_class2 = 80
+    class1 = array('H', (random.randrange(num_class1 + 1) for _ in range(num_glyphs + 1)))
+    class2 = array('H', (random.randrange(num_class2) for _ in range(num_glyphs + 1)))
+    matrix = array('h', (random.randint(-100, 20) for _ in range(num_class1 * num_class2)))
+    matrix.extend(array('h', bytes(2 * num_class2)))
+    table = gpos.KerningTable([[gpos.ClassPairTable(class1, class2, matrix, num_class1, num_class2)]])
+    gids = array('H', (random.randrange(num_glyphs) for _ in range(num_blocks * 100)))
+    elapsed_single, _ = measure(lambda: [table.get_kern(first, second) for first, second in zip(gids, gids[1:])])
+    elapsed_batch, _ = measure(table.get_kerns, gids)
+    print('字偶距: %d 个字形, 逐对 %.3f 秒, 成批 %.4f 秒' % (len(gids), elapsed_single, elapsed_batch))
+
+
+def bench_shaping(num_blocks: int):
+    # 逐词排版与用缓存排版。词按齐夫分布从 2000 个词中选取，与歌词中西文词的重复程度相当
+    vocabulary = [''.join(random.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(random.randint(2, 9)))
+                  for _ in range(2000)]
+    weights = [1 / rank for rank in range(1, len(vocabulary) + 1)]
+    words = random.choices(vocabulary, weights, k=num_blocks * 20)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.ttc')
+        make_font_file(filename, 1)
+        font = Font(filename, 0, True)
+        elapsed_plain, _ = measure(lambda: [shaping.shape(font, 3.75, word) for word in words])
+        cache = shaping.ShapingCache()
+        elapsed_cached, _ = measure(lambda: [cache.shape(font, 3.75, word) for word in words], repeat=1)
+        print('排版: %d 个词, 逐词 %.3f 秒, 用缓存 %.3f 秒; %s' % (len(words), elapsed_plain, elapsed_cached, cache.report()))
+
+
+def bench_char_class(num_blocks: int):
+    # 逐字查字符的类与整段一次查出
+    text = make_document(num_blocks)
+    elapsed_plain, _ = measure(lambda: [token_process.CharClass.get_class(char) for char in text])
+    elapsed_bulk, _ = measure(token_process.classify, text)
+    print('字符分类: %d 个字符, 逐字 %.3f 秒, 整段 %.3f 秒' % (len(text), elapsed_plain, elapsed_bulk))
+
+
+def bench_glyph_run(num_blocks: int):
+    # 为每个字符建立 HBox（内含 Glyph）与存入 GlyphRun 的各数组：用时和所占内存
+    codes = list(map(ord, make_document(num_blocks)))
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'test.ttc')
+        make_font_file(filename, 1)
+        font = Font(filename, 0, False)
+        token_process.set_chinese_font(font)
+        token_process.set_western_font(font)
+        token_process.set_font_size(3.75)
+
+        def build_objects():
+            return [token_process.HBox(token_process.HorElementType.GLYPH, code) for code in codes]
+
+        def build_run():
+            run = token_process.GlyphRun()
+            for code in codes:
+                run.append_char(code)
+            return run
+
+        elapsed_objects, _ = measure(build_objects)
+        elapsed_run, _ = measure(build_run)
+        sizes = []
+        for build in (build_objects, build_run):
+            gc.collect()
+            tracemalloc.start()
+            result = build()
+            sizes.append(tracemalloc.get_traced_memory()[0])
+            tracemalloc.stop()
+            del result
+        print('水平列表: %d 个字符, HBox %.3f 秒 %.2f MB, GlyphRun %.3f 秒 %.2f MB'
+              % (len(codes), elapsed_objects, sizes[0] / 2 ** 20, elapsed_run, sizes[1] / 2 ** 20))
+
+
+def bench_font_resolution(num_blocks: int):
+    # 用 fontconfig 查找字体（要初始化 fontconfig）与从字体名缓存中查找
+    names = ['serif', 'sans-serif', 'monospace']
+    with tempfile.TemporaryDirectory() as directory:
+        try:
+            elapsed_plain, _ = measure(lambda: FontconfigResolver().resolve(names))
+        except OSError:
+            print('字体名缓存: 没有 fontconfig，跳过')
+            return
+        name_cache = FontNameCache(directory)
+        library = FontLibrary(names[0], names[1], name_cache=name_cache)
+        library.resolve_fonts(names)
+        elapsed_cached, _ = measure(lambda: FontLibrary(names[0], names[1], name_cache=FontNameCache(directory))
+                                    .resolve_fonts(names))
+        print('字体名缓存: %d 个字体, fontconfig %.3f 秒, 读缓存 %.4f 秒'
+              % (len(names), elapsed_plain, elapsed_cached))
+
+
+def bench_incremental(num_blocks: int):
+    # 在文档中间逐字输入，比较增量分析与每次全部重新分析的用时
+    content = make_document(num_blocks)
+    document = Document(content)
+    offset = content.index('歌词中 {\n', len(content) // 2) + len('歌词中 {\n')
+    typed = '我是笨蛋'
+    begin = time.perf_counter()
+    for i, char in enumerate(typed):
+        document.edit(offset + i, 0, char)
+    elapsed_incremental = (time.perf_counter() - begin) / len(typed)
+    elapsed_full, _ = measure(lambda: parse(tokenize(document.text), document.text), repeat=1)
+    print('增量分析: %d 块, 每次修改 %.4f 秒, 全部重新分析 %.3f 秒'
+          % (num_blocks, elapsed_incremental, elapsed_full))
+
+
+if __name__ == '__main__':
+    blocks = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    bench_tokenize(blocks)
+    bench_parse(blocks)
+    bench_parse_parallel(blocks)
+    bench_predict_table(blocks)
+    bench_tree_memory(blocks)
+    bench_jianpu(blocks)
+    bench_staff(blocks)
+    bench_lyric(blocks)
+    bench_timeline(blocks)
+    bench_lyric_alignment(blocks)
+    bench_cmap(blocks)
+    bench_cmap12(blocks)
+    bench_font_startup(blocks)
+    bench_font_cache(blocks)
+    bench_font_resolution(blocks)
+    bench_glyph_widths(blocks)
+    bench_gsub(blocks)
+    bench_kerning(blocks)
+    bench_shaping(blocks)
+    bench_char_class(blocks)
+    bench_glyph_run(blocks)
+    bench_incremental(blocks)
@@ -1,13 +1,42 @@
+import codecs
+import io
+import mmap
+from typing import Iterator
+
+
+# 全半角问题：全角空格删去，全角 ASCII 字符换成半角。全角波浪线不换成半角，而是换成波浪号。
+NORMALIZE_TABLE = {0x3000: None, ord('·'): '・', **{i - 32 + 0xFF00: chr(i) for i in range(33, 128)}}
+NORMALIZE_TABLE[ord('～')] = '〜'
+
+# 默认每段读入的字节数
+CHUNK_SIZE = 1 << 20
+
+
 def normalize(string):
-    # 全半角问题
-    string = string.replace('　', '').replace('·', '・').replace('～', '〜')
-    for i in range(33, 128):
-        string = string.replace(chr(i - 32 + 0xFF00), chr(i))
-    return string
+    return string.translate(NORMALIZE_TABLE)
+
+
+def read_chunks(filename, chunk_size=CHUNK_SIZE, encoding='utf-8') -> Iterator[str]:
+    """
+    以内存映射的方式分段读取文件，逐段解码并规范化。行尾统一为 LF。
+    分段处可能落在词、字符串或注释中间，由 `tokenizer.tokenize_stream` 负责接续。
+    :param filename: 文件名
+    :param chunk_size: 每段的字节数
+    :param encoding: 文件编码
+    :return: 逐段生成规范化后的文本
+    """
+    # 与文本模式的 open 一样把 CRLF 和单独的 CR 换成 LF，段尾的 CR 会留到下一段再判断
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    with open(filename, 'rb') as f:
+        size = f.seek(0, 2)
+        if size == 0:  # 空文件不能映射
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            for start in range(0, size, chunk_size):
+                chunk = decoder.decode(mapped[start:start + chunk_size], start + chunk_size >= size)
+                if chunk:
+                    yield chunk.translate(NORMALIZE_TABLE)
 
 
 def read_file(filename):
-    f = open(filename, 'r')
-    file_str = f.read()
-    f.close()
-    return normalize(file_str)
+    return ''.join(read_chunks(filename))
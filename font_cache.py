@@ -0,0 +1,341 @@
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from font_library import Type4CmapTable, Type12CmapTable
+from gsub import CompiledLookup
+from parse_cache import ParseCache, default_cache_dir
+
+
+# 缓存文件的格式。改动格式时要改版本号，旧的缓存文件自动作废
+MAGIC = b'VMTF'
+FORMAT_VERSION = 4
+# 文件头：标记、版本号、cmap 类型、UPM、ascent、大写字母高度、是否 CID、是否有 hmtx、
+# cmap 数组的长度、前进宽度的个数、左侧空白的个数、TTC 中的序号、字体文件的大小、修改时间（纳秒）、路径的长度。
+# 文件头之后依次为：字体文件的路径（UTF-8，补齐到 4 字节）、cmap 数组、前进宽度、左侧空白、GSUB，均为本机字节序。
+# GSUB 部分先是目录：lookup 的个数，各 lookup 的类型和 5 个数组的长度；之后是各 lookup 的数组（见 gsub.CompiledLookup），
+# 每个数组补齐到 4 字节
+_HEADER = struct.Struct('=4sHHHhhBBIIIIQqI')
+# CompiledLookup 各数组的类型
+_LOOKUP_TYPECODES = ('H', 'I', 'H', 'I', 'H')
+
+
+class FontMetrics:
+    """
+    从缓存文件读出的字体度量。各数组是文件映射上的 memoryview，不复制，也不需要再解析字体中的表。
+    """
+    __slots__ = ('mapping', 'upm', 'ascent', 'caps_height', 'is_cid', 'cmap', 'widths', 'left_side_bearings', 'gsub')
+
+    def __init__(self, mapping, upm, ascent, caps_height, is_cid, cmap, widths, left_side_bearings, gsub):
+        self.mapping = mapping
+        self.upm = upm
+        self.ascent = ascent
+        self.caps_height = caps_height
+        self.is_cid = is_cid
+        self.cmap = cmap  # Type4CmapTable 或 Type12CmapTable
+        self.widths = widths  # 各字形的前进宽度；CID 字体为 None
+        self.left_side_bearings = left_side_bearings  # 各字形的左侧空白；CID 字体为 None
+        self.gsub = gsub  # 编译好的 GSUB lookup 组成的列表
+
+
+class FontMetricsCache:
+    """
+    字体度量的磁盘缓存。每个字体（TTC 中的每个序号）存为一个文件，键由字体的路径、序号、文件大小和修改时间算出，
+    字体文件改动后自然找不到旧的缓存。旧的缓存文件用 `prune` 清理（命令行：python font_cache.py prune）。
+    """
+    SUFFIX = '.metrics'
+
+    def __init__(self, directory: str = None):
+        """
+        :param directory: 缓存目录，默认为 ~/.cache/vmt-prototype/fonts
+        """
+        self.directory = directory or default_cache_dir('fonts')
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(font_dir: str, index: int, stat: os.stat_result) -> str:
+        return ParseCache.make_key(FORMAT_VERSION, os.path.abspath(font_dir), index, stat.st_size, stat.st_mtime_ns)
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, font_dir: str, index: int):
+        """
+        读取缓存。
+        :return: FontMetrics；没有缓存、缓存已失效或文件损坏时返回 None。
+        """
+        try:
+            path = self.__path(self.make_key(font_dir, index, os.stat(font_dir)))
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):  # 没有缓存（空文件也无法映射）
+            self.misses += 1
+            return None
+        metrics = read_metrics(mapping)
+        if metrics is None:
+            mapping.close()
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.misses += 1
+            return None
+        self.hits += 1
+        return metrics
+
+    def put(self, font, index: int):
+        """
+        解析字体中的各表，写入缓存。
+        :param font: font_library.Font 对象（不使用缓存打开的）
+        :param index: 字体在 TTC 中的序号
+        :return: 刚写入的 FontMetrics；无法写入时返回 None，字体照常不用缓存打开。
+        """
+        stat = os.stat(font.font_dir)
+        try:
+            content = encode_metrics(font, index, stat)
+        except (struct.error, KeyError, ValueError) as e:  # 缺表或表不完整：这个字体不缓存，用到时再解析
+            print('无法缓存字体 %s 的度量：%r' % (font.font_dir, e), file=sys.stderr)
+            return None
+        path = self.__path(self.make_key(font.font_dir, index, stat))
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(content)
+            os.replace(temp_path, path)
+            with open(path, 'rb') as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except OSError as e:
+            print('无法写入字体缓存：%s' % e, file=sys.stderr)
+            return None
+        return read_metrics(mapping)
+
+    def prune(self) -> int:
+        """
+        删除已失效的缓存文件：字体文件已不存在或已改动，或缓存文件的格式不对。
+        :return: 删除的文件数
+        """
+        removed = 0
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            if entry.name.endswith('.tmp'):  # 写到一半的文件
+                stale = True
+            elif not entry.name.endswith(self.SUFFIX):
+                continue
+            else:
+                stale = not self.__is_valid(entry.path, entry.name[:-len(self.SUFFIX)])
+            if stale:
+                try:
+                    os.remove(entry.path)
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
+
+    def __is_valid(self, path: str, key: str) -> bool:
+        try:
+            with open(path, 'rb') as f:
+                header = f.read(_HEADER.size)
+                magic, version, _, _, _, _, _, _, _, _, _, index, _, _, path_length = _HEADER.unpack(header)
+                if magic != MAGIC or version != FORMAT_VERSION:
+                    return False
+                font_dir = f.read(path_length).decode()
+            return self.make_key(font_dir, index, os.stat(font_dir)) == key
+        except (OSError, struct.error, UnicodeDecodeError):
+            return False
+
+    def report(self) -> str:
+        return '字体缓存：命中 %d 次，未命中 %d 次' % (self.hits, self.misses)
+
+
+class FontNameCache:
+    """
+    字体名 -> 字体文件的磁盘缓存，省去初始化 fontconfig 和逐个查找。存为一个 JSON 文件，
+    每一项连同当时字体文件的大小和修改时间一起记录，字体文件已不存在或已改动时作废，重新查找。
+    """
+    FILENAME = 'names.json'
+
+    def __init__(self, directory: str = None):
+        """
+        :param directory: 缓存目录，默认为 ~/.cache/vmt-prototype/fonts
+        """
+        self.directory = directory or default_cache_dir('fonts')
+        os.makedirs(self.directory, exist_ok=True)
+        self.path = os.path.join(self.directory, self.FILENAME)
+        self.dirty = False
+
+        self.hits = 0
+        self.misses = 0
+
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self.entries = json.load(f)  # 字体名 -> [路径, 序号, 文件大小, 修改时间（纳秒）]
+            if not isinstance(self.entries, dict):
+                self.entries = {}
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def __is_valid(entry) -> bool:
+        try:
+            font_dir, _, size, mtime = entry
+            stat = os.stat(font_dir)
+        except (OSError, TypeError, ValueError):
+            return False
+        return stat.st_size == size and stat.st_mtime_ns == mtime
+
+    def get(self, font_name: str):
+        """
+        :return: (字体文件的路径, TTC 中的序号)；没有缓存或已失效时返回 None。
+        """
+        entry = self.entries.get(font_name)
+        if entry is None or not self.__is_valid(entry):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry[0], entry[1]
+
+    def put(self, font_name: str, font_dir: str, index: int):
+        try:
+            stat = os.stat(font_dir)
+        except OSError:
+            return
+        self.entries[font_name] = [font_dir, index, stat.st_size, stat.st_mtime_ns]
+        self.dirty = True
+
+    def save(self):
+        """
+        有改动时写回缓存文件。
+        """
+        if not self.dirty:
+            return
+        temp_path = '%s.%d.tmp' % (self.path, os.getpid())
+        try:
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.entries, f, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+        except OSError as e:
+            print('无法写入字体缓存：%s' % e, file=sys.stderr)
+            return
+        self.dirty = False
+
+    def prune(self) -> int:
+        """
+        删除已失效的项。
+        :return: 删除的项数
+        """
+        stale = [font_name for font_name, entry in self.entries.items() if not self.__is_valid(entry)]
+        for font_name in stale:
+            del self.entries[font_name]
+        if len(stale) > 0:
+            self.dirty = True
+            self.save()
+        return len(stale)
+
+
+def encode_metrics(font, index: int, stat: os.stat_result) -> bytes:
+    """
+    把字体的度量编码成缓存文件的内容。4 型 cmap 存 0～65535 各编码值的 GID 表，12 型存各组的数组；
+    GSUB 存编译好的各 lookup。
+    """
+    cmap = font.cmap
+    if isinstance(cmap, Type4CmapTable):
+        cmap_type = 4
+        cmap_arrays = [cmap.gid_table()]
+        cmap_length = 65536
+    else:
+        cmap_type = 12
+        cmap_arrays = [array('I', cmap.start_code), array('I', cmap.end_code), array('I', cmap.start_gid)]
+        cmap_length = cmap.num_group
+    widths, left_side_bearings = (array('H'), array('h')) if font.is_cid else font.read_hmtx()
+
+    font_dir = os.path.abspath(font.font_dir).encode()
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, cmap_type, font.upm, font.ascent, font.caps_height, font.is_cid,
+                          not font.is_cid, cmap_length, len(widths), len(left_side_bearings), index,
+                          stat.st_size, stat.st_mtime_ns, len(font_dir)),
+             font_dir, bytes(-len(font_dir) % 4)]
+    parts.extend(item.tobytes() for item in cmap_arrays)
+    parts.append(widths.tobytes())
+    parts.append(left_side_bearings.tobytes())
+    parts.append(bytes(-2 * (len(widths) + len(left_side_bearings)) % 4))
+
+    directory = array('I', [len(font.gsub)])
+    for lookup in font.gsub:
+        directory.append(lookup.kind)
+        directory.extend(map(len, lookup.arrays()))
+    parts.append(directory.tobytes())
+    for lookup in font.gsub:
+        for item in lookup.arrays():
+            data = item.tobytes()
+            parts.append(data)
+            parts.append(bytes(-len(data) % 4))
+    return b''.join(parts)
+
+
+def read_metrics(mapping):
+    """
+    从映射到内存的缓存文件中读出字体度量。
+    :return: FontMetrics；文件格式不对时返回 None。
+    """
+    if len(mapping) < _HEADER.size:
+        return None
+    magic, version, cmap_type, upm, ascent, caps_height, is_cid, has_hmtx, cmap_length, num_widths, num_bearings,\
+        _, _, _, path_length = _HEADER.unpack_from(mapping)
+    if magic != MAGIC or version != FORMAT_VERSION:
+        return None
+    pos = _HEADER.size + path_length + (-path_length % 4)
+    cmap_size = 2 * cmap_length if cmap_type == 4 else 12 * cmap_length
+    directory_pos = pos + cmap_size + 2 * (num_widths + num_bearings) + (-2 * (num_widths + num_bearings) % 4)
+    if len(mapping) < directory_pos + 4:
+        return None
+
+    data = memoryview(mapping)
+    if cmap_type == 4:
+        cmap = Type4CmapTable.from_gid_table(data[pos:pos + cmap_size].cast('H'))
+    else:
+        groups = data[pos:pos + cmap_size].cast('I')
+        cmap = Type12CmapTable.from_groups(groups[0:cmap_length], groups[cmap_length:2 * cmap_length],
+                                           groups[2 * cmap_length:])
+    pos += cmap_size
+    widths = left_side_bearings = None
+    if has_hmtx:
+        widths = data[pos:pos + 2 * num_widths].cast('H')
+        pos += 2 * num_widths
+        left_side_bearings = data[pos:pos + 2 * num_bearings].cast('h')
+
+    pos = directory_pos
+    num_lookups = data[pos:pos + 4].cast('I')[0]
+    pos += 4
+    if len(mapping) < pos + 24 * num_lookups:
+        return None
+    directory = data[pos:pos + 24 * num_lookups].cast('I')
+    pos += 24 * num_lookups
+    gsub = []
+    for i in range(num_lookups):
+        arrays = []
+        for typecode, length in zip(_LOOKUP_TYPECODES, directory[6 * i + 1:6 * i + 6]):
+            size = length * (2 if typecode == 'H' else 4)
+            if len(mapping) < pos + size:
+                return None
+            arrays.append(data[pos:pos + size].cast(typecode))
+            pos += size + (-size % 4)
+        gsub.append(CompiledLookup(directory[6 * i], *arrays))
+    if pos != len(mapping):
+        return None
+    return FontMetrics(mapping, upm, ascent, caps_height, bool(is_cid), cmap, widths, left_side_bearings, gsub)
+
+
+if __name__ == '__main__':
+    # python font_cache.py prune [缓存目录]：清理已失效的缓存文件
+    if len(sys.argv) < 2 or sys.argv[1] != 'prune':
+        print('用法：python font_cache.py prune [缓存目录]', file=sys.stderr)
+        exit(1)
+    directory = sys.argv[2] if len(sys.argv) > 2 else None
+    print('删除了 %d 个失效的缓存文件' % FontMetricsCache(directory).prune())
+    print('删除了 %d 个失效的字体名' % FontNameCache(directory).prune())
@@ -1,38 +1,89 @@
+import mmap
 import sys
+import weakref
+from array import array
+from bisect import bisect_left
 from ctypes import *
-from struct import unpack
+from functools import cached_property
+from itertools import repeat
+from operator import and_, truediv
+from struct import unpack, unpack_from
+
+from gpos import KerningTable, compile_gpos
+from gsub import apply_lookups, compile_gsub
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 与本机字节序相同的 UTF-32，编码后可直接作为 array('I') 使用
+UTF32 = 'utf-32-le' if sys.byteorder == 'little' else 'utf-32-be'
+
+# 已映射到内存的字体文件：路径 -> mmap。同一 TTC 中的各字体共用一个映射，不再使用时自动解除
+_mapped_files = weakref.WeakValueDictionary()
+
+
+def map_font_file(font_dir):
+    """
+    以只读方式把字体文件映射到内存。各进程映射同一文件时共用物理内存。
+    :param font_dir: 字体文件的路径
+    :return: mmap 对象
+    """
+    mapping = _mapped_files.get(font_dir)
+    if mapping is None:
+        with open(font_dir, 'rb') as font_file:
+            mapping = mmap.mmap(font_file.fileno(), 0, access=mmap.ACCESS_READ)
+        _mapped_files[font_dir] = mapping
+    return mapping
 
 
 class Type4CmapTable:
     """
     4 型 cmap 表。
+    各段按 end_code 升序排列，查找时二分。需要成批查找时，可以把 0～65535 的全部 GID 一次算好存成一张表（见 gid_table）。
     """
-    def __init__(self, in_file):
-        in_file.seek(2, 1)
-        length, double_seg_count = unpack('>HH', in_file.read(4))
-        in_file.seek(6, 1)
+    def __init__(self, data):
+        """
+        :param data: 子表的内容（bytes 或 memoryview），从格式号开始
+        """
+        length, _, double_seg_count = unpack_from('>HHH', data, 2)
         length -= 4 * double_seg_count + 16
 
         self.seg_count = double_seg_count // 2
 
-        self.end_code = unpack('>' + 'H' * self.seg_count, in_file.read(double_seg_count))
-        in_file.seek(2, 1)
-        self.start_code = unpack('>' + 'H' * self.seg_count, in_file.read(double_seg_count))
-        self.id_delta = unpack('>' + 'H' * self.seg_count, in_file.read(double_seg_count))
-        self.id_range_offset = unpack('>' + 'H' * self.seg_count, in_file.read(double_seg_count))
+        segments = '>' + 'H' * self.seg_count
+        self.end_code = unpack_from(segments, data, 14)
+        self.start_code = unpack_from(segments, data, 16 + double_seg_count)
+        self.id_delta = unpack_from(segments, data, 16 + 2 * double_seg_count)
+        self.id_range_offset = unpack_from(segments, data, 16 + 3 * double_seg_count)
 
         if length > 0:
-            self.glyph_id_array = unpack('>' + 'H' * (length // 2), in_file.read(length))
+            self.glyph_id_array = unpack_from('>' + 'H' * (length // 2), data, 16 + 4 * double_seg_count)
         else:
             self.glyph_id_array = []
 
+        self.__gid_table = None
+
+    @classmethod
+    def from_gid_table(cls, table):
+        """
+        由算好的 GID 表（见 gid_table，如从缓存中读出的）生成，不需要原来的子表。
+        :param table: 0～65535 各编码值的 GID，可以是 array 或 memoryview
+        """
+        self = cls.__new__(cls)
+        self.seg_count = 0
+        self.end_code = self.start_code = self.id_delta = self.id_range_offset = ()
+        self.glyph_id_array = []
+        self.__gid_table = table
+        return self
+
     def get_gid(self, uid):
-        current_segment = 0
-        while current_segment < self.seg_count:
-            if self.end_code[current_segment] > uid:
-                break
-            current_segment += 1
+        if self.__gid_table is not None:
+            return self.__gid_table[uid] if 0 <= uid < 65536 else 0
 
+        current_segment = bisect_left(self.end_code, uid)  # 第一个 end_code >= uid 的段
         if current_segment == self.seg_count or self.start_code[current_segment] > uid:  # UID 不存在
             return 0
 
@@ -40,83 +91,156 @@ class Type4CmapTable:
             gid = uid + self.id_delta[current_segment]
         else:
             index = uid - self.start_code[current_segment]
-            index += self.id_range_offset[current_segment] / 2 + current_segment - self.seg_count
-            gid = self.glyph_id_array[index] + self.id_delta[current_segment]
+            index += self.id_range_offset[current_segment] // 2 + current_segment - self.seg_count
+            if index >= len(self.glyph_id_array):
+                return 0
+            gid = self.glyph_id_array[index]
+            if gid == 0:  # 没有字形时不加 id_delta
+                return 0
+            gid += self.id_delta[current_segment]
 
         return gid % 65536
 
+    def gid_table(self) -> array:
+        """
+        0～65535 各编码值的 GID。第一次调用时按段整段算出，以后直接使用，get_gid 也改为查这张表。
+        """
+        if self.__gid_table is not None:
+            return self.__gid_table
+        table = array('H', bytes(2 * 65536))
+        glyph_id_array = self.glyph_id_array
+        for segment in range(self.seg_count):
+            start = self.start_code[segment]
+            end = self.end_code[segment] + 1
+            if start >= end:
+                continue
+            delta = self.id_delta[segment]
+            offset = self.id_range_offset[segment]
+            if offset == 0:
+                table[start:end] = array('H', map(and_, range(start + delta, end + delta), repeat(0xFFFF)))
+            else:
+                first = offset // 2 + segment - self.seg_count
+                gids = glyph_id_array[first:first + end - start]
+                gids = [(gid + delta) & 0xFFFF if gid != 0 else 0 for gid in gids]
+                table[start:start + len(gids)] = array('H', gids)
+        self.__gid_table = table
+        return table
+
+    def get_gids(self, codepoints) -> array:
+        """
+        成批查找 GID。
+        :param codepoints: 字符串，或 Unicode 编码值组成的序列
+        :return: 相应的 GID
+        """
+        if isinstance(codepoints, str):
+            codepoints = array('I', codepoints.encode(UTF32))
+        table = self.gid_table()
+        if len(codepoints) > 0 and max(codepoints) >= 65536:  # 4 型表只有基本多文种平面的字符
+            return array('H', [table[uid] if uid < 65536 else 0 for uid in codepoints])
+        return array('H', map(table.__getitem__, codepoints))
+
 
 class Type12CmapTable:
     """
-    12 型 cmap 表。
+    12 型 cmap 表。各组的起止编码值和起始 GID 一次读入，存成数组；查找时二分。
     """
-    def __init__(self, in_file):
-        in_file.seek(12, 1)
-        self.num_group = unpack('>I', in_file.read(4))[0]
-        self.start_code = []
-        self.end_code = []
-        self.start_gid = []
-
-        for i in range(self.num_group):
-            self.start_code.extend(unpack('>I', in_file.read(4)))
-            self.end_code.extend(unpack('>I', in_file.read(4)))
-            self.start_gid.extend(unpack('>I', in_file.read(4)))
+    def __init__(self, data):
+        """
+        :param data: 子表的内容（bytes 或 memoryview），从格式号开始
+        """
+        self.num_group = unpack_from('>I', data, 12)[0]
+
+        groups = array('I')  # 每组依次为起始编码值、结束编码值、起始 GID
+        groups.frombytes(data[16:16 + 12 * self.num_group])
+        if sys.byteorder == 'little':
+            groups.byteswap()
+        self.start_code = groups[0::3]
+        self.end_code = groups[1::3]
+        self.start_gid = groups[2::3]
+
+    @classmethod
+    def from_groups(cls, start_code, end_code, start_gid):
+        """
+        由各组的数组（如从缓存中读出的）生成，不需要原来的子表。
+        """
+        self = cls.__new__(cls)
+        self.num_group = len(start_code)
+        self.start_code = start_code
+        self.end_code = end_code
+        self.start_gid = start_gid
+        return self
 
     def get_gid(self, uid):
-        current_segment = 0
-        while current_segment < self.num_group:
-            if self.end_code[current_segment] >= uid:
-                break
-            current_segment += 1
-
+        current_segment = bisect_left(self.end_code, uid)  # 第一个 end_code >= uid 的组
         if current_segment == self.num_group or self.start_code[current_segment] > uid:  # UID 不存在
             return 0
 
         return uid - self.start_code[current_segment] + self.start_gid[current_segment]
 
+    def get_gids(self, codepoints) -> array:
+        """
+        成批查找 GID。一段文字中重复的字很多，每个不同的字只查一次。
+        :param codepoints: 字符串，或 Unicode 编码值组成的序列
+        :return: 相应的 GID
+        """
+        if isinstance(codepoints, str):
+            codepoints = array('I', codepoints.encode(UTF32))
+        unique = set(codepoints)
+        gids = dict(zip(unique, map(self.get_gid, unique)))
+        return array('H', map(gids.__getitem__, codepoints))
+
 
 class Font:
     """
     表示字体的对象。因为 FontConfig 功能不足，不得不自己写。
-    tables是一个字典，记录了字体中所有表的位置和长度。
+    字体文件映射到内存，tables是一个字典，记录了字体中所有表的位置和长度；各表用 `table` 取出（不复制），
+    cmap、hmtx 等在第一次用到时才读取；给出度量缓存时直接从缓存中取，缓存中没有的先解析一遍再写入缓存。
     可以自己加入用于读取GSUB、GPOS、cmap、hmtx等表的数据结构。
     """
 
-    def __init__(self, font_dir, index, is_western):
+    def __init__(self, font_dir, index, is_western, metrics_cache=None):
         """
-        从目录生成字体（待完成）。
+        从目录生成字体。
         :param font_dir: 字体所在的目录。
         :param index: 如果字体是 ttc，则表示所用字体的序号；否则无意义。
         :param is_western: 字体是否是西文字体。
+        :param metrics_cache: 字体度量的磁盘缓存（见 `font_cache.FontMetricsCache`），为 None 时不用缓存
         """
-        self.font_file = open(font_dir, 'rb')
-        self.tables = {}
-        tag = self.font_file.read(4)
-        if tag == b'ttcf':
-            self.font_file.seek(8, 0)
-            num_fonts = unpack('>I', self.font_file.read(4))[0]
+        self.font_dir = font_dir
+        self.is_western = is_western
+        self.mapping = map_font_file(font_dir)
+        self.data = memoryview(self.mapping)
+        self.tables = {}  # 表名 -> (位置, 长度)
+        table_offset = 0
+        if self.data[:4] == b'ttcf':
+            num_fonts = unpack_from('>I', self.data, 8)[0]
             if num_fonts <= index:  # index超出了，强制置0
                 print('要求 {} 号字体，但 TTC 内只有 {} 笔数据'.format(index, num_fonts), file=sys.stderr)
                 index = 0
-            self.font_file.seek(index * 4, 1)
-            table_offset = unpack('>I', self.font_file.read(4))[0]
-            self.font_file.seek(table_offset + 4, 0)
-        num_tables = unpack('>HHL', self.font_file.read(8))[0]
+            table_offset = unpack_from('>I', self.data, 12 + index * 4)[0]
+        num_tables = unpack_from('>H', self.data, table_offset + 4)[0]
         for i in range(num_tables):
-            cur_table_raw = self.font_file.read(16)
-            offset = unpack('>I', cur_table_raw[8:12])[0]
-            self.tables[cur_table_raw[:4].decode()] = offset
-        self.is_cid = self.__is_cid()
-
-        self.__init_cmap_table()
-        self.upm, self.ascent, self.caps_height = self.__get_typo_data()
-        self.hmtx = self.__get_hmtx(is_western)  # 读取 hmtx 表
-
-    def __del__(self):
+            tag, _, offset, length = unpack_from('>4sIII', self.data, table_offset + 12 + i * 16)
+            self.tables[tag.decode('latin-1')] = (offset, length)
+
+        if metrics_cache is not None:
+            metrics = metrics_cache.get(font_dir, index) or metrics_cache.put(self, index)
+            if metrics is not None:  # 直接填入各 cached_property 的值，不再解析各表
+                self.__dict__.update(is_cid=metrics.is_cid, cmap=metrics.cmap, upm=metrics.upm,
+                                     ascent=metrics.ascent, caps_height=metrics.caps_height,
+                                     hmtx=metrics.widths if is_western and not metrics.is_cid else None,
+                                     left_side_bearings=metrics.left_side_bearings
+                                     if is_western and not metrics.is_cid else None,
+                                     gsub=metrics.gsub)
+
+    def table(self, tag):
         """
-        析构字体。因为 Python 对象会自动析构，所以只用关闭字体文件。
+        取出字体中的一个表。
+        :param tag: 表名，如 'cmap'
+        :return: 表的内容（memoryview，不复制）
         """
-        self.font_file.close()
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
 
     def get_gid(self, uid):
         """
@@ -126,6 +250,14 @@ class Font:
         """
         return self.cmap.get_gid(uid)
 
+    def get_gids(self, codepoints):
+        """
+        成批得出 GID/CID。
+        :param codepoints: 字符串，或 Unicode 编码值组成的序列
+        :return: 相应的 GID/CID 组成的数组。
+        """
+        return self.cmap.get_gids(codepoints)
+
     def get_glyph_width(self, gid):
         """
         计算某个字符的宽度，以 em 为单位。
@@ -135,77 +267,111 @@ class Font:
         if self.is_cid:  # 懒得读 CFF，暂时禁止用 CID 字体生成西文
             print('禁止用 CID 字体充当西文字体！', file=sys.stderr)
             return 1.0
-        if gid > len(self.hmtx):
+        if gid >= len(self.hmtx):  # hmtx 之后的字形与最后一项同宽
             width = self.hmtx[-1]
         else:
             width = self.hmtx[gid]
         return width / self.upm
 
+    def get_glyph_widths(self, gids):
+        """
+        成批计算字符宽度，以 em 为单位。
+        :param gids: 字符序号组成的序列（如 `get_gids` 的结果）
+        :return: 各字符的宽度，有 NumPy 时为 NumPy 数组，否则为 array('d')。
+        """
+        if self.is_cid:
+            print('禁止用 CID 字体充当西文字体！', file=sys.stderr)
+            return numpy.ones(len(gids)) if numpy is not None else array('d', repeat(1.0, len(gids)))
+        last = len(self.hmtx) - 1
+        if numpy is not None:
+            advances = numpy.frombuffer(self.hmtx, dtype=numpy.uint16)
+            return advances[numpy.minimum(numpy.asarray(gids, dtype=numpy.intp), last)] / self.upm
+        if len(gids) > 0 and max(gids) > last:  # hmtx 之后的字形与最后一项同宽
+            gids = map(min, gids, repeat(last))
+        return array('d', map(self.em_widths.__getitem__, gids))
+
+    @cached_property
+    def em_widths(self):
+        """
+        以 em 为单位的各字形前进宽度，供 `get_glyph_widths` 查表。
+        """
+        return array('d', map(truediv, self.hmtx, repeat(self.upm)))
+
     def process_gsub_liga(self, list_gids):
         """
-        对一连串字符自动做连字处理。（待完成）
+        对一连串字符做 GSUB 替换（ccmp、liga 特性中的单字替换、多字替换和连字）。
         :param list_gids: 一个整型列表，解析为 GID。
+        :return: 替换后的 GID 组成的列表，长度可能与原来不同。
         """
-        pass
+        return apply_lookups(self.gsub, list_gids)
 
     def get_kern(self, gid1, gid2):
         """
-        计算任意两个字符间的 kerning 值。（待完成）
+        计算任意两个字符间的 kerning 值（GPOS 中 kern 特性的字偶距调整）。
         :param gid1: 左侧字符
         :param gid2: 右侧字符
         :return: kerning值，以 em 表示。
         """
-        return 0
+        return self.gpos.get_kern(gid1, gid2) / self.upm
+
+    def get_kerns(self, gids):
+        """
+        成批计算一串字符中各相邻两个字符间的 kerning 值。
+        :param gids: 字符序号组成的序列
+        :return: 以 em 表示的 kerning 值，长度比 gids 少 1；有 NumPy 时为 NumPy 数组，否则为 array('d')。
+        """
+        kerns = self.gpos.get_kerns(gids)
+        if numpy is not None:
+            return kerns / self.upm
+        return array('d', map(truediv, kerns, repeat(self.upm)))
 
-    def __is_cid(self):
+    @cached_property
+    def is_cid(self):
         """
         知道某个字体是不是 CID-keyed 的。
         :return: 布尔值，True 表示 CID-keyed，False 表示 name-keyed 或 ttf。
         """
         if 'CFF ' not in self.tables.keys():  # ttf
             return False
-        cff_offset = self.tables['CFF ']
+        cff = self.table('CFF ')
 
-        self.font_file.seek(cff_offset + 2, 0)
-        header_size = unpack('B', self.font_file.read(1))[0]
-        self.font_file.seek(header_size + 1, 1)
+        header_size = cff[2]
+        pos = header_size + 4
 
         # 读取CFF字体名。OTF用的CFF子集中，Name Index只能包括一个名字，且一定是256字节以内，因此前四个字节一定是00010101
-        name_length = unpack('B', self.font_file.read(1))[0] - 1
+        name_length = cff[pos] - 1
+        pos += 1
 
         # 确定是不是 CID 字体
-        self.font_file.seek(name_length + 2, 1)
-        index_int_size = unpack('B', self.font_file.read(1))[0]  # 偏移量长度
-        self.font_file.seek(index_int_size * 2, 1)
+        pos += name_length + 2
+        index_int_size = cff[pos]  # 偏移量长度
+        pos += 1 + index_int_size * 2
         while True:
-            cur = unpack('B', self.font_file.read(1))[0]
+            cur = cff[pos]
+            pos += 1
             if 32 <= cur <= 246:  # 单字节
                 continue
             elif 247 <= cur <= 254:  # 双字节
-                self.font_file.seek(1, 1)
+                pos += 1
             elif cur == 28:  # 三字节
-                self.font_file.seek(2, 1)
+                pos += 2
             elif cur == 29:  # 五字节
-                self.font_file.seek(4, 1)
+                pos += 4
             elif cur != 12:
                 return False
             else:
-                cur = unpack('B', self.font_file.read(1))[0]
-                return cur == 30
+                return cff[pos] == 30
 
-    def __init_cmap_table(self):
-        offset_cmap = self.tables['cmap']
-        self.font_file.seek(offset_cmap + 2, 0)
-        num_tables = unpack('>H', self.font_file.read(2))[0]
-
-        records = []
-        for i in range(num_tables):
-            records.append(unpack('>II', self.font_file.read(8)))
+    @cached_property
+    def cmap(self):
+        cmap = self.table('cmap')
+        num_tables = unpack_from('>H', cmap, 2)[0]
 
         cmap_type = 0
         cmap_offset = 0
 
-        for item in records:
+        for i in range(num_tables):
+            item = unpack_from('>II', cmap, 4 + i * 8)
             if item[0] == 0x030001:
                 cmap_type = 4
                 cmap_offset = item[1]
@@ -214,63 +380,147 @@ class Font:
                 cmap_offset = item[1]
             elif item[0] > 0x03000A:
                 break
-        offset_cmap += cmap_offset
-        self.font_file.seek(offset_cmap, 0)
 
         if cmap_type == 4:
-            self.cmap = Type4CmapTable(self.font_file)
+            return Type4CmapTable(cmap[cmap_offset:])
         elif cmap_type == 12:
-            self.cmap = Type12CmapTable(self.font_file)
+            return Type12CmapTable(cmap[cmap_offset:])
         else:
             print('字体没有合适的cmap表。', file=sys.stderr)
             exit(1)
 
-    def __get_typo_data(self):
-        self.font_file.seek(self.tables['head'] + 18, 0)
-        upm = unpack('>H', self.font_file.read(2))[0]
-        self.font_file.seek(self.tables['OS/2'] + 68, 0)
-        ascent = unpack('>h', self.font_file.read(2))[0]
-        self.font_file.seek(18, 1)
-        caps_height = unpack('>h', self.font_file.read(2))[0]
-        return upm, ascent, caps_height
-
-    def __get_hmtx(self, is_western):
-        if is_western and not self.is_cid:
-            result = []
-            self.font_file.seek(self.tables['hhea'] + 34, 0)
-            num_hmtx = unpack('>H', self.font_file.read(2))[0]
-            self.font_file.seek(self.tables['hmtx'], 0)
-            for i in range(num_hmtx):
-                result.append(unpack('>HH', self.font_file.read(4))[0])
-            return result
+    @cached_property
+    def gsub(self):
+        """
+        编译 GSUB 表中连字等特性用到的 lookup（见 `gsub.compile_gsub`）。没有 GSUB 表时为空列表。
+        """
+        if 'GSUB' not in self.tables:
+            return []
+        return compile_gsub(self.table('GSUB'))
+
+    @cached_property
+    def gpos(self):
+        """
+        编译 GPOS 表中 kern 特性用到的字偶距调整（见 `gpos.compile_gpos`）。没有 GPOS 表时不做调整。
+        """
+        if 'GPOS' not in self.tables:
+            return KerningTable([])
+        return compile_gpos(self.table('GPOS'))
+
+    @cached_property
+    def upm(self):
+        return unpack_from('>H', self.table('head'), 18)[0]
+
+    @cached_property
+    def ascent(self):
+        return unpack_from('>h', self.table('OS/2'), 68)[0]
+
+    @cached_property
+    def caps_height(self):
+        """
+        大写字母的高度。OS/2 表版本 2 以上才有 sCapHeight；更早的版本（如 DejaVu）用字母 H 的高度，
+        H 没有 TrueType 轮廓时用 ascent。
+        """
+        os2 = self.table('OS/2')
+        if unpack_from('>H', os2, 0)[0] >= 2 and len(os2) >= 90:
+            caps_height = unpack_from('>h', os2, 88)[0]
+            if caps_height > 0:
+                return caps_height
+        height = self.glyph_y_max(self.get_gid(ord('H')))
+        if height is not None and height > 0:
+            return height
+        return self.ascent
+
+    def glyph_y_max(self, gid):
+        """
+        :return: TrueType 轮廓中字形的最高点（glyf 中的 yMax）；不是 TrueType 轮廓或字形为空时为 None
+        """
+        if 'glyf' not in self.tables or 'loca' not in self.tables:
+            return None
+        loca = self.table('loca')
+        if unpack_from('>h', self.table('head'), 50)[0] == 0:  # indexToLocFormat 为 0 时存偏移量的一半
+            if 2 * gid + 4 > len(loca):
+                return None
+            start, end = unpack_from('>HH', loca, 2 * gid)
+            start *= 2
+            end *= 2
+        else:
+            if 4 * gid + 8 > len(loca):
+                return None
+            start, end = unpack_from('>II', loca, 4 * gid)
+        if end - start < 10:
+            return None
+        return unpack_from('>h', self.table('glyf'), start + 8)[0]
+
+    @cached_property
+    def hmtx(self):
+        """
+        读取 hmtx 表中的前进宽度。只有西文字体需要。
+        """
+        if self.is_western and not self.is_cid:
+            return self.read_hmtx()[0]
         else:
             return None
 
+    @cached_property
+    def left_side_bearings(self):
+        """
+        读取 hmtx 表中的左侧空白。只有西文字体需要。
+        """
+        if self.is_western and not self.is_cid:
+            return self.read_hmtx()[1]
+        else:
+            return None
 
-class FontLibrary:
-    def __init__(self, chinese, western):
-        self.lib = cdll.LoadLibrary('libfontconfig.so')
-        self.config = self.lib.FcInitLoadConfigAndFonts()
+    def read_hmtx(self):
+        """
+        把 hmtx 表整个读入数组。
+        :return: (各字形的前进宽度 array('H'), 各字形的左侧空白 array('h'))。前进宽度只有 numberOfHMetrics 项，
+                 左侧空白还包括表末尾只记录了左侧空白的字形。
+        """
+        num_hmtx = unpack_from('>H', self.table('hhea'), 34)[0]
+        hmtx = self.table('hmtx')
+        values = array('h')
+        values.frombytes(hmtx[:len(hmtx) // 2 * 2])
+        if sys.byteorder == 'little':
+            values.byteswap()
+        advances = array('H', values[0:2 * num_hmtx:2].tobytes())
+        return advances, values[1:2 * num_hmtx:2] + values[2 * num_hmtx:]
 
-        self.font_dict = {}
-        self.default_chinese = self.get_font(chinese, False)
-        self.default_western = self.get_font(western, True)
 
-    def get_font(self, font_name, is_western):
+class FontconfigResolver:
+    """
+    用 fontconfig 按字体名查找字体文件。fontconfig 初始化时要扫描系统中所有字体目录，所以等到第一次查找时才初始化。
+    """
+    def __init__(self):
+        self.lib = None
+        self.config = None
+
+    def __initialize(self):
+        if self.lib is None:
+            lib = cdll.LoadLibrary('libfontconfig.so')
+            # 返回值默认按 int 处理，64 位系统上指针会被截断，要先声明各函数的类型
+            lib.FcInitLoadConfigAndFonts.restype = c_void_p
+            lib.FcNameParse.restype = c_void_p
+            lib.FcNameParse.argtypes = [c_char_p]
+            lib.FcConfigSubstitute.argtypes = [c_void_p, c_void_p, c_int]
+            lib.FcDefaultSubstitute.argtypes = [c_void_p]
+            lib.FcFontMatch.restype = c_void_p
+            lib.FcFontMatch.argtypes = [c_void_p, c_void_p, c_void_p]
+            lib.FcPatternGetString.argtypes = [c_void_p, c_char_p, c_int, c_void_p]
+            lib.FcPatternGetInteger.argtypes = [c_void_p, c_char_p, c_int, c_void_p]
+            lib.FcPatternDestroy.argtypes = [c_void_p]
+            self.lib = lib
+            self.config = lib.FcInitLoadConfigAndFonts()
+
+    def resolve(self, font_names):
         """
-        根据字体名查找字体。
-        :param font_name: 字体名。
-        :param is_western: 是否为西文字体（需要 `hmtx` 表）
-        :return: 相应的font对象。
+        成批查找字体。
+        :param font_names: 字体名组成的序列
+        :return: 字典：字体名 -> (字体文件的路径, TTC 中的序号)
         """
-        if font_name in self.font_dict:
-            return self.font_dict[font_name]
-
-        # 用fcconfig找到字体位置
-        font_dir, index = self.__get_font_dir(font_name)
-        new_font = Font(font_dir, index, is_western)
-        self.font_dict[font_name] = new_font
-        return new_font
+        self.__initialize()
+        return {font_name: self.__get_font_dir(font_name) for font_name in font_names}
 
     def __get_font_dir(self, font_name):
         font_name_cstr = c_char_p(str.encode(font_name))
@@ -283,7 +533,7 @@ class FontLibrary:
         index = c_int32()
 
         font = self.lib.FcFontMatch(self.config, pat, byref(res))
-        if font == c_void_p():
+        if not font:
             print('字体“{}”不存在。'.format(font_name), file=sys.stderr)
             exit(1)
         if self.lib.FcPatternGetString(font, b'file', 0, byref(direc)) != 0:
@@ -297,3 +547,82 @@ class FontLibrary:
         self.lib.FcPatternDestroy(font)
         self.lib.FcPatternDestroy(pat)
         return font_dir, index.value
+
+
+class StaticResolver:
+    """
+    不用 fontconfig，按给定的表查找字体。用于测试等没有系统字体的场合。
+    """
+    def __init__(self, fonts):
+        """
+        :param fonts: 字典：字体名 -> (字体文件的路径, TTC 中的序号)
+        """
+        self.fonts = dict(fonts)
+
+    def resolve(self, font_names):
+        result = {}
+        for font_name in font_names:
+            if font_name not in self.fonts:
+                print('字体“{}”不存在。'.format(font_name), file=sys.stderr)
+                exit(1)
+            result[font_name] = self.fonts[font_name]
+        return result
+
+
+class FontLibrary:
+    def __init__(self, chinese, western, metrics_cache=None, name_cache=None, resolver=None):
+        """
+        :param metrics_cache: 字体度量的磁盘缓存（见 `font_cache.FontMetricsCache`），为 None 时不用缓存
+        :param name_cache: 字体名 -> 字体文件的磁盘缓存（见 `font_cache.FontNameCache`），为 None 时不用缓存
+        :param resolver: 按字体名查找字体文件的对象，默认为 FontconfigResolver。缓存中都有时不会用到它
+        """
+        self.metrics_cache = metrics_cache
+        self.name_cache = name_cache
+        self.resolver = resolver or FontconfigResolver()
+        self.locations = {}  # 字体名 -> (字体文件的路径, TTC 中的序号)
+
+        self.font_dict = {}
+        self.resolve_fonts([chinese, western])
+        self.default_chinese = self.get_font(chinese, False)
+        self.default_western = self.get_font(western, True)
+
+    def resolve_fonts(self, font_names):
+        """
+        成批查找字体文件的位置。先查缓存，缓存中没有（或字体文件已改动）的一次交给 resolver 查找。
+        :param font_names: 字体名组成的序列
+        :return: 字典：字体名 -> (字体文件的路径, TTC 中的序号)
+        """
+        result = {}
+        missing = []
+        for font_name in font_names:
+            location = self.locations.get(font_name)
+            if location is None and self.name_cache is not None:
+                location = self.name_cache.get(font_name)
+            if location is None:
+                missing.append(font_name)
+            else:
+                result[font_name] = location
+        if len(missing) > 0:
+            found = self.resolver.resolve(missing)
+            if self.name_cache is not None:
+                for font_name, (font_dir, index) in found.items():
+                    self.name_cache.put(font_name, font_dir, index)
+                self.name_cache.save()
+            result.update(found)
+        self.locations.update(result)
+        return result
+
+    def get_font(self, font_name, is_western):
+        """
+        根据字体名查找字体。
+        :param font_name: 字体名。
+        :param is_western: 是否为西文字体（需要 `hmtx` 表）
+        :return: 相应的font对象。
+        """
+        if font_name in self.font_dict:
+            return self.font_dict[font_name]
+
+        font_dir, index = self.resolve_fonts([font_name])[font_name]
+        new_font = Font(font_dir, index, is_western, self.metrics_cache)
+        self.font_dict[font_name] = new_font
+        return new_font
@@ -4,9 +4,9 @@ from font_library import FontLibrary
 FONT_LIBRARY = None
 
 
-def initialize_font_library(chinese, western):
+def initialize_font_library(chinese, western, metrics_cache=None, name_cache=None, resolver=None):
     global FONT_LIBRARY
-    FONT_LIBRARY = FontLibrary(chinese, western)
+    FONT_LIBRARY = FontLibrary(chinese, western, metrics_cache, name_cache, resolver)
 
 
 def get_default_chinese_font():
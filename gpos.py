@@ -0,0 +1,302 @@
+from array import array
+from itertools import repeat
+from operator import add, lshift, mul, or_
+from struct import unpack_from
+from typing import List, Sequence
+
+from gsub import feature_lookups, read_coverage
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 字偶距调整
+PAIR_ADJUSTMENT = 2
+# 扩展：实际的子表在 32 位偏移量处，类型另记
+EXTENSION = 9
+
+DEFAULT_FEATURES = ('kern',)
+
+
+def value_record_size(value_format: int) -> int:
+    return 2 * bin(value_format).count('1')
+
+
+def x_advance_offset(value_format: int):
+    """
+    :return: 值记录中 XAdvance 的位置，没有 XAdvance 时为 None
+    """
+    if not value_format & 4:
+        return None
+    return 2 * bin(value_format & 3).count('1')
+
+
+def read_class_def(data, offset: int, size: int) -> array:
+    """
+    读出类定义表。
+    :param size: 数组的长度，超出的 GID 不记录
+    :return: 各 GID 的类，没有定义的为 0
+    """
+    result = array('H', bytes(2 * size))
+    class_format = unpack_from('>H', data, offset)[0]
+    if class_format == 1:
+        start, count = unpack_from('>HH', data, offset + 2)
+        values = unpack_from('>%dH' % count, data, offset + 6)
+        end = min(start + count, size)
+        if start < end:
+            result[start:end] = array('H', values[:end - start])
+    else:
+        count = unpack_from('>H', data, offset + 2)[0]
+        ranges = unpack_from('>%dH' % (3 * count), data, offset + 4)
+        for start, end, value in zip(ranges[0::3], ranges[1::3], ranges[2::3]):
+            end = min(end + 1, size)
+            if start < end:
+                result[start:end] = array('H', repeat(value, end - start))
+    return result
+
+
+def class_def_size(data, offset: int) -> int:
+    """
+    :return: 类定义表中最大的 GID 加 1
+    """
+    class_format = unpack_from('>H', data, offset)[0]
+    if class_format == 1:
+        start, count = unpack_from('>HH', data, offset + 2)
+        return start + count
+    count = unpack_from('>H', data, offset + 2)[0]
+    if count == 0:
+        return 0
+    return max(unpack_from('>%dH' % (3 * count), data, offset + 4)[1::3]) + 1
+
+
+class PairTable:
+    """
+    PairPos 格式 1（逐对列出）。(第一个 GID << 16 | 第二个 GID) -> 调整量。
+    """
+    __slots__ = ('pairs',)
+
+    def __init__(self, pairs: dict):
+        self.pairs = pairs
+
+    def kern(self, first: int, second: int):
+        """
+        :return: 调整量；不是这个子表中的字偶时为 None
+        """
+        return self.pairs.get(first << 16 | second)
+
+    def kerns(self, firsts, seconds, mark_missing: bool = True) -> list:
+        """
+        成批查找，结果与 kern 相同。
+        :param mark_missing: 为 False 时不是这个子表中的字偶记为 0 而不是 None
+        """
+        keys = map(or_, map(lshift, firsts, repeat(16)), seconds)
+        if mark_missing:
+            return list(map(self.pairs.get, keys))
+        return list(map(self.pairs.get, keys, repeat(0)))
+
+
+class ClassPairTable:
+    """
+    PairPos 格式 2（按类）编译成的稠密矩阵。各 GID 的类存于数组，调整量 = matrix[class1[第一个 GID] * num_class2 + class2[第二个 GID]]。
+    第一个字形不在覆盖表中时 class1 为 num_class1，矩阵中这一行为 0，并且不算作这个子表中的字偶。
+    各数组的最后一项留给超出范围的 GID。
+    """
+    __slots__ = ('class1', 'class2', 'matrix', 'num_class1', 'num_class2', '__rows')
+
+    def __init__(self, class1: array, class2: array, matrix: array, num_class1: int, num_class2: int):
+        self.class1 = class1
+        self.class2 = class2
+        self.matrix = matrix
+        self.num_class1 = num_class1
+        self.num_class2 = num_class2
+        self.__rows = None
+
+    def kern(self, first: int, second: int):
+        first_class = self.class1[min(first, len(self.class1) - 1)]
+        if first_class == self.num_class1:
+            return None
+        return self.matrix[first_class * self.num_class2 + self.class2[min(second, len(self.class2) - 1)]]
+
+    def kerns(self, firsts, seconds, mark_missing: bool = True) -> list:
+        """
+        成批查找，结果与 kern 相同。
+        :param mark_missing: 为 False 时不是这个子表中的字偶记为 0（即矩阵中最后一行的值）而不是 None
+        """
+        if self.__rows is None:  # 各 GID 所在行在矩阵中的起点
+            self.__rows = array('I', map(mul, self.class1, repeat(self.num_class2)))
+        rows = self.__rows
+        if len(firsts) > 0 and max(firsts) >= len(rows):
+            firsts = map(min, firsts, repeat(len(rows) - 1))
+        if len(seconds) > 0 and max(seconds) >= len(self.class2):
+            seconds = map(min, seconds, repeat(len(self.class2) - 1))
+        starts = map(rows.__getitem__, firsts)
+        if mark_missing:
+            starts = list(starts)
+        values = map(self.matrix.__getitem__, map(add, starts, map(self.class2.__getitem__, seconds)))
+        missing = self.num_class1 * self.num_class2
+        if not mark_missing or missing not in starts:
+            return list(values)
+        return [None if start == missing else value for start, value in zip(starts, values)]
+
+    def kerns_numpy(self, firsts, seconds):
+        """
+        用 NumPy 成批查找。
+        :return: (调整量, 是否是这个子表中的字偶)
+        """
+        class1 = numpy.frombuffer(self.class1, dtype=numpy.uint16)
+        class2 = numpy.frombuffer(self.class2, dtype=numpy.uint16)
+        matrix = numpy.frombuffer(self.matrix, dtype=numpy.int16).reshape(self.num_class1 + 1, self.num_class2)
+        first_classes = class1[numpy.minimum(firsts, len(class1) - 1)]
+        values = matrix[first_classes, class2[numpy.minimum(seconds, len(class2) - 1)]]
+        return values, first_classes != self.num_class1
+
+
+def _first_value(value, other):
+    return other if value is None else value
+
+
+class KerningTable:
+    """
+    GPOS 中 kern 特性用到的各 lookup。同一 lookup 中先找到的子表有效，各 lookup 的调整量相加。
+    """
+    __slots__ = ('lookups',)
+
+    def __init__(self, lookups: List[list]):
+        self.lookups = lookups  # 每个 lookup 为 PairTable、ClassPairTable 组成的列表
+
+    def get_kern(self, first: int, second: int) -> int:
+        """
+        :return: 两个字形间的调整量，以字体单位计
+        """
+        total = 0
+        for subtables in self.lookups:
+            for subtable in subtables:
+                value = subtable.kern(first, second)
+                if value is not None:
+                    total += value
+                    break
+        return total
+
+    def get_kerns(self, gids):
+        """
+        一串字形中各相邻两个字形间的调整量，以字体单位计。
+        :param gids: GID 组成的序列
+        :return: 长度比 gids 少 1，有 NumPy 时为 NumPy 数组，否则为 array('i')。
+        """
+        if numpy is not None:
+            return self.__get_kerns_numpy(gids)
+        firsts = gids[:-1]
+        seconds = gids[1:]
+        total = None
+        for subtables in self.lookups:
+            values = None
+            for index, subtable in enumerate(subtables):
+                # 最后一个子表之后没有别的子表了，不必标出不是其中字偶的位置
+                last = index == len(subtables) - 1
+                current = subtable.kerns(firsts, seconds, not last)
+                values = current if values is None else list(map(_first_value, values, current))
+                if last or None not in values:
+                    break
+            total = array('i', values) if total is None else array('i', map(add, total, values))
+        if total is None:
+            return array('i', bytes(4 * max(len(gids) - 1, 0)))
+        return total
+
+    def __get_kerns_numpy(self, gids):
+        gids = numpy.asarray(gids, dtype=numpy.intp)
+        firsts = gids[:-1]
+        seconds = gids[1:]
+        total = numpy.zeros(len(firsts), dtype=numpy.int32)
+        for subtables in self.lookups:
+            found = numpy.zeros(len(firsts), dtype=bool)
+            for subtable in subtables:
+                if isinstance(subtable, ClassPairTable):
+                    values, applies = subtable.kerns_numpy(firsts, seconds)
+                else:
+                    current = subtable.kerns(firsts.tolist(), seconds.tolist())
+                    applies = numpy.fromiter((value is not None for value in current), dtype=bool,
+                                             count=len(current))
+                    values = numpy.fromiter((value or 0 for value in current), dtype=numpy.int32,
+                                            count=len(current))
+                applies &= ~found
+                total[applies] += values[applies]
+                found |= applies
+                if found.all():
+                    break
+        return total
+
+
+def read_pair_subtable(data, offset: int):
+    """
+    读出 PairPos 子表，只取第一个字形的 XAdvance（即字偶距），没有 XAdvance 时调整量为 0（但仍然挡住后面的子表）。
+    :return: PairTable 或 ClassPairTable；格式不支持时为 None
+    """
+    pos_format, coverage_offset, value_format1, value_format2 = unpack_from('>HHHH', data, offset)
+    advance = x_advance_offset(value_format1)
+    record_size = value_record_size(value_format1) + value_record_size(value_format2)
+    coverage = read_coverage(data, offset + coverage_offset)
+    if pos_format == 1:
+        pair_set_count = unpack_from('>H', data, offset + 8)[0]
+        pairs = {}
+        for first, set_offset in zip(coverage, unpack_from('>%dH' % pair_set_count, data, offset + 10)):
+            position = offset + set_offset
+            count = unpack_from('>H', data, position)[0]
+            for i in range(count):
+                record = position + 2 + i * (2 + record_size)
+                second = unpack_from('>H', data, record)[0]
+                pairs.setdefault(first << 16 | second,
+                                 0 if advance is None else unpack_from('>h', data, record + 2 + advance)[0])
+        return PairTable(pairs)
+    if pos_format != 2:
+        return None
+
+    class_def1, class_def2, num_class1, num_class2 = unpack_from('>HHHH', data, offset + 8)
+    size1 = max(coverage, default=-1) + 2
+    size2 = class_def_size(data, offset + class_def2) + 1
+    class1 = read_class_def(data, offset + class_def1, size1)
+    covered = array('H', repeat(num_class1, size1))  # 不在覆盖表中的字形对应最后一行
+    for gid in coverage:
+        covered[gid] = class1[gid]
+    class2 = read_class_def(data, offset + class_def2, size2)
+    # 各记录中只取第一个值记录的 XAdvance，最后补一行 0
+    if advance is None:
+        matrix = array('h', bytes(2 * (num_class1 + 1) * num_class2))
+    else:
+        stride = record_size // 2
+        records = unpack_from('>%dh' % (num_class1 * num_class2 * stride), data, offset + 16)
+        matrix = array('h', records[advance // 2::stride])
+        matrix.extend(repeat(0, num_class2))
+    return ClassPairTable(covered, class2, matrix, num_class1, num_class2)
+
+
+def compile_gpos(data, features: Sequence[str] = DEFAULT_FEATURES) -> KerningTable:
+    """
+    读出 GPOS 表中所选特性用到的 PairPos lookup 并编译。其他类型的 lookup 忽略。
+    :param data: GPOS 表的内容（bytes 或 memoryview）
+    :param features: 特性名
+    """
+    lookup_list = unpack_from('>H', data, 8)[0]
+    lookup_count = unpack_from('>H', data, lookup_list)[0]
+    lookups = []
+    for index in feature_lookups(data, features):
+        if index >= lookup_count:
+            continue
+        position = lookup_list + unpack_from('>H', data, lookup_list + 2 + 2 * index)[0]
+        lookup_kind, _, subtable_count = unpack_from('>HHH', data, position)
+        subtables = []
+        for subtable_offset in unpack_from('>%dH' % subtable_count, data, position + 6):
+            subtable = position + subtable_offset
+            kind = lookup_kind
+            if lookup_kind == EXTENSION:
+                kind, extension_offset = unpack_from('>HI', data, subtable + 2)
+                subtable += extension_offset
+            if kind != PAIR_ADJUSTMENT:
+                break
+            result = read_pair_subtable(data, subtable)
+            if result is not None:
+                subtables.append(result)
+        if len(subtables) > 0:
+            lookups.append(subtables)
+    return KerningTable(lookups)
@@ -0,0 +1,279 @@
+import sys
+from array import array
+from struct import unpack_from
+from typing import Dict, List, Sequence
+
+
+# 支持的 lookup 类型：单字替换、多字替换、连字
+SINGLE = 1
+MULTIPLE = 2
+LIGATURE = 4
+# 扩展：实际的子表在 32 位偏移量处，类型另记
+EXTENSION = 7
+
+# 默认启用的特性
+DEFAULT_FEATURES = ('ccmp', 'liga')
+# 依次查找的文种，都没有时用第一个
+DEFAULT_SCRIPTS = ('latn', 'DFLT')
+
+
+class CompiledLookup:
+    """
+    编译好的一个 lookup（同一 lookup 的各子表合并在一起）。各项按第一个 GID 升序排列，存于几个数组，便于写入缓存：
+    firsts[i] 为第 i 项的第一个 GID，各项的内容为 values[starts[i]:starts[i + 1]]：
+    单字替换为替换后的 GID，多字替换为替换后的 GID 序列，连字为以 firsts[i] 开头的各连字的 GID（按优先顺序），
+    其中第 j 个连字的其余部件为 components[component_starts[j]:component_starts[j + 1]]。
+    应用时用以第一个 GID 为键的字典（见 `table`），字典在第一次应用时由数组建立。
+    """
+    __slots__ = ('kind', 'firsts', 'starts', 'values', 'component_starts', 'components', '__table')
+
+    def __init__(self, kind: int, firsts, starts, values, component_starts=None, components=None):
+        self.kind = kind
+        self.firsts = firsts
+        self.starts = starts
+        self.values = values
+        self.component_starts = array('I', [0]) if component_starts is None else component_starts
+        self.components = array('H') if components is None else components
+        self.__table = None
+
+    def __len__(self):
+        return len(self.firsts)
+
+    def arrays(self) -> list:
+        """
+        :return: 各数组，顺序与构造函数的参数相同
+        """
+        return [self.firsts, self.starts, self.values, self.component_starts, self.components]
+
+    @property
+    def table(self) -> dict:
+        """
+        第一个 GID -> 单字替换为替换后的 GID；多字替换为替换后的 GID 组成的元组；
+        连字为 (第二个 GID -> 以这两个字形开头的各连字, 只有一个部件的连字的 GID 或 None)，
+        其中各连字为 (其余部件组成的元组, 连字的 GID)，按优先顺序排列。
+        """
+        if self.__table is not None:
+            return self.__table
+        if self.kind == SINGLE:
+            table = dict(zip(self.firsts, self.values))
+        elif self.kind == MULTIPLE:
+            values = self.values
+            table = dict(zip(self.firsts, map(tuple, map(values.__getitem__,
+                                                         map(slice, self.starts[:-1], self.starts[1:])))))
+        else:
+            values = self.values
+            components = self.components
+            component_starts = self.component_starts
+            table = {}
+            for first, start, end in zip(self.firsts, self.starts[:-1], self.starts[1:]):
+                by_second = {}
+                single = None
+                for rule in range(start, end):
+                    rule_components = tuple(components[component_starts[rule]:component_starts[rule + 1]])
+                    if len(rule_components) == 0:  # 总能匹配，之后的连字都用不到
+                        single = values[rule]
+                        break
+                    by_second.setdefault(rule_components[0], []).append((rule_components[1:], values[rule]))
+                table[first] = ({second: tuple(rules) for second, rules in by_second.items()}, single)
+        self.__table = table
+        return table
+
+    def apply(self, gids: List[int]) -> List[int]:
+        """
+        对一串字形做一遍替换。
+        :param gids: GID 组成的列表
+        :return: 替换后的 GID 组成的列表
+        """
+        table = self.table
+        if self.kind == SINGLE:
+            return list(map(table.get, gids, gids))
+        result = []
+        if self.kind == MULTIPLE:
+            for gid in gids:
+                sequence = table.get(gid)
+                if sequence is None:
+                    result.append(gid)
+                else:
+                    result.extend(sequence)
+            return result
+
+        index = 0
+        count = len(gids)
+        while index < count:
+            gid = gids[index]
+            index += 1
+            entry = table.get(gid)
+            if entry is None:
+                result.append(gid)
+                continue
+            by_second, single = entry
+            rules = by_second.get(gids[index]) if index < count else None
+            if rules is not None:
+                for rest, ligature in rules:
+                    end = index + 1 + len(rest)
+                    if len(rest) == 0 or end <= count and tuple(gids[index + 1:end]) == rest:
+                        single = ligature
+                        index = end
+                        break
+            result.append(gid if single is None else single)
+        return result
+
+
+def apply_lookups(lookups: Sequence[CompiledLookup], gids) -> List[int]:
+    """
+    按顺序应用各 lookup，每个 lookup 对整串字形扫描一遍。
+    """
+    gids = list(gids)
+    for lookup in lookups:
+        gids = lookup.apply(gids)
+    return gids
+
+
+def read_coverage(data, offset: int) -> List[int]:
+    """
+    读出覆盖表。
+    :return: 各 GID，顺序即覆盖表中的序号
+    """
+    coverage_format, count = unpack_from('>HH', data, offset)
+    if coverage_format == 1:
+        return list(unpack_from('>%dH' % count, data, offset + 4))
+    result = []
+    ranges = unpack_from('>%dH' % (3 * count), data, offset + 4)
+    for start, end in zip(ranges[0::3], ranges[1::3]):  # 各段依次排列，序号连续，无需看 startCoverageIndex
+        result.extend(range(start, end + 1))
+    return result
+
+
+def read_single(data, offset: int, entries: Dict[int, object]):
+    substitution_format, coverage_offset = unpack_from('>HH', data, offset)
+    coverage = read_coverage(data, offset + coverage_offset)
+    if substitution_format == 1:
+        delta = unpack_from('>h', data, offset + 4)[0]
+        substitutes = [(gid + delta) & 0xFFFF for gid in coverage]
+    else:
+        substitutes = unpack_from('>%dH' % len(coverage), data, offset + 6)
+    for gid, substitute in zip(coverage, substitutes):
+        entries.setdefault(gid, substitute)  # 前面的子表优先
+
+
+def read_multiple(data, offset: int, entries: Dict[int, object]):
+    coverage = read_coverage(data, offset + unpack_from('>H', data, offset + 2)[0])
+    sequence_offsets = unpack_from('>%dH' % len(coverage), data, offset + 6)
+    for gid, sequence_offset in zip(coverage, sequence_offsets):
+        count = unpack_from('>H', data, offset + sequence_offset)[0]
+        entries.setdefault(gid, unpack_from('>%dH' % count, data, offset + sequence_offset + 2))
+
+
+def read_ligature(data, offset: int, entries: Dict[int, object]):
+    coverage = read_coverage(data, offset + unpack_from('>H', data, offset + 2)[0])
+    set_offsets = unpack_from('>%dH' % len(coverage), data, offset + 6)
+    for gid, set_offset in zip(coverage, set_offsets):
+        position = offset + set_offset
+        count = unpack_from('>H', data, position)[0]
+        rules = entries.setdefault(gid, [])  # 前面的子表中的连字优先
+        for ligature_offset in unpack_from('>%dH' % count, data, position + 2):
+            ligature, component_count = unpack_from('>HH', data, position + ligature_offset)
+            components = unpack_from('>%dH' % (component_count - 1), data, position + ligature_offset + 4)
+            rules.append((components, ligature))
+
+
+_READERS = {SINGLE: read_single, MULTIPLE: read_multiple, LIGATURE: read_ligature}
+
+
+def compile_lookup(kind: int, entries: Dict[int, object]) -> CompiledLookup:
+    """
+    把第一个 GID -> 内容的字典排序后存成数组。
+    """
+    firsts = array('H', sorted(entries))
+    if kind == SINGLE:
+        return CompiledLookup(kind, firsts, array('I', range(len(firsts) + 1)),
+                              array('H', map(entries.__getitem__, firsts)))
+    starts = array('I', [0])
+    values = array('H')
+    if kind == MULTIPLE:
+        for first in firsts:
+            values.extend(entries[first])
+            starts.append(len(values))
+        return CompiledLookup(kind, firsts, starts, values)
+    component_starts = array('I', [0])
+    components = array('H')
+    for first in firsts:
+        for rule_components, ligature in entries[first]:
+            values.append(ligature)
+            components.extend(rule_components)
+            component_starts.append(len(components))
+        starts.append(len(values))
+    return CompiledLookup(kind, firsts, starts, values, component_starts, components)
+
+
+def feature_lookups(data, features: Sequence[str]) -> List[int]:
+    """
+    找出所选特性用到的各 lookup。文种按 DEFAULT_SCRIPTS 的顺序选取，用其默认语言。
+    :return: 各 lookup 的序号，升序（即应用的顺序）
+    """
+    script_list, feature_list = unpack_from('>HH', data, 4)
+    script_count = unpack_from('>H', data, script_list)[0]
+    scripts = {}
+    for i in range(script_count):
+        tag, script_offset = unpack_from('>4sH', data, script_list + 2 + 6 * i)
+        scripts[tag.decode('latin-1')] = script_list + script_offset
+    feature_indices = None
+    for tag in DEFAULT_SCRIPTS + tuple(scripts):
+        if tag in scripts:
+            lang_sys = unpack_from('>H', data, scripts[tag])[0]
+            if lang_sys == 0:  # 没有默认语言
+                continue
+            position = scripts[tag] + lang_sys
+            required, count = unpack_from('>HH', data, position + 2)
+            feature_indices = list(unpack_from('>%dH' % count, data, position + 6))
+            if required != 0xFFFF:
+                feature_indices.append(required)
+            break
+
+    feature_count = unpack_from('>H', data, feature_list)[0]
+    if feature_indices is None:  # 没有可用的文种时，所有同名特性都用
+        feature_indices = range(feature_count)
+    result = set()
+    for index in feature_indices:
+        if index >= feature_count:
+            continue
+        tag, feature_offset = unpack_from('>4sH', data, feature_list + 2 + 6 * index)
+        if tag.decode('latin-1') not in features:
+            continue
+        position = feature_list + feature_offset
+        count = unpack_from('>H', data, position + 2)[0]
+        result.update(unpack_from('>%dH' % count, data, position + 4))
+    return sorted(result)
+
+
+def compile_gsub(data, features: Sequence[str] = DEFAULT_FEATURES) -> List[CompiledLookup]:
+    """
+    读出 GSUB 表中所选特性用到的单字替换、多字替换、连字 lookup 并编译。其他类型的 lookup（上下文替换等）忽略。
+    lookup 的标志（如忽略附加符号）也不处理。
+    :param data: GSUB 表的内容（bytes 或 memoryview）
+    :param features: 特性名
+    :return: 编译好的各 lookup，按应用的顺序排列
+    """
+    lookup_list = unpack_from('>H', data, 8)[0]
+    lookup_count = unpack_from('>H', data, lookup_list)[0]
+    result = []
+    for index in feature_lookups(data, features):
+        if index >= lookup_count:
+            print('GSUB 中没有第 %d 个 lookup' % index, file=sys.stderr)
+            continue
+        position = lookup_list + unpack_from('>H', data, lookup_list + 2 + 2 * index)[0]
+        lookup_kind, _, subtable_count = unpack_from('>HHH', data, position)
+        kind = lookup_kind
+        entries = {}
+        for subtable_offset in unpack_from('>%dH' % subtable_count, data, position + 6):
+            subtable = position + subtable_offset
+            if lookup_kind == EXTENSION:  # 同一 lookup 中各扩展子表的实际类型相同
+                kind, extension_offset = unpack_from('>HI', data, subtable + 2)
+                subtable += extension_offset
+            reader = _READERS.get(kind)
+            if reader is None:
+                break
+            reader(data, subtable, entries)
+        if kind in _READERS and len(entries) > 0:
+            result.append(compile_lookup(kind, entries))
+    return result
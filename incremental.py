@@ -0,0 +1,337 @@
+from array import array
+from typing import Iterable, List, Tuple
+
+from item_type import ItemType, TokenNode
+from parse_tree import ParseTree, NodeView
+from parser import parse_into
+from tokenizer import Lexer, match_braces, tokenize_with_braces
+
+
+class PrefixSums:
+    """
+    树状数组：修改一项、求前若干项之和都只需 O(log n) 步。用来存各顶层语句的长度，由此求出语句的位置。
+    各项都不能是负数。
+    """
+    __slots__ = ('sums',)
+
+    def __init__(self, values: Iterable[int]):
+        sums = [0]
+        sums.extend(values)
+        size = len(sums)
+        for index in range(1, size):
+            parent = index + (index & -index)
+            if parent < size:
+                sums[parent] += sums[index]
+        self.sums = sums
+
+    def __len__(self):
+        return len(self.sums) - 1
+
+    def add(self, index: int, delta: int):
+        """
+        第 index 项加上 delta。
+        """
+        sums = self.sums
+        size = len(sums)
+        index += 1
+        while index < size:
+            sums[index] += delta
+            index += index & -index
+
+    def prefix(self, index: int) -> int:
+        """
+        :return: 前 index 项之和
+        """
+        sums = self.sums
+        result = 0
+        while index > 0:
+            result += sums[index]
+            index &= index - 1
+        return result
+
+    def find(self, position: int) -> int:
+        """
+        :return: position 落在第几项中，即前 k 项之和不超过 position 的最大的 k；超出末尾时为最后一项。
+        """
+        sums = self.sums
+        size = len(sums)
+        index = 0
+        step = 1 << (size.bit_length() - 1)
+        while step > 0:
+            next_index = index + step
+            if next_index < size and sums[next_index] <= position:
+                index = next_index
+                position -= sums[next_index]
+            step >>= 1
+        return min(index, size - 2)
+
+
+class DocumentTree(ParseTree):
+    """
+    增量分析用的语法树。每个顶层语句（连同其后的行尾）中的结点存的是相对的位置：
+    语句在分析时的位置为 origins[语句编号]，此后语句前面的内容改变了长度，这些结点也不必逐个平移，
+    读取位置时再加上语句现在的位置与之的差。
+    """
+    def __init__(self):
+        super().__init__()
+        self.owners = array('i')  # 各结点所属语句的编号，不属于任何语句时为 -1
+        self.origins = []  # 语句编号 -> 分析该语句时它所在的位置
+        self.ordinals = []  # 语句编号 -> 它是文档中的第几个语句
+        self.lengths = PrefixSums([])  # 按顺序排列的各语句的长度
+
+    def position_shift(self, index: int) -> int:
+        owner = self.owners[index]
+        if owner < 0:
+            return 0
+        return self.lengths.prefix(self.ordinals[owner]) - self.origins[owner]
+
+
+class Document:
+    """
+    供编辑器预览用的文档。每次修改后只重新分析修改处所在的顶层语句：
+    重新做词法分析的只有这些语句的原文，语法树中也只替换这些语句的子树。
+    顶层语句之间以顶层的行尾 Token 分隔，分析器在行尾处没有任何状态，因此可以从这里开始、到这里结束。
+    文档按语句分段存放（每段为一个语句及其后的行尾），结点的位置相对于所在的段（见 `DocumentTree`），
+    因此一次修改所需的时间只与改动的语句有关，与文档的长度无关。
+    只有语句的数目变了时要重排后面各段的序号、重建长度表，这一步与语句的个数成正比（每兆字节约 1.5 毫秒）。
+    """
+    def __init__(self, text: str):
+        tokens, brace_pairs = tokenize_with_braces(text)
+        self.tree = DocumentTree()
+        self.root = parse_into(self.tree, tokens, text, brace_pairs)
+        self.clause_nodes = self.__clauses_of(self.root)[0]  # 各顶层语句（CLAUSE）结点的编号
+        self.free_ids = []  # 已不再使用的语句编号
+        self.segments, self.segment_ids = self.__add_segments(self.clause_nodes, tokens, text)  # 各语句的原文和编号
+        self.tree.ordinals[:] = range(len(self.segment_ids))
+        self.tree.lengths = PrefixSums(map(len, self.segments))
+        self.compact_size = len(self.tree)  # 上次整理后语法树的结点数
+        self.__text = text
+
+    def __clauses_of(self, document: int):
+        """
+        沿 DOCUMENT -> CLAUSE DOCUMENT_SUFFIX -> END_OF_LINE CLAUSE DOCUMENT_SUFFIX ... 找出所有顶层语句。
+        :return: (DOCUMENT 结点下各顶层语句的编号, 最后一个 DOCUMENT_SUFFIX 的编号)
+        """
+        tree = self.tree
+        result = []
+        clause = tree.first_child[document]
+        while True:
+            result.append(clause)
+            suffix = clause + 1  # 同一推导式的子结点是连续的
+            child = tree.first_child[suffix]
+            if tree.types[child] == ItemType.EMPTY:
+                return result, suffix
+            clause = child + 1
+
+    @staticmethod
+    def __find_separators(tokens: List[TokenNode], begin: int, end: int) -> List[int]:
+        result = []
+        depth = 0
+        for index in range(begin, end):
+            token_type = tokens[index].type
+            if token_type == ItemType.BRACE_LEFT:
+                depth += 1
+            elif token_type == ItemType.BRACE_RIGHT:
+                depth -= 1
+            elif token_type == ItemType.END_OF_LINE and depth == 0:
+                result.append(index)
+        return result
+
+    def __add_segments(self, clauses: List[int], tokens: List[TokenNode], text: str) -> Tuple[List[str], List[int]]:
+        """
+        为刚分析出的各语句分配编号，记下它们在 text 中的位置，并标出各结点所属的语句。
+        :param clauses: 各语句（CLAUSE）结点的编号
+        :param tokens: 分析时用的 Token 列表
+        :param text: 分析时用的原文，各语句依次首尾相接
+        :return: (各语句的原文, 各语句的编号)
+        """
+        tree = self.tree
+        owners = tree.owners
+        owners.extend(array('i', [-1]) * (len(tree) - len(owners)))
+        ends = [tokens[index].end for index in self.__find_separators(tokens, 0, len(tokens))]
+        ends.append(len(text))
+        texts = []
+        ids = []
+        begin = 0
+        for clause, end in zip(clauses, ends):
+            if len(self.free_ids) > 0:
+                segment = self.free_ids.pop()
+                tree.origins[segment] = begin
+            else:
+                segment = len(tree.origins)
+                tree.origins.append(begin)
+                tree.ordinals.append(-1)
+            # 语句的子树是在展开其后的 DOCUMENT_SUFFIX 之前连续分配的，紧接着是这个 DOCUMENT_SUFFIX 下的行尾
+            first = tree.first_child[clause]
+            stop = tree.first_child[clause + 1] + 1
+            owners[first:stop] = array('i', [segment]) * (stop - first)
+            texts.append(text[begin:end])
+            ids.append(segment)
+            begin = end
+        return texts, ids
+
+    @property
+    def text(self) -> str:
+        if self.__text is None:
+            self.__text = ''.join(self.segments)
+        return self.__text
+
+    @property
+    def parse_tree(self) -> NodeView:
+        return self.tree.node(self.root)
+
+    def edit(self, offset: int, removed: int, inserted: str) -> NodeView:
+        """
+        修改文档：把 text[offset:offset + removed] 换成 inserted。
+        此前取得的结点在修改后不再有效。
+        :return: 新的语法树的根结点
+        """
+        segments = self.segments
+        lengths = self.tree.lengths
+        self.__text = None
+
+        # 第 first 到第 last 个语句受影响：修改处的开头落在第 first 个语句中，结尾落在第 last 个语句的行尾或其之前
+        first = lengths.find(offset)
+        last = lengths.find(offset + removed)
+        while True:
+            begin = lengths.prefix(first)
+            old_text = ''.join(segments[first:last + 1])
+            text = old_text[:offset - begin] + inserted + old_text[offset + removed - begin:]
+            region = self.__relex(first, last, text)
+            if region is None:  # 语句末尾落在注释、字符串或括号中，要连下一个语句一起分析
+                last += 1
+                continue
+            if len(region) > 0 and region[0].type != ItemType.END_OF_FILE:
+                break
+            # 整个语句都删掉了，要连相邻的语句一起分析
+            if first > 0:
+                first -= 1
+            elif last < len(segments) - 1:
+                last += 1
+            else:  # 整篇文档都删掉了
+                self.__init__(text)
+                return self.parse_tree
+
+        self.__splice(first, last, region, text)
+        # 替换下来的结点留在数组中，积累到一定数量时整理一次，平均到每次修改的时间与新建的结点数成正比
+        if len(self.tree) > 2 * self.compact_size + 4096:
+            self.__compact()
+        return self.parse_tree
+
+    def __relex(self, first: int, last: int, text: str):
+        """
+        对第 first 到第 last 个语句（修改后的原文为 text）重新做词法分析。
+        :return: 新的 Token 列表，位置相对于 text。分析到文档末尾时以 END_OF_FILE 结尾；
+                 否则不含最后的行尾（即原来的分隔符）。
+                 分隔符落在注释、字符串或括号中，或者前面另有行尾而不再是分隔符时返回 None。
+        """
+        lexer = Lexer(0, ItemType.END_OF_LINE if first > 0 else None)
+        if last == len(self.segments) - 1:
+            return lexer.feed(text, True)
+
+        # 连同原来的分隔符一起分析，它应当原样留在最后，不属于任何注释或字符串
+        result = lexer.feed(text)
+        if lexer.word is not None or lexer.held is not None or len(lexer.braces.stack) > 0 \
+                or lexer.buffer.lstrip(' \t') != text[-1]:
+            return None
+        return result
+
+    def __splice(self, first: int, last: int, region: List[TokenNode], text: str):
+        """
+        把第 first 到第 last 个语句换成由 region 分析出的语句。
+        """
+        tree = self.tree
+        to_end = last == len(self.segments) - 1
+        end = len(text) - 1  # 原来的分隔符的位置
+        if to_end:
+            parse_tokens = region
+        else:
+            parse_tokens = region + [TokenNode(ItemType.END_OF_FILE, None, end, end)]
+
+        # 把这一段当作独立的文档分析，再接到原来的语法树上
+        sub_root = parse_into(tree, parse_tokens, text, match_braces(parse_tokens))
+        new_clauses, last_suffix = self.__clauses_of(sub_root)
+        texts, ids = self.__add_segments(new_clauses, parse_tokens, text)
+        old_clause = self.clause_nodes[first]
+        old_suffix = old_clause + 1
+        if not to_end:
+            # 原来的分隔符结点留在原处，改属最后一个新的语句
+            self.__move_children(self.clause_nodes[last] + 1, last_suffix)
+            boundary = tree.first_child[last_suffix]
+            tree.set_value(boundary, end, end, end + 1)
+            tree.owners[boundary] = ids[-1]
+        self.__move_children(new_clauses[0], old_clause)
+        self.__move_children(new_clauses[0] + 1, old_suffix)
+        new_clauses[0] = old_clause
+        self.clause_nodes[first:last + 1] = new_clauses
+
+        # 更新各语句的原文、编号、序号和长度
+        old_texts = self.segments[first:last + 1]
+        self.free_ids.extend(self.segment_ids[first:last + 1])
+        self.segments[first:last + 1] = texts
+        self.segment_ids[first:last + 1] = ids
+        ordinals = tree.ordinals
+        if len(ids) == len(old_texts):
+            for ordinal, segment, new_text, old_text in zip(range(first, last + 1), ids, texts, old_texts):
+                ordinals[segment] = ordinal
+                tree.lengths.add(ordinal, len(new_text) - len(old_text))
+        else:  # 语句的数目变了，后面各语句的序号都要改
+            segment_ids = self.segment_ids
+            for ordinal in range(first, len(segment_ids)):
+                ordinals[segment_ids[ordinal]] = ordinal
+            tree.lengths = PrefixSums(map(len, self.segments))
+
+    def __move_children(self, source: int, target: int):
+        """
+        把 source 的子结点改挂到 target 下面。
+        """
+        tree = self.tree
+        first = tree.first_child[source]
+        count = tree.child_count[source]
+        tree.first_child[target] = first
+        tree.child_count[target] = count
+        for child in range(first, first + count):
+            tree.parents[child] = target
+
+    def __compact(self):
+        """
+        把仍在语法树中的结点复制到新的数组中，丢掉修改时替换下来的结点和内容。结点的编号随之改变。
+        """
+        old = self.tree
+        first_child = old.first_child
+        child_count = old.child_count
+        # 按层次顺序排列仍在树中的结点，同一推导式的子结点仍然连续；order[新编号] = 原来的编号
+        order = [self.root]
+        parents = array('i', [-1])
+        for index, source in enumerate(order):
+            count = child_count[source]
+            if count > 0:
+                first = first_child[source]
+                order.extend(range(first, first + count))
+                parents.extend(array('i', [index]) * count)
+        new_index = array('i', [-1]) * len(old)
+        for index, source in enumerate(order):
+            new_index[source] = index
+
+        tree = DocumentTree()
+        tree.origins, tree.ordinals, tree.lengths = old.origins, old.ordinals, old.lengths
+        tree.types = array('B', map(old.types.__getitem__, order))
+        tree.parents = parents
+        tree.child_count = array('B', map(child_count.__getitem__, order))
+        tree.first_child = array('i', [new_index[first_child[source]] if child_count[source] > 0 else -1
+                                       for source in order])
+        tree.starts = array('i', map(old.starts.__getitem__, order))
+        tree.ends = array('i', map(old.ends.__getitem__, order))
+        tree.owners = array('i', map(old.owners.__getitem__, order))
+        payloads = array('i', map(old.payloads.__getitem__, order))
+        values = old.values
+        for index, payload in enumerate(payloads):
+            if payload >= 0:
+                payloads[index] = len(tree.values)
+                tree.values.append(values[payload])
+        tree.payloads = payloads
+
+        self.clause_nodes[:] = map(new_index.__getitem__, self.clause_nodes)
+        self.tree = tree
+        self.root = 0
+        self.compact_size = len(tree)
@@ -1,7 +1,8 @@
-from enum import Enum
+from enum import IntEnum
 
 
-class ItemType(Enum):
+class ItemType(IntEnum):
+    # 成员可以直接当作整数使用（如作为列表下标），因此不要改动编号的顺序
     # 终结符
     IDENTIFIER = 0  # 标识符
     KEYWORD = 1  # 关键字
@@ -38,13 +39,24 @@ class ItemType(Enum):
     STAFF_COMMAND = 28
 
     def is_terminal(self) -> bool:
-        return self.value < self.DOCUMENT.value
+        return self < FIRST_NONTERMINAL
+
+
+# 编号小于它的都是终结符
+FIRST_NONTERMINAL = int(ItemType.DOCUMENT)
 
 
 class TokenNode:
-    def __init__(self, token_type: ItemType, content):
+    """
+    Token 及语法树的结点。start、end 为其在原文中的位置（左闭右开），没有时为 None。
+    """
+    __slots__ = ('type', 'content', 'start', 'end')
+
+    def __init__(self, token_type: ItemType, content, start: int = None, end: int = None):
         self.type = token_type
         self.content = content
+        self.start = start
+        self.end = end
 
     def __repr__(self):
-        return "{%s, %s}" % (str(self.type)[9:], str(self.content))
+        return "{%s, %s}" % (self.type.name, str(self.content))
@@ -0,0 +1,76 @@
+from array import array
+from itertools import compress
+from typing import Dict, List
+
+from item_type import ItemType
+from parse_tree import NodeView
+from parser_jianpu import JianpuSequence
+from parser_lyric import LyricSpans
+from parser_staff import StaffSequence
+from timeline import assignments, clauses, score_items
+
+
+# 音符不够时，多出来的音节对应的音符下标
+_NO_NOTE = array('i', [-1])
+
+
+def singable_notes(sequence) -> array:
+    """
+    找出能配歌词的音符：简谱跳过休止符（0）和增时线（-1），五线谱每个音符都能配。
+    :param sequence: JianpuSequence 或 StaffSequence
+    :return: 这些音符的下标，升序
+    """
+    if isinstance(sequence, JianpuSequence):
+        return array('i', compress(range(len(sequence)), map((0).__lt__, sequence.notes)))
+    if isinstance(sequence, StaffSequence):
+        return array('i', range(len(sequence)))
+    raise TypeError('不是乐谱：%s' % type(sequence).__name__)
+
+
+def align_lyrics(sequence, verses: List[LyricSpans]) -> List[array]:
+    """
+    把各段歌词的音节依次配到音符上。能配歌词的音符只找一遍，各段歌词都取其开头的一段，不必逐个音节比较。
+    :param sequence: JianpuSequence 或 StaffSequence
+    :param verses: 各段歌词
+    :return: 每段歌词一个数组：第 i 个音节所配音符的下标，音符不够时为 -1
+    """
+    notes = singable_notes(sequence)
+    result = []
+    for verse in verses:
+        count = len(verse)
+        mapping = notes[:count]
+        if count > len(notes):
+            mapping.extend(_NO_NOTE * (count - len(notes)))
+        result.append(mapping)
+    return result
+
+
+def score_lyrics(root: NodeView) -> List[Dict[str, List[array]]]:
+    """
+    为文档中每个谱表内配了歌词的各行配歌词。同一行在谱表中出现多次、配了不同的歌词时，依次为第一段、第二段……
+    :param root: 语法树的根结点
+    :return: 列表，每一项对应一个谱表：谱行的变量名 -> 各段歌词的音节所配的音符（见 `align_lyrics`）
+    """
+    definitions = assignments(root)
+    result = []
+    for clause in clauses(root):
+        if clause.type != ItemType.LAYOUT_STAFF or clause.children[0].value != '谱表':
+            continue
+        verses = {}
+        for name, lyric_name in score_items(clause):
+            if lyric_name is None:
+                continue
+            lyric = definitions.get(lyric_name)
+            if lyric is None or lyric.type != ItemType.LYRIC:
+                print('错误：%s不是歌词' % lyric_name)
+                exit(1)
+            verses.setdefault(name, []).append(lyric.value)
+        alignments = {}
+        for name, lyrics in verses.items():
+            music = definitions.get(name)
+            if music is None or music.type not in (ItemType.JIANPU, ItemType.STAFF):
+                print('错误：谱表中的%s不是乐谱' % name)
+                exit(1)
+            alignments[name] = align_lyrics(music.value, lyrics)
+        result.append(alignments)
+    return result
@@ -1,10 +1,10 @@
-from tokenizer import tokenize
+from tokenizer import tokenize_with_braces
 from parser import parse
 
 
 if __name__ == '__main__':
     f = open('preview.txt', 'r')
     content = f.read()
-    tokens = tokenize(content)
-    parse_tree = parse(tokens, content)
+    tokens, brace_pairs = tokenize_with_braces(content)
+    parse_tree = parse(tokens, content, brace_pairs)
     pass
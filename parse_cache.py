@@ -0,0 +1,131 @@
+import hashlib
+import os
+import pickle
+import sys
+from collections import OrderedDict
+
+
+# 默认缓存大小上限：256 MB
+DEFAULT_MAX_BYTES = 256 << 20
+
+
+def default_cache_dir(name: str) -> str:
+    """
+    缓存目录，遵循 XDG 规范（~/.cache/vmt-prototype/<name>）。
+    """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'vmt-prototype', name)
+
+
+class ParseCache:
+    """
+    语法分析结果的磁盘缓存。键为内容的哈希值，每一项存为一个 pickle 文件；
+    总大小超过上限时按最近使用的先后淘汰（使用时间记在文件的修改时间上，下次运行仍然有效）。
+    """
+    SUFFIX = '.pickle'
+
+    def __init__(self, directory: str = None, max_bytes: int = DEFAULT_MAX_BYTES):
+        """
+        :param directory: 缓存目录，默认为 ~/.cache/vmt-prototype/parse
+        :param max_bytes: 缓存总大小的上限（字节）
+        """
+        self.directory = directory or default_cache_dir('parse')
+        self.max_bytes = max_bytes
+        os.makedirs(self.directory, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.evictions = 0
+
+        # 键 -> 文件大小，按最近使用的先后排列（最旧的在前）
+        self.entries = OrderedDict()
+        existing = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(self.SUFFIX) and entry.is_file():
+                stat = entry.stat()
+                existing.append((stat.st_mtime, entry.name[:-len(self.SUFFIX)], stat.st_size))
+        for _, key, size in sorted(existing):
+            self.entries[key] = size
+        self.total_bytes = sum(self.entries.values())
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """
+        由若干部分（版本号、种类、原文等）算出键。
+        """
+        digest = hashlib.sha256()
+        for part in parts:
+            data = str(part).encode()
+            digest.update(len(data).to_bytes(8, 'little'))
+            digest.update(data)
+        return digest.hexdigest()
+
+    def __path(self, key: str) -> str:
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def get(self, key: str, default=None):
+        """
+        读取缓存。
+        :return: 缓存的对象，没有时返回 default。
+        """
+        if key not in self.entries:
+            self.misses += 1
+            return default
+        path = self.__path(key)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            value = pickle.loads(data)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):  # 文件损坏或已被删除
+            self.__remove(key)
+            self.misses += 1
+            return default
+        os.utime(path)
+        self.entries.move_to_end(key)
+        self.hits += 1
+        self.bytes_read += len(data)
+        return value
+
+    def put(self, key: str, value):
+        """
+        写入缓存，必要时淘汰最久未用的项。
+        """
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+        path = self.__path(key)
+        temp_path = '%s.%d.tmp' % (path, os.getpid())
+        try:
+            with open(temp_path, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            print('无法写入缓存：%s' % e, file=sys.stderr)
+            return
+        if key in self.entries:
+            self.total_bytes -= self.entries.pop(key)
+        self.entries[key] = len(data)
+        self.total_bytes += len(data)
+        self.bytes_written += len(data)
+        while self.total_bytes > self.max_bytes:
+            self.__remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def __remove(self, key: str):
+        self.total_bytes -= self.entries.pop(key)
+        try:
+            os.remove(self.__path(key))
+        except OSError:
+            pass
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'bytes_read': self.bytes_read,
+                'bytes_written': self.bytes_written, 'evictions': self.evictions,
+                'entries': len(self.entries), 'total_bytes': self.total_bytes}
+
+    def report(self) -> str:
+        return '缓存：命中 %d 次，未命中 %d 次，读取 %d 字节，写入 %d 字节，淘汰 %d 项，共 %d 项 %d 字节' % (
+            self.hits, self.misses, self.bytes_read, self.bytes_written, self.evictions,
+            len(self.entries), self.total_bytes)
@@ -0,0 +1,185 @@
+from array import array
+from typing import List
+
+from item_type import ItemType, TokenNode
+
+
+# 按编号排列的 ItemType，用于把数组中的整数换回枚举值
+ITEM_TYPES = list(ItemType)
+# 新建子结点时用来填充的 -1，按个数预先做好（推导式右侧最多 4 项）
+_MINUS_ONES = [array('i', [-1]) * count for count in range(8)]
+# 内容就是自身在原文中的位置的结点类型
+POSITION_TYPES = frozenset([ItemType.END_OF_LINE, ItemType.BRACE_LEFT, ItemType.BRACE_RIGHT])
+
+
+class ParseTree:
+    """
+    以数组存储的语法树。第 i 个结点的类型、父结点、子结点、在原文中的位置和内容分别存于各数组的第 i 项，
+    不必为每个结点建立一个对象。同一推导式的子结点总是连续分配的，因此子结点只需记录起点和个数。
+    没有的项用 -1 表示。
+    """
+    def __init__(self):
+        self.types = array('B')
+        self.parents = array('i')
+        self.first_child = array('i')
+        self.child_count = array('B')
+        self.starts = array('i')
+        self.ends = array('i')
+        self.payloads = array('i')  # 内容在 values 中的下标
+        self.values = []
+
+    def __len__(self):
+        return len(self.types)
+
+    def add_node(self, node_type: ItemType, parent: int = -1) -> int:
+        """
+        新建一个结点。
+        :return: 结点的编号
+        """
+        index = len(self.types)
+        self.types.append(node_type)
+        self.parents.append(parent)
+        self.first_child.append(-1)
+        self.child_count.append(0)
+        self.starts.append(-1)
+        self.ends.append(-1)
+        self.payloads.append(-1)
+        return index
+
+    def add_children(self, parent: int, node_types: List[ItemType]) -> int:
+        """
+        为 parent 新建连续的一组子结点。
+        :return: 第一个子结点的编号
+        """
+        first = len(self.types)
+        count = len(node_types)
+        minus_ones = _MINUS_ONES[count]
+        self.types.extend(node_types)
+        self.parents.extend(array('i', [parent]) * count)
+        self.first_child.extend(minus_ones)
+        self.child_count.extend(bytes(count))
+        self.starts.extend(minus_ones)
+        self.ends.extend(minus_ones)
+        self.payloads.extend(minus_ones)
+        self.first_child[parent] = first
+        self.child_count[parent] = count
+        return first
+
+    def set_value(self, index: int, value, start: int = None, end: int = None):
+        """
+        设置终结符结点的内容及其在原文中的位置。
+        """
+        if value is not None:
+            self.payloads[index] = len(self.values)
+            self.values.append(value)
+        self.starts[index] = -1 if start is None else start
+        self.ends[index] = -1 if end is None else end
+
+    def attach(self, parent: int, child: int):
+        """
+        把另外建立的一棵子树（如乐谱的第一个组）作为 parent 唯一的子结点。
+        """
+        self.parents[child] = parent
+        self.first_child[parent] = child
+        self.child_count[parent] = 1
+
+    def position_shift(self, index: int) -> int:
+        """
+        结点的位置（以及括号、行尾的内容）实际应加上的平移量。这里存的都是实际位置，为 0；
+        增量分析的语法树（见 `incremental.DocumentTree`）中各语句的位置是相对的。
+        """
+        return 0
+
+    def node(self, index: int) -> 'NodeView':
+        return NodeView(self, index)
+
+    def to_token_node(self, index: int = 0) -> TokenNode:
+        """
+        把子树转换成 TokenNode 组成的树。
+        """
+        return self.node(index).to_token_node()
+
+
+class NodeView:
+    """
+    ParseTree 中一个结点的视图，属性与 TokenNode 相同：
+    非终结符的 content 为子结点列表；终结符的 content 为其内容；
+    简谱、五线谱的 content 为 [第一个组的语法树, 音符列表]。
+    """
+    __slots__ = ('tree', 'index')
+
+    def __init__(self, tree: ParseTree, index: int):
+        self.tree = tree
+        self.index = index
+
+    @property
+    def type(self) -> ItemType:
+        return ITEM_TYPES[self.tree.types[self.index]]
+
+    @property
+    def start(self):
+        start = self.tree.starts[self.index]
+        return None if start < 0 else start + self.tree.position_shift(self.index)
+
+    @property
+    def end(self):
+        end = self.tree.ends[self.index]
+        return None if end < 0 else end + self.tree.position_shift(self.index)
+
+    @property
+    def parent(self):
+        parent = self.tree.parents[self.index]
+        return None if parent < 0 else NodeView(self.tree, parent)
+
+    @property
+    def children(self) -> List['NodeView']:
+        tree = self.tree
+        first = tree.first_child[self.index]
+        return [NodeView(tree, i) for i in range(first, first + tree.child_count[self.index])]
+
+    @property
+    def value(self):
+        """
+        结点本身存储的内容（不含子结点），没有时为 None。
+        """
+        tree = self.tree
+        payload = tree.payloads[self.index]
+        if payload < 0:
+            return None
+        if tree.types[self.index] in POSITION_TYPES:
+            return tree.values[payload] + tree.position_shift(self.index)
+        return tree.values[payload]
+
+    @property
+    def content(self):
+        if self.tree.child_count[self.index] == 0:
+            return self.value
+        if self.tree.payloads[self.index] < 0:
+            return self.children
+        return self.children + [self.value]
+
+    def to_token_node(self) -> TokenNode:
+        """
+        转换为 TokenNode 组成的树。
+        """
+        root = TokenNode(self.type, None, self.start, self.end)
+        stack = [(self, root)]
+        while len(stack) > 0:
+            view, node = stack.pop()
+            content = view.content
+            if view.tree.child_count[view.index] > 0:
+                for i, child in enumerate(content):
+                    if isinstance(child, NodeView):
+                        content[i] = TokenNode(child.type, None, child.start, child.end)
+                        stack.append((child, content[i]))
+            node.content = content
+        return root
+
+    def __eq__(self, other):
+        return isinstance(other, NodeView) and self.tree is other.tree and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.tree), self.index))
+
+    def __repr__(self):
+        return "{%s, %s}" % (self.type.name, str(self.content))
@@ -1,12 +1,18 @@
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from typing import Tuple, List, Dict
 
-from item_type import ItemType, TokenNode
+from item_type import ItemType, TokenNode, FIRST_NONTERMINAL
+from parse_tree import ParseTree, NodeView, ITEM_TYPES
+from tokenizer import match_braces
 import parser_jianpu
 import parser_staff
 import parser_lyric
 
 
 # 词典中每一项的键是栈顶-下一个字符的对，值是逆序存入的推导式右侧结果。
+# 分析时实际使用的是由它编成的 production_index 和 productions（见 compile_predict_table）。
 predict_table: Dict[Tuple[ItemType, ItemType], List[ItemType]] = {
     # 1
     (ItemType.DOCUMENT, ItemType.KEYWORD): [ItemType.DOCUMENT_SUFFIX, ItemType.CLAUSE],
@@ -61,22 +67,56 @@ predict_table: Dict[Tuple[ItemType, ItemType], List[ItemType]] = {
 }
 
 
+def compile_predict_table() -> Tuple[List[List[int]], List[List[ItemType]]]:
+    """
+    把 predict_table 编成稠密的二维表，使分析时每一步只需两次列表下标运算。
+    :return: (production_index, productions)。production_index[栈顶][下一个符号] 为推导式的编号，
+             没有相应推导式时为 -1；productions[编号] 为正序的推导式右侧。
+    """
+    productions = []
+    numbering = {}
+    production_index = [[-1] * len(ItemType) for _ in ItemType]
+    for (type_top, type_next), list_nodes in predict_table.items():
+        key = tuple(list_nodes)
+        if key not in numbering:
+            numbering[key] = len(productions)
+            productions.append(list(reversed(list_nodes)))
+        production_index[type_top][type_next] = numbering[key]
+    return production_index, productions
+
+
+production_index, productions = compile_predict_table()
+
+# 分析结果的格式有变化时增大此值，使磁盘缓存中旧的结果失效
+PARSER_VERSION = 7
+# 比这短的乐谱和歌词重新分析比读缓存文件还快，不必缓存。读一个缓存文件约 12～20 微秒，
+# 与分析三四十个字符的乐谱或歌词相当；一段乐谱、一行歌词一般有几十到一两百个字符，都会单独缓存
+MIN_CACHED_BLOCK = 32
+
+# 需要重新 tokenize 的关键词
+str_to_type = {'简谱': (ItemType.JIANPU, parser_jianpu.tokenize_sequence),
+               '五线谱': (ItemType.STAFF, parser_staff.tokenize_sequence),
+               '歌词中': (ItemType.LYRIC, parser_lyric.segment_cn),
+               '歌词英': (ItemType.LYRIC, parser_lyric.segment_en)}
+
+
 global original_text
+# 大括号配对表：左括号的下标 -> 相应右括号的下标
+global brace_pairs
+# 正在建立的语法树
+global tree
+# 并行模式下事先算好（或从缓存中读出）的乐谱和歌词：乐谱部分左括号的下标 -> 分析结果
+block_results: Dict[int, object] = {}
+# 磁盘缓存（见 `parse_cache.ParseCache`），为 None 时不用缓存
+cache = None
 
 
 def match_brace_close(index: int, tokens: List[TokenNode]) -> int:
-    depth = 1
-    while depth > 0:
-        index += 1
-        if index == len(tokens):
-            print('错误：括号未匹配')
-            exit(1)
-        current = tokens[index]
-        if current.type == ItemType.BRACE_LEFT:
-            depth += 1
-        elif current.type == ItemType.BRACE_RIGHT:
-            depth -= 1
-    return index
+    """
+    查找与 tokens[index] 处的左括号相配对的右括号。
+    :return: 右括号的下标
+    """
+    return brace_pairs[index]
 
 
 def match_music(index: int, tokens: List[TokenNode], node_type: ItemType, function)\
@@ -87,24 +127,23 @@ def match_music(index: int, tokens: List[TokenNode], node_type: ItemType, functi
     :param tokens:
     :param node_type:
     :param function:
-    :return:
+    :return: 结点的内容为 [第一个组的语法树在 tree 中的编号, 音符列表]
     """
     result = []
+    begin = index
     # 第一个括号
     if tokens[index].type != ItemType.BRACE_LEFT:
         print('错误：关键字后应有括号')
         exit(1)
-    end_point = match_brace_close(index + 1, tokens)
-    tokens[end_point].type = ItemType.END_OF_FILE
-    result.append(parse_impl(tokens[index + 1:end_point + 1]))
+    end_point = match_brace_close(index, tokens)
+    result.append(parse_impl(tokens, index + 1, end_point))
     index = end_point + 1
     if tokens[index].type != ItemType.BRACE_LEFT:
         print('错误：乐谱结构应有第二个组')
         exit(1)
-    end_point = match_brace_close(index + 1, tokens)
-    music_section = original_text[tokens[index].content + 1:tokens[end_point].content]
-    result.append(function(music_section))
-    result = TokenNode(node_type, result)
+    end_point = match_brace_close(index, tokens)
+    result.append(tokenize_block(index, end_point, tokens, function))
+    result = TokenNode(node_type, result, tokens[begin - 1].start, tokens[end_point].end)
     return result, end_point + 1
     pass
 
@@ -123,67 +162,228 @@ def match_lyric(index: int, tokens: List[TokenNode], node_type: ItemType, functi
     if tokens[index].type != ItemType.BRACE_LEFT:
         print('错误：关键字后应有括号')
         exit(1)
-    end_point = match_brace_close(index + 1, tokens)
-    lyric_section = original_text[tokens[index].content + 1:tokens[end_point].content]
-    result = function(lyric_section)
-    result = TokenNode(node_type, result)
+    end_point = match_brace_close(index, tokens)
+    result = tokenize_block(index, end_point, tokens, function)
+    result = TokenNode(node_type, result, tokens[index - 1].start, tokens[end_point].end)
     return result, end_point + 1
     pass
 
 
-def parse(tokens: List[TokenNode], _original_text: str) -> TokenNode:
-    global original_text
-    original_text = _original_text
+def tokenize_block(begin: int, end: int, tokens: List[TokenNode], function):
+    """
+    分析一对括号间的乐谱或歌词。并行模式下已经算好的直接取用，有缓存时先查缓存。
+    :param begin: 左括号的下标
+    :param end: 右括号的下标
+    :param tokens: Token 列表
+    :param function: 分析用的函数
+    :return: 分析结果
+    """
+    if begin in block_results:
+        return block_results.pop(begin)
+    section = original_text[tokens[begin].content + 1:tokens[end].content]
+    if cache is None or len(section) < MIN_CACHED_BLOCK:
+        return function(section)
+    key = block_key(function, section)
+    result = cache.get(key)
+    if result is None:
+        result = function(section)
+        cache.put(key, result)
+    return result
 
-    return parse_impl(tokens)
 
+def block_key(function, section: str) -> str:
+    """
+    乐谱或歌词在缓存中的键。歌词中、歌词英的分析函数在同一个模块中，因此要连函数名一起区分。
+    :param function: 分析用的函数
+    :param section: 乐谱部分的原文
+    """
+    return cache.make_key(PARSER_VERSION, '%s.%s' % (function.__module__, function.__qualname__), section)
 
-def parse_impl(tokens: List[TokenNode]) -> TokenNode:
-    pred_stack = [TokenNode(ItemType.END_OF_FILE, None)]
-    offset = 0
-    tree_root = TokenNode(ItemType.DOCUMENT, None)
-    pred_stack.append(tree_root)
 
-    str_to_type = {'简谱': (ItemType.JIANPU, parser_jianpu.tokenize),
-                   '五线谱': (ItemType.STAFF, parser_staff.tokenize),
-                   '歌词中': (ItemType.LYRIC, parser_lyric.tokenize_cn)}
+def collect_blocks(tokens: List[TokenNode]) -> List[Tuple[int, str, str]]:
+    """
+    找出所有需要重新 tokenize 的乐谱和歌词。格式不对的直接跳过，留到分析时再报错。
+    :param tokens: Token 列表
+    :return: 列表，每一项为 (乐谱部分左括号的下标, 关键词, 乐谱部分的原文)。
+    """
+    result = []
+    skip = {}  # 乐谱部分不必再找：左括号的下标 -> 右括号的下标
+    index = 0
+    length = len(tokens)
+    while index < length:
+        if index in skip:
+            index = skip[index] + 1
+            continue
+        token = tokens[index]
+        if token.type is ItemType.KEYWORD and token.content in str_to_type:
+            begin = index + 1
+            if token.content[0] != '歌' and tokens[begin].type is ItemType.BRACE_LEFT:  # 跳过第一个组
+                begin = brace_pairs[begin] + 1
+            if begin < length and tokens[begin].type is ItemType.BRACE_LEFT:
+                end = brace_pairs[begin]
+                result.append((begin, token.content,
+                               original_text[tokens[begin].content + 1:tokens[end].content]))
+                skip[begin] = end
+        index += 1
+    return result
+
+
+def _tokenize_block_job(job: Tuple[str, str]):
+    keyword, section = job
+    return str_to_type[keyword][1](section)
+
+
+def tokenize_blocks_parallel(tokens: List[TokenNode], max_workers: int = None):
+    """
+    把所有乐谱和歌词分给多个进程（无 GIL 的 Python 上用线程）同时分析，结果存入 block_results。
+    :param tokens: Token 列表
+    :param max_workers: 进程或线程数，默认为 CPU 数。
+    """
+    blocks = collect_blocks(tokens)
+    if cache is not None:  # 缓存中有的就不必再算
+        remaining = []
+        for block in blocks:
+            begin, keyword, section = block
+            if len(section) < MIN_CACHED_BLOCK:
+                remaining.append(block)
+                continue
+            result = cache.get(block_key(str_to_type[keyword][1], section))
+            if result is None:
+                remaining.append(block)
+            else:
+                block_results[begin] = result
+        blocks = remaining
+    if len(blocks) == 0:
+        return
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    gil_enabled = getattr(sys, '_is_gil_enabled', lambda: True)()
+    executor_class = ProcessPoolExecutor if gil_enabled else ThreadPoolExecutor
+    with executor_class(max_workers) as executor:
+        # 每块都很小，成批发送以减少进程间通信
+        chunk_size = max(1, len(blocks) // (max_workers * 4))
+        results = executor.map(_tokenize_block_job, [(keyword, section) for _, keyword, section in blocks],
+                               chunksize=chunk_size)
+        for (begin, keyword, section), result in zip(blocks, results):
+            block_results[begin] = result
+            if cache is not None and len(section) >= MIN_CACHED_BLOCK:
+                cache.put(block_key(str_to_type[keyword][1], section), result)
+
+
+def parse(tokens: List[TokenNode], _original_text: str, _brace_pairs: Dict[int, int] = None,
+          parallel: bool = False, max_workers: int = None, _cache=None) -> NodeView:
+    """
+    语法分析。
+    :param tokens: Token 列表
+    :param _original_text: 全文
+    :param _brace_pairs: 大括号配对表（见 `tokenizer.tokenize_with_braces`），没有时重新计算。
+    :param parallel: 是否先并行分析所有乐谱和歌词。为 False 时逐个串行分析。
+    :param max_workers: 并行时的进程或线程数，默认为 CPU 数。
+    :param _cache: 磁盘缓存（见 `parse_cache.ParseCache`）。整篇文档和各个乐谱、歌词分别缓存，
+                   因此修改过的文档只需重新分析改动了的乐谱和歌词；短于 MIN_CACHED_BLOCK 个字符的乐谱和歌词
+                   不单独缓存，每次都重新分析。
+    :return: 语法树的根结点（数组存储，见 `parse_tree.ParseTree`）
+    """
+    global cache
+    cache = _cache
+    if cache is not None:
+        document_key = cache.make_key(PARSER_VERSION, 'document', _original_text)
+        cached_tree = cache.get(document_key)
+        if cached_tree is not None:
+            return cached_tree.node(0)
+    result = ParseTree()
+    root = parse_into(result, tokens, _original_text, _brace_pairs, _cache, parallel, max_workers)
+    if cache is not None:
+        cache.put(document_key, result)
+    return result.node(root)
+
+
+def parse_into(_tree: ParseTree, tokens: List[TokenNode], _original_text: str,
+               _brace_pairs: Dict[int, int] = None, _cache=None, parallel: bool = False,
+               max_workers: int = None) -> int:
+    """
+    语法分析，结点建在已有的语法树中（增量分析时用来重新分析文档的一部分）。参数同 `parse`。
+    :param _tree: 语法树
+    :return: 新建的根结点的编号
+    """
+    global original_text, brace_pairs, tree, cache
+    original_text = _original_text
+    tree = _tree
+    cache = _cache
+    brace_pairs = _brace_pairs if _brace_pairs is not None else match_braces(tokens)
+
+    block_results.clear()
+    if parallel:
+        tokenize_blocks_parallel(tokens, max_workers)
+    try:
+        return parse_impl(tokens)
+    finally:
+        block_results.clear()
+
+
+def parse_impl(tokens: List[TokenNode], begin: int = 0, end: int = None) -> int:
+    """
+    对 tokens[begin:end] 做 LL(1) 分析，结点建在 tree 中。tokens 本身不会被修改，只是用一个下标在上面移动；
+    简谱、五线谱和歌词则在读到时就地换成整体的结点，然后直接跳到相应的右括号之后。
+    :param tokens: Token 列表
+    :param begin: 开始位置
+    :param end: 结束位置，此处视为文档结束。默认为最后一个 Token（即 END_OF_FILE）。
+    :return: 语法树的根结点在 tree 中的编号
+    """
+    if end is None:
+        end = len(tokens) - 1
+    end_of_file = TokenNode(ItemType.END_OF_FILE, None)
+    tree_root = tree.add_node(ItemType.DOCUMENT)
+    types = tree.types
+    # 栈中存放结点编号，栈底的 -1 代表文档结束
+    pred_stack = [-1, tree_root]
 
-    type_next = tokens[0].type
+    # current 是当前位置的 Token（或者替换后的乐谱结点），next_offset 是它后面的位置
+    offset = begin
+    current = tokens[offset] if offset < end else end_of_file
+    next_offset = offset + 1
+    type_next = current.type
+    keyword = ItemType.KEYWORD
+    empty = ItemType.EMPTY
+    jianpu = ItemType.JIANPU
+    staff = ItemType.STAFF
     while len(pred_stack) > 1:
         # 遇到简谱、五线谱和歌词就重新tokenize
-        if type_next == ItemType.KEYWORD:
-            if tokens[offset].content in ['简谱', '五线谱', '歌词中']:
-                type_next, fun_next = str_to_type[tokens[offset].content]
-                if tokens[offset].content[0] == '歌':
-                    node, index = match_lyric(offset + 1, tokens, type_next, fun_next)
-                else:
-                    node, index = match_music(offset + 1, tokens, type_next, fun_next)
-                tokens = [*tokens[:offset], node, *tokens[index:]]
+        if type_next is keyword and current.content in str_to_type:
+            type_next, fun_next = str_to_type[current.content]
+            if current.content[0] == '歌':
+                current, next_offset = match_lyric(offset + 1, tokens, type_next, fun_next)
+            else:
+                current, next_offset = match_music(offset + 1, tokens, type_next, fun_next)
 
         # 先判断可不可以移出符号
-        type_top = pred_stack[-1].type
+        top = pred_stack[-1]
+        type_top = types[top]
         if type_top == type_next:
-            pred_stack[-1].content = tokens[offset].content
+            if type_next is jianpu or type_next is staff:
+                tree.attach(top, current.content[0])
+                tree.set_value(top, current.content[1], current.start, current.end)
+            else:
+                tree.set_value(top, current.content, current.start, current.end)
             pred_stack.pop()
-            offset += 1
-            type_next = tokens[offset].type
+            offset = next_offset
+            current = tokens[offset] if offset < end else end_of_file
+            next_offset = offset + 1
+            type_next = current.type
             continue
         # 如果栈顶的终结符不匹配，直接报错
-        if type_top.is_terminal():
-            print('需要 %s 类型，但相应的 Token 为 %s' % (type_top[9:], tokens[offset]))
+        if type_top < FIRST_NONTERMINAL:
+            print('需要 %s 类型，但相应的 Token 为 %s' % (ITEM_TYPES[type_top].name, current))
             exit(1)
 
-        if (type_top, type_next) not in predict_table.keys():
+        production = production_index[type_top][type_next]
+        if production < 0:
             print('代码语法有错误，但是报错部分还没写')
             exit(1)
-        list_nodes = predict_table[(type_top, type_next)]
-        old_top = pred_stack[-1]
         pred_stack.pop()
-        old_top.content = []
-        for i in list_nodes:
-            old_top.content.append(TokenNode(i, None))
-        if list_nodes[0] != ItemType.EMPTY:
-            pred_stack.extend(old_top.content)
-            old_top.content.reverse()
+        list_nodes = productions[production]
+        first = tree.add_children(top, list_nodes)
+        if list_nodes[0] is not empty:
+            pred_stack.extend(range(first + len(list_nodes) - 1, first - 1, -1))
 
     return tree_root
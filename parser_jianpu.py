@@ -1,6 +1,33 @@
+import re
+from array import array
+from itertools import accumulate, product, repeat
 from typing import List
 from item_type import ItemType, TokenNode
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 音符连同其后的增减八度和减时线，规则与 tokenize 相同：数字后面依次可有一个增减八度的符号和一个减时线的符号，
+# 增时线单独一个“-”，其余字符跳过。这两种符号都不是数字或“-”，因此每个 0～7 和“-”都是一个音符的开头。
+_note_pattern = re.compile(r'[0-7][;:,\'"`]?[_=/\\]?|-')
+_digit_pattern = re.compile(r'[0-7-]')
+_OCTAVE_VALUES = {'': 0, ';': -4, ':': -3, ',': -2, '\'': 1, '"': 2, '`': 3}
+_UNDERLINE_VALUES = {'': 0, '_': 1, '=': 2, '/': 3, '\\': 4}
+# 音符的原文（如 "5'_"）-> 音符、增减八度、减时线，所有组合预先算好
+_NOTE_OF = {}
+_OCTAVE_OF = {}
+_UNDERLINE_OF = {}
+for _digit, _octave, _underline in product('01234567', _OCTAVE_VALUES, _UNDERLINE_VALUES):
+    _NOTE_OF[_digit + _octave + _underline] = int(_digit)
+    _OCTAVE_OF[_digit + _octave + _underline] = _OCTAVE_VALUES[_octave]
+    _UNDERLINE_OF[_digit + _octave + _underline] = _UNDERLINE_VALUES[_underline]
+_NOTE_OF['-'] = -1
+_OCTAVE_OF['-'] = 0
+_UNDERLINE_OF['-'] = 0
+
 
 class JianpuNote:
     # 音符：note为数字（1～7），octave为上下加点数目（正上，负下，零不加），underline为减时线数目
@@ -38,8 +65,134 @@ def tokenize(content: str) -> List[TokenNode]:
                 break
             index = '_=/\\'.find(content[pos + 1])
             if index >= 0:
-                result[-1].content.underline = index
+                result[-1].content.underline = index + 1
                 pos += 1
+        elif current_char == '-':
+            result.append(TokenNode(ItemType.JIANPU_NOTE, JianpuNote(-1, 0, 0)))
         pos += 1
 
     return result
+
+
+class JianpuSequence:
+    """
+    以数组存储的简谱音符序列。音符、增减八度、减时线和在原文中的位置分别存于各数组，不必为每个音符建立对象。
+    取下标或迭代时得到 JianpuNoteView，与 tokenize 结果中的 TokenNode 用法相同。
+    """
+    __slots__ = ('notes', 'octaves', 'underlines', 'offsets')
+
+    def __init__(self, notes: array = None, octaves: array = None, underlines: array = None,
+                 offsets: array = None):
+        self.notes = array('b') if notes is None else notes
+        self.octaves = array('b') if octaves is None else octaves
+        self.underlines = array('b') if underlines is None else underlines
+        self.offsets = array('i') if offsets is None else offsets  # 音符数字在乐谱部分原文中的位置
+
+    def __len__(self):
+        return len(self.notes)
+
+    def __getitem__(self, index: int) -> 'JianpuNoteView':
+        if index < 0:
+            index += len(self.notes)
+        if not 0 <= index < len(self.notes):
+            raise IndexError('音符下标越界')
+        return JianpuNoteView(self, index)
+
+    def __iter__(self):
+        return map(JianpuNoteView, repeat(self), range(len(self.notes)))
+
+    def __getstate__(self):
+        return self.notes, self.octaves, self.underlines, self.offsets
+
+    def __setstate__(self, state):
+        self.notes, self.octaves, self.underlines, self.offsets = state
+
+    def as_numpy(self) -> dict:
+        """
+        以 NumPy 数组的形式取出各数组（不复制）。
+        :return: 键为 note、octave、underline、offset 的字典；没有安装 NumPy 时为 None。
+        """
+        if numpy is None:
+            return None
+        return {'note': numpy.frombuffer(self.notes, dtype=numpy.int8),
+                'octave': numpy.frombuffer(self.octaves, dtype=numpy.int8),
+                'underline': numpy.frombuffer(self.underlines, dtype=numpy.int8),
+                'offset': numpy.frombuffer(self.offsets, dtype=numpy.int32)}
+
+    def to_token_nodes(self) -> List[TokenNode]:
+        """
+        转换为 tokenize 的结果。
+        """
+        return [TokenNode(ItemType.JIANPU_NOTE, JianpuNote(note, octave, underline))
+                for note, octave, underline in zip(self.notes, self.octaves, self.underlines)]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class JianpuNoteView:
+    """
+    JianpuSequence 中一个音符的视图。type、content 与 tokenize 结果中的 TokenNode 相同
+    （content 每次新建一个 JianpuNote），也可以直接取 note、octave、underline、start、end。
+    """
+    __slots__ = ('sequence', 'index')
+
+    def __init__(self, sequence: JianpuSequence, index: int):
+        self.sequence = sequence
+        self.index = index
+
+    @property
+    def type(self) -> ItemType:
+        return ItemType.JIANPU_NOTE
+
+    @property
+    def note(self) -> int:
+        return self.sequence.notes[self.index]
+
+    @property
+    def octave(self) -> int:
+        return self.sequence.octaves[self.index]
+
+    @property
+    def underline(self) -> int:
+        return self.sequence.underlines[self.index]
+
+    @property
+    def start(self) -> int:
+        return self.sequence.offsets[self.index]
+
+    @property
+    def end(self) -> int:
+        return self.sequence.offsets[self.index] + 1
+
+    @property
+    def content(self) -> JianpuNote:
+        sequence = self.sequence
+        index = self.index
+        return JianpuNote(sequence.notes[index], sequence.octaves[index], sequence.underlines[index])
+
+    def __eq__(self, other):
+        return isinstance(other, JianpuNoteView) and self.sequence is other.sequence and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.sequence), self.index))
+
+    def __repr__(self):
+        return "{%s, %s}" % (self.type.name, str(self.content))
+
+
+def tokenize_sequence(content: str) -> JianpuSequence:
+    """
+    与 tokenize 相同，但结果存为 JianpuSequence。用正则表达式一次找出所有音符，再查表整列换成数值，
+    不必逐个字符判断。
+    :param content: 乐谱部分的原文
+    :return: 音符序列
+    """
+    words = _note_pattern.findall(content)
+    # 相邻两个音符的开头之间隔着 len(gap) 个字符
+    gaps = _digit_pattern.split(content)
+    offsets = array('i', accumulate(map(len, gaps[:-1]), lambda offset, gap: offset + gap + 1, initial=-1))
+    return JianpuSequence(array('b', map(_NOTE_OF.__getitem__, words)),
+                          array('b', map(_OCTAVE_OF.__getitem__, words)),
+                          array('b', map(_UNDERLINE_OF.__getitem__, words)),
+                          offsets[1:])
@@ -1,3 +1,6 @@
+import re
+from array import array
+from itertools import chain, repeat
 from typing import List
 from item_type import ItemType, TokenNode
 
@@ -5,20 +8,126 @@ from item_type import ItemType, TokenNode
 left_punc = '([{‘“〔〈《「『【〖（［｛'
 right_punc = ')]}’”〕〉》」』】〗）］｝,:;、，：；!.?。！？'
 
+# 字与字之间的空白不属于任何一个字
+_SPACES = ' \t\n'
+_DELETE_SPACES = str.maketrans('', '', _SPACES)
+# 中文：一个字连同其后的标点为一个音节；左标点之后的字（不论是否隔着空白）也并入同一个音节
+_syllable_pattern_cn = re.compile(r'[^%s](?:(?<=[%s])[%s]*[^%s]|[%s]*[%s])*' % (
+    _SPACES, re.escape(left_punc), _SPACES, _SPACES, _SPACES, re.escape(right_punc)))
+# 西文：以空白分词，词中以连字符分音节，连字符留在前一个音节的末尾
+_syllable_pattern_en = re.compile(r'[^%s\-]+-*|-+' % _SPACES)
+
+
+class LyricSpans:
+    """
+    歌词的音节序列。各音节只记录在歌词原文中的起止位置，不复制原文；需要时才取出字符串。
+    取下标或迭代时得到 SyllableView，与 TokenNode 用法相同。
+    """
+    __slots__ = ('text', 'starts', 'ends')
+
+    def __init__(self, text: str, starts: array = None, ends: array = None):
+        self.text = text
+        self.starts = array('i') if starts is None else starts
+        self.ends = array('i') if ends is None else ends
+
+    def __len__(self):
+        return len(self.starts)
+
+    def __getitem__(self, index: int) -> 'SyllableView':
+        if index < 0:
+            index += len(self.starts)
+        if not 0 <= index < len(self.starts):
+            raise IndexError('音节下标越界')
+        return SyllableView(self, index)
+
+    def __iter__(self):
+        return map(SyllableView, repeat(self), range(len(self.starts)))
+
+    def string(self, index: int) -> str:
+        """
+        取出第 index 个音节（去掉其中的空白）。
+        """
+        result = self.text[self.starts[index]:self.ends[index]]
+        return result.translate(_DELETE_SPACES) if len(result) > 1 else result
+
+    def strings(self) -> List[str]:
+        """
+        取出所有音节。
+        """
+        text = self.text
+        result = list(map(text.__getitem__, map(slice, self.starts, self.ends)))
+        # 空白以外的字符都属于某个音节，总长对得上说明没有音节中间隔着空白
+        if sum(map(len, result)) != len(text) - sum(map(text.count, _SPACES)):
+            result = [string.translate(_DELETE_SPACES) for string in result]
+        return result
+
+    def to_token_nodes(self) -> List[TokenNode]:
+        """
+        转换为 tokenize_cn 的结果。
+        """
+        return list(map(TokenNode, repeat(ItemType.STRING), self.strings()))
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class SyllableView:
+    """
+    LyricSpans 中一个音节的视图。type 为 STRING，content 为音节的字符串（每次取时才切出）。
+    """
+    __slots__ = ('spans', 'index')
+
+    def __init__(self, spans: LyricSpans, index: int):
+        self.spans = spans
+        self.index = index
+
+    @property
+    def type(self) -> ItemType:
+        return ItemType.STRING
+
+    @property
+    def start(self) -> int:
+        return self.spans.starts[self.index]
+
+    @property
+    def end(self) -> int:
+        return self.spans.ends[self.index]
+
+    @property
+    def content(self) -> str:
+        return self.spans.string(self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, SyllableView) and self.spans is other.spans and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.spans), self.index))
+
+    def __repr__(self):
+        return "{%s, %s}" % (self.type.name, self.content)
+
+
+def segment(content: str, pattern) -> LyricSpans:
+    """
+    按 pattern 切分音节，只记录位置。
+    :param content: 歌词部分的原文
+    :param pattern: 匹配一个音节的正则表达式
+    """
+    spans = array('i', chain.from_iterable(map(re.Match.span, pattern.finditer(content))))
+    return LyricSpans(content, spans[0::2], spans[1::2])
+
+
+def segment_cn(content: str) -> LyricSpans:
+    return segment(content, _syllable_pattern_cn)
+
+
+def segment_en(content: str) -> LyricSpans:
+    return segment(content, _syllable_pattern_en)
+
 
 def tokenize_cn(content: str) -> List[TokenNode]:
-    content = content.replace('\n', ' ').lstrip()
-    length = len(content) - 1
-    result = [TokenNode(ItemType.STRING, content[0])]
-
-    pos = 0
-    while pos < length:
-        pos += 1
-        current_char = content[pos]
-        if current_char in ' \t':
-            continue
-        if current_char in right_punc or result[-1].content[-1] in left_punc:
-            result[-1].content += current_char
-        else:
-            result.append(TokenNode(ItemType.STRING, current_char))
-    return result
+    return segment_cn(content).to_token_nodes()
+
+
+def tokenize_en(content: str) -> List[TokenNode]:
+    return segment_en(content).to_token_nodes()
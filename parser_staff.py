@@ -1,6 +1,26 @@
+import re
+from array import array
+from itertools import accumulate, repeat
+from operator import add, sub
 from typing import List
 from item_type import ItemType, TokenNode
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 一个音符：顺序为音名-变音记号-增减八度-时值，前面是跳过的字符。
+# 各组依次为：跳过的字符、整个音符、音名、变音记号、增八度、减八度、时值。
+# a、e 的降号可以省去 e（as、ases、es、eses）。
+_note_pattern = re.compile(r"(.*?)(([a-g])(isis|is|eses|es|(?<=[ae])s(?:es)?)?('*)(,*)([0-9]*))", re.S)
+_ACCIDENTAL_VALUES = {'': 0, 'isis': 2, 'is': 1, 'eses': -2, 'es': -1, 'ses': -2, 's': -1}
+# 各音名在其八度中的半音数
+_SEMITONES = {'c': 0, 'd': 2, 'e': 4, 'f': 5, 'g': 7, 'a': 9, 'b': 11}
+# 八度以 c 开头，按 a～g 的顺序算八度时 a、b 要算到上面一个八度
+_IN_AB = {name: int(name in 'ab') for name in 'abcdefg'}
+
 
 class StaffNote:
     def __init__(self, note: str, accidental: int, octave: int, length: int):
@@ -23,68 +43,168 @@ class StaffNote:
 
 
 def calc_octave(old_note: StaffNote, new_name: str) -> int:
-    difference = ord(old_note.note) - ord(new_name)
-    result = old_note.octave + int((difference + 3.5) // 7.0)
-    if new_name in 'ab':
-        result -= 1
-    return result
+    """
+    相对音高：新音符取与前一个音符相差不超过四度的那个八度（不计增减八度的记号）。
+    """
+    # 先换成按 a～g 算的八度，此时两音名之差在 -3～3 之间时不跨八度
+    old_octave = old_note.octave + _IN_AB[old_note.note]
+    result = old_octave + (ord(old_note.note) - ord(new_name) + 3) // 7
+    return result - _IN_AB[new_name]
+
+
+# 前后两个音名（如 "fa"）-> 按 a～g 算的八度的变化
+_OCTAVE_STEPS = {old + new: calc_octave(StaffNote(old, 0, -_IN_AB[old], 0), new) + _IN_AB[new]
+                 for old in 'abcdefg' for new in 'abcdefg'}
+
+
+class StaffSequence:
+    """
+    以数组存储的五线谱音符序列。音名（ASCII 码）、变音记号、八度、时值和在原文中的位置分别存于各数组。
+    取下标或迭代时得到 StaffNoteView，与 tokenize 结果中的 TokenNode 用法相同。
+    """
+    __slots__ = ('names', 'accidentals', 'octaves', 'lengths', 'offsets')
+
+    def __init__(self, names: array = None, accidentals: array = None, octaves: array = None,
+                 lengths: array = None, offsets: array = None):
+        self.names = array('B') if names is None else names
+        self.accidentals = array('b') if accidentals is None else accidentals
+        self.octaves = array('h') if octaves is None else octaves
+        self.lengths = array('i') if lengths is None else lengths
+        self.offsets = array('i') if offsets is None else offsets  # 音名在乐谱部分原文中的位置
+
+    def __len__(self):
+        return len(self.names)
+
+    def __getitem__(self, index: int) -> 'StaffNoteView':
+        if index < 0:
+            index += len(self.names)
+        if not 0 <= index < len(self.names):
+            raise IndexError('音符下标越界')
+        return StaffNoteView(self, index)
+
+    def __iter__(self):
+        return map(StaffNoteView, repeat(self), range(len(self.names)))
+
+    def __getstate__(self):
+        return self.names, self.accidentals, self.octaves, self.lengths, self.offsets
+
+    def __setstate__(self, state):
+        self.names, self.accidentals, self.octaves, self.lengths, self.offsets = state
+
+    def pitches(self) -> array:
+        """
+        各音符的音高，以半音计，c 所在的第 0 个八度的 c 为 0。
+        """
+        semitones = map(_SEMITONES.__getitem__, self.names.tobytes().decode('ascii'))
+        return array('h', map(add, map(add, map((12).__mul__, self.octaves), semitones), self.accidentals))
+
+    def as_numpy(self) -> dict:
+        """
+        以 NumPy 数组的形式取出各数组（不复制）。
+        :return: 键为 name、accidental、octave、length、offset 的字典；没有安装 NumPy 时为 None。
+        """
+        if numpy is None:
+            return None
+        return {'name': numpy.frombuffer(self.names, dtype=numpy.uint8),
+                'accidental': numpy.frombuffer(self.accidentals, dtype=numpy.int8),
+                'octave': numpy.frombuffer(self.octaves, dtype=numpy.int16),
+                'length': numpy.frombuffer(self.lengths, dtype=numpy.int32),
+                'offset': numpy.frombuffer(self.offsets, dtype=numpy.int32)}
+
+    def to_token_nodes(self) -> List[TokenNode]:
+        """
+        转换为 tokenize 的结果。
+        """
+        return [TokenNode(ItemType.STAFF_NOTE, StaffNote(chr(name), accidental, octave, length))
+                for name, accidental, octave, length
+                in zip(self.names, self.accidentals, self.octaves, self.lengths)]
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class StaffNoteView:
+    """
+    StaffSequence 中一个音符的视图。type、content 与 tokenize 结果中的 TokenNode 相同
+    （content 每次新建一个 StaffNote），也可以直接取 note、accidental、octave、length、start。
+    """
+    __slots__ = ('sequence', 'index')
+
+    def __init__(self, sequence: StaffSequence, index: int):
+        self.sequence = sequence
+        self.index = index
+
+    @property
+    def type(self) -> ItemType:
+        return ItemType.STAFF_NOTE
+
+    @property
+    def note(self) -> str:
+        return chr(self.sequence.names[self.index])
+
+    @property
+    def accidental(self) -> int:
+        return self.sequence.accidentals[self.index]
+
+    @property
+    def octave(self) -> int:
+        return self.sequence.octaves[self.index]
+
+    @property
+    def length(self) -> int:
+        return self.sequence.lengths[self.index]
+
+    @property
+    def start(self) -> int:
+        return self.sequence.offsets[self.index]
+
+    @property
+    def content(self) -> StaffNote:
+        sequence = self.sequence
+        index = self.index
+        return StaffNote(chr(sequence.names[index]), sequence.accidentals[index], sequence.octaves[index],
+                         sequence.lengths[index])
+
+    def __eq__(self, other):
+        return isinstance(other, StaffNoteView) and self.sequence is other.sequence and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.sequence), self.index))
+
+    def __repr__(self):
+        return "{%s, %s}" % (self.type.name, str(self.content))
+
+
+def tokenize_sequence(content: str) -> StaffSequence:
+    """
+    分析五线谱。用正则表达式一次找出所有音符，再整列算出各项：
+    相对八度是各音符八度变化的累加，省略的时值沿用前一个音符的时值。
+    :param content: 乐谱部分的原文
+    :return: 音符序列
+    """
+    matches = _note_pattern.findall(content)
+    if len(matches) == 0:
+        return StaffSequence()
+    gaps, notes, names, accidentals, ups, downs, lengths = zip(*matches)
+    names = ''.join(names)
+
+    # 位置：到本音符为止的总长减去本音符的长度
+    note_lengths = list(map(len, notes))
+    offsets = map(sub, accumulate(map(add, map(len, gaps), note_lengths)), note_lengths)
+    # 八度：从 f 开始，每个音符相对前一个音符的变化加上增减八度的记号，累加后换回以 c 开头的八度
+    steps = map(_OCTAVE_STEPS.__getitem__, map(add, 'f' + names[:-1], names))
+    marks = map(sub, map(len, ups), map(len, downs))
+    octaves = map(sub, accumulate(map(add, steps, marks)), map(_IN_AB.__getitem__, names))
+    # 时值：没写的沿用前一个
+    lengths = accumulate(lengths, lambda previous, current: current or previous, initial='0')
+    next(lengths)
+
+    return StaffSequence(array('B', names.encode('ascii')),
+                         array('b', map(_ACCIDENTAL_VALUES.__getitem__, accidentals)),
+                         array('h', octaves),
+                         array('i', map(int, lengths)),
+                         array('i', offsets))
 
 
 def tokenize(content: str) -> List[TokenNode]:
-    length = len(content)
-    result = [TokenNode(ItemType.STAFF_NOTE, StaffNote('f', 0, 0, 0))]
-
-    pos = 0
-    while pos < length:
-        current_char = content[pos]
-        # 顺序：音名-变音记号-增减八度-时值
-        if current_char in 'abcdefg':
-            result.append(TokenNode(ItemType.STAFF_NOTE,
-                                    StaffNote(current_char, 0,
-                                              calc_octave(result[-1].content, current_char),
-                                              result[-1].content.length)))
-            if pos == length - 1:
-                break
-            pos += 1
-            # 升号及重升号
-            if pos + 4 < length and content[pos:pos + 4] == 'isis':
-                result[-1].content.accidental = 2
-                pos += 4
-            elif pos + 2 < length and content[pos:pos + 2] == 'is':
-                result[-1].content.accidental = 1
-                pos += 2
-            # 降号及重降号
-            elif (pos + 2 < length and content[pos:pos + 2] == 'es')\
-                    or (pos < length and result[-1].content.note in 'ae' and content[pos] == 's'):
-                result[-1].content.accidental = -1
-                if content[pos] == 's':
-                    pos += 1
-                else:
-                    pos += 2
-                if content[pos:pos+2] == 'es':
-                    result[-1].content.accidental = -2
-                    pos += 2
-            # 八度增减
-            if pos < length and content[pos] == '\'':
-                result[-1].content.octave += 1
-                pos += 1
-                while pos < length and content[pos] == '\'':
-                    result[-1].content.octave += 1
-                    pos += 1
-            elif pos < length and content[pos] == ',':
-                result[-1].content.octave -= 1
-                pos -= 1
-                while pos < length and content[pos] == ',':
-                    result[-1].content.octave -= 1
-                    pos += 1
-            if pos < length and content[pos] in '0123456789':
-                tmp = content[pos]
-                pos += 1
-                while pos < length and content[pos] in '0123456789':
-                    tmp += content[pos]
-                    pos += 1
-                result[-1].content.length = int(tmp)
-        pos += 1
-        pass
-
-    return result[1:]
+    return tokenize_sequence(content).to_token_nodes()
@@ -0,0 +1,88 @@
+import re
+from collections import OrderedDict
+from itertools import chain, repeat
+from operator import mul
+from typing import List, NamedTuple, Tuple
+
+from global_var import get_font_encoding
+
+
+# 默认最多缓存的词数
+DEFAULT_MAX_ENTRIES = 4096
+
+# 按空白切分西文：词与空白各为一段，连字和字偶距都不跨越空白
+_word_pattern = re.compile(r'\S+|\s+')
+
+
+class ShapedRun(NamedTuple):
+    """
+    排好的一段西文。各项都乘以了字号；字偶距为各字形与下一个字形之间的，最后一个为 0。不可修改，可以在缓存中共用。
+    """
+    gids: Tuple[int, ...]
+    advances: Tuple[float, ...]
+    kerns: Tuple[float, ...]
+    width: float
+
+
+def shape(font, size: float, text: str) -> ShapedRun:
+    """
+    排一段西文：查出 GID，做连字等替换，再查出宽度和字偶距。
+    :param font: 西文字体
+    :param size: 字号
+    :param text: 文字
+    """
+    gids = font.process_gsub_liga(font.get_gids(text))
+    # 有 NumPy 时宽度和字偶距为 NumPy 数组，换成 float 再存
+    advances = tuple(map(float, map(mul, font.get_glyph_widths(gids), repeat(size))))
+    kerns = tuple(chain(map(float, map(mul, font.get_kerns(gids), repeat(size))), [0.0] if len(gids) > 0 else []))
+    return ShapedRun(tuple(gids), advances, kerns, sum(advances) + sum(kerns))
+
+
+class ShapingCache:
+    """
+    西文的排版结果的缓存。歌词和正文中同样的词反复出现，每个词只排一次。
+    键为 (字体编号, 字号, 词)，字体编号见 `global_var.get_font_encoding`，换字体或字号后不会用到旧的结果。
+    超过上限时按最近使用的先后淘汰。
+    """
+    def __init__(self, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()  # 键 -> ShapedRun，最旧的在前
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def shape(self, font, size: float, word: str) -> ShapedRun:
+        """
+        :return: 排好的词，缓存中有时直接取出。
+        """
+        key = (get_font_encoding(font, size), size, word)
+        result = self.entries.get(key)
+        if result is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return result
+        self.misses += 1
+        result = shape(font, size, word)
+        self.entries[key] = result
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return result
+
+    def shape_text(self, font, size: float, text: str) -> List[ShapedRun]:
+        """
+        把一段西文按空白切分成词，逐个排版。
+        """
+        return [self.shape(font, size, word) for word in _word_pattern.findall(text)]
+
+    def clear(self):
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'entries': len(self.entries)}
+
+    def report(self) -> str:
+        return '排版缓存：命中 %d 次，未命中 %d 次，淘汰 %d 项，共 %d 项' % (
+            self.hits, self.misses, self.evictions, len(self.entries))
@@ -0,0 +1,41 @@
+import glob
+import struct
+
+
+# 测试用的系统字体，没有时相应的测试跳过
+DEJAVU_FONTS = sorted(glob.glob('/usr/share/fonts/truetype/dejavu/*.ttf'))
+# make_ttf 生成的字体中 H 的高度
+CAP_HEIGHT = 1400
+
+
+def make_ttf(filename: str, num_h_metrics: int = 27):
+    """
+    生成一个最小的 TrueType 字体：A～Z 对应 GID 1～26，只有 H 有轮廓，OS/2 表为版本 1（86 字节，没有 sCapHeight）。
+    :param num_h_metrics: hmtx 中前进宽度的个数，其余字形只记录左侧空白
+    """
+    num_glyphs = 27
+    end_codes, start_codes, deltas = [0x5A, 0xFFFF], [0x41, 0xFFFF], [1 - 0x41, 1]
+    cmap_subtable = struct.pack('>HHHHHHH', 4, 16 + 8 * len(end_codes), 0, 2 * len(end_codes), 4, 1, 0)
+    cmap_subtable += struct.pack('>2H', *end_codes) + bytes(2) + struct.pack('>2H', *start_codes)
+    cmap_subtable += struct.pack('>2h', *deltas) + bytes(4)
+    h_gid = ord('H') - 0x40
+    glyph = struct.pack('>hhhhh', 1, 100, 0, 900, CAP_HEIGHT) + bytes(12)
+    loca = [0] * (h_gid + 1) + [len(glyph) // 2] * (num_glyphs - h_gid)
+    tables = {
+        'OS/2': struct.pack('>H', 1) + bytes(66) + struct.pack('>h', 1900) + bytes(16),
+        'cmap': struct.pack('>HHHHI', 0, 1, 3, 1, 12) + cmap_subtable,
+        'glyf': glyph,
+        'head': bytes(18) + struct.pack('>H', 2048) + bytes(30) + struct.pack('>hh', 0, 0),
+        'hhea': bytes(34) + struct.pack('>H', num_h_metrics),
+        'hmtx': b''.join(struct.pack('>Hh', 1000 + gid, gid) for gid in range(num_h_metrics))
+        + b''.join(struct.pack('>h', gid) for gid in range(num_h_metrics, num_glyphs)),
+        'loca': struct.pack('>%dH' % len(loca), *loca),
+    }
+    data_offset = 12 + 16 * len(tables)
+    records = b''
+    data = b''
+    for tag in sorted(tables):
+        records += struct.pack('>4sIII', tag.encode('latin-1'), 0, data_offset + len(data), len(tables[tag]))
+        data += tables[tag] + bytes(-len(tables[tag]) % 4)
+    with open(filename, 'wb') as f:
+        f.write(struct.pack('>IHHHH', 0x10000, len(tables), 0, 0, 0) + records + data)
@@ -0,0 +1,65 @@
+import random
+
+from token_process import CharClass, classify
+
+
+def reference_is_cjk(char):
+    char = ord(char)
+    return 0x2460 <= char <= 0x24FF or 0x3000 <= char <= 0x318F or 0x3200 <= char <= 0x32FF or \
+        0x3400 <= char <= 0x34BF or 0x4E00 <= char <= 0x9FFF or 0xAC00 <= char <= 0xD7AF or \
+        0xF900 <= char <= 0xFAFF or 0x20000 <= char <= 0x2FFFF
+
+
+def reference_get_class(char):
+    # 原来逐个判断的做法（MATH_OP 已不再与 OTHER_PUNCT 同值）
+    if char in '([{‘“〔〈《「『【〖':
+        return CharClass.LEFT_PUNCT
+    if char in ')]}’”〕〉》」』】〗':
+        return CharClass.RIGHT_PUNCT
+    if char == '・':
+        return CharClass.MID_PUNCT
+    if char in ',:;、':
+        return CharClass.COMMAS
+    if char in '!.?。':
+        return CharClass.PERIODS
+    if char in '—…':
+        return CharClass.LONG_PUNCT
+    if char in '‐–':
+        return CharClass.OTHER_PUNCT
+    if char in '+−±×÷∓':
+        return CharClass.MATH_OP
+    if char in '<=>≠≒≈≡≢≤≥≪≫∧∨⊂⊃⊄⊅⊆⊇⊊⊋∈∋∉∪∩∥∦⇒⇔↔∽≌∝⊥⊕⊗':
+        return CharClass.MATH_REL
+    if reference_is_cjk(char):
+        return CharClass.IDEOGRAPHIC
+    return CharClass.WESTERN
+
+
+def sample_codes():
+    """
+    整个基本多文种平面，以及其他平面中各段的边界和随机抽取的字符。
+    """
+    rng = random.Random(0)
+    astral = [0x10000, 0x1FFFF, 0x20000, 0x20001, 0x2FFFE, 0x2FFFF, 0x30000, 0x30001, 0xE0001, 0x10FFFF]
+    astral.extend(rng.randrange(0x10000, 0x110000) for _ in range(20000))
+    return list(range(0x10000)) + astral
+
+
+def test_enum_values_are_distinct():
+    assert len({char_class.value for char_class in CharClass}) == len(CharClass.__members__)
+    assert CharClass.MATH_OP is not CharClass.OTHER_PUNCT
+
+
+def test_get_class_matches_reference():
+    mismatches = [hex(code) for code in sample_codes()
+                  if CharClass.get_class(chr(code)) != reference_get_class(chr(code))]
+    assert mismatches == []
+
+
+def test_classify_matches_get_class():
+    codes = [code for code in sample_codes() if not 0xD800 <= code < 0xE000]  # 代理项不能编码
+    text = ''.join(map(chr, codes))
+    assert list(classify(text)) == [CharClass.get_class(char).value for char in text]
+    bmp_text = ''.join(map(chr, codes[:0xD800]))  # 只有基本多文种平面时走另一条路
+    assert list(classify(bmp_text)) == [CharClass.get_class(char).value for char in bmp_text]
+    assert len(classify('')) == 0
@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from font_cache import FontMetricsCache, encode_metrics
+from font_files import CAP_HEIGHT, DEJAVU_FONTS, make_ttf
+from font_library import Font
+
+
+def assert_same_metrics(font: Font, cached: Font):
+    assert cached.upm == font.upm
+    assert cached.ascent == font.ascent
+    assert cached.caps_height == font.caps_height
+    assert cached.is_cid == font.is_cid
+    assert list(cached.get_gids(range(0x10000))) == list(font.get_gids(range(0x10000)))
+    assert list(cached.hmtx) == list(font.hmtx)
+    assert list(cached.left_side_bearings) == list(font.left_side_bearings)
+    assert [[list(item) for item in lookup.arrays()] for lookup in cached.gsub] == \
+        [[list(item) for item in lookup.arrays()] for lookup in font.gsub]
+
+
+@pytest.fixture
+def os2_v1_font(tmp_path):
+    filename = str(tmp_path / 'test.ttf')
+    make_ttf(filename)
+    return filename
+
+
+def test_caps_height_without_os2_cap_height(os2_v1_font):
+    assert Font(os2_v1_font, 0, True).caps_height == CAP_HEIGHT
+
+
+def test_cache_round_trip_os2_v1(os2_v1_font, tmp_path):
+    directory = str(tmp_path / 'cache')
+    cache = FontMetricsCache(directory)
+    written = Font(os2_v1_font, 0, True, metrics_cache=cache)
+    assert cache.misses == 1
+
+    cache = FontMetricsCache(directory)
+    cached = Font(os2_v1_font, 0, True, metrics_cache=cache)
+    assert cache.hits == 1
+    assert 'caps_height' in cached.__dict__  # 取自缓存，未读 OS/2 表
+    font = Font(os2_v1_font, 0, True)
+    assert_same_metrics(font, written)
+    assert_same_metrics(font, cached)
+
+
+@pytest.mark.parametrize('num_h_metrics', [27, 26, 25, 1])
+def test_cache_round_trip_hmtx_lengths(tmp_path, num_h_metrics):
+    # 前进宽度和左侧空白共有奇数个或偶数个，其后的 GSUB 部分都要对齐到 4 字节
+    filename = str(tmp_path / 'test.ttf')
+    make_ttf(filename, num_h_metrics)
+    font = Font(filename, 0, True)
+    widths, left_side_bearings = font.read_hmtx()
+    assert (len(widths), len(left_side_bearings)) == (num_h_metrics, 27)
+    assert len(encode_metrics(font, 0, os.stat(filename))) % 4 == 0
+
+    directory = str(tmp_path / 'cache')
+    Font(filename, 0, True, metrics_cache=FontMetricsCache(directory))
+    cache = FontMetricsCache(directory)
+    cached = Font(filename, 0, True, metrics_cache=cache)
+    assert cache.hits == 1
+    assert_same_metrics(font, cached)
+
+
+def test_cache_skips_broken_font(os2_v1_font, tmp_path, capsys):
+    # 缓存编码失败时字体照常打开
+    with open(os2_v1_font, 'r+b') as f:
+        data = f.read().replace(b'OS/2', b'OS/X', 1)
+        f.seek(0)
+        f.write(data)
+    cache = FontMetricsCache(str(tmp_path / 'cache'))
+    font = Font(os2_v1_font, 0, True, metrics_cache=cache)
+    assert font.get_gid(ord('H')) == ord('H') - 0x40
+    assert '无法缓存字体' in capsys.readouterr().err
+
+
+@pytest.mark.skipif(len(DEJAVU_FONTS) == 0, reason='没有 DejaVu 字体')
+@pytest.mark.parametrize('filename', DEJAVU_FONTS[:2])
+def test_cache_round_trip_dejavu(filename, tmp_path):
+    directory = str(tmp_path / 'cache')
+    Font(filename, 0, True, metrics_cache=FontMetricsCache(directory))
+    cache = FontMetricsCache(directory)
+    cached = Font(filename, 0, True, metrics_cache=cache)
+    assert cache.hits == 1
+    assert_same_metrics(Font(filename, 0, True), cached)
@@ -0,0 +1,106 @@
+import random
+
+import pytest
+
+from font_files import DEJAVU_FONTS
+from font_library import Font
+from gsub import DEFAULT_SCRIPTS
+
+ttLib = pytest.importorskip('fontTools.ttLib')
+
+FONTS = [name for name in DEJAVU_FONTS if name.endswith(('/DejaVuSans.ttf', '/DejaVuSerif-Bold.ttf'))]
+
+
+class ReferenceKerning:
+    """
+    用 fontTools 读出的 GPOS 表逐对查字偶距：取 DEFAULT_SCRIPTS 中第一个有默认语言的文种，
+    其 kern 特性的各 lookup 中第一个含有这一字偶的子表有效，各 lookup 的调整量相加。
+    """
+    def __init__(self, filename: str):
+        font = ttLib.TTFont(filename)
+        self.glyph_order = font.getGlyphOrder()
+        table = font['GPOS'].table
+        scripts = {record.ScriptTag: record.Script for record in table.ScriptList.ScriptRecord}
+        features = range(len(table.FeatureList.FeatureRecord))
+        for tag in DEFAULT_SCRIPTS + tuple(scripts):
+            lang_sys = scripts[tag].DefaultLangSys if tag in scripts else None
+            if lang_sys is not None:
+                features = list(lang_sys.FeatureIndex)
+                if lang_sys.ReqFeatureIndex != 0xFFFF:
+                    features.append(lang_sys.ReqFeatureIndex)
+                break
+        indices = sorted({index for feature in features
+                          if table.FeatureList.FeatureRecord[feature].FeatureTag == 'kern'
+                          for index in table.FeatureList.FeatureRecord[feature].Feature.LookupListIndex})
+        self.lookups = []
+        for index in indices:
+            lookup = table.LookupList.Lookup[index]
+            subtables = [subtable.ExtSubTable if lookup.LookupType == 9 else subtable
+                         for subtable in lookup.SubTable]
+            self.lookups.append([(subtable, {name: i for i, name in enumerate(subtable.Coverage.glyphs)})
+                                 for subtable in subtables if subtable.LookupType == 2])
+        self.firsts = sorted({font.getGlyphID(name) for subtables in self.lookups
+                              for _, coverage in subtables for name in coverage})
+        seconds = set()
+        for subtables in self.lookups:
+            for subtable, _ in subtables:
+                if subtable.Format == 1:
+                    seconds.update(record.SecondGlyph for pair_set in subtable.PairSet
+                                   for record in pair_set.PairValueRecord)
+                else:
+                    seconds.update(subtable.ClassDef2.classDefs)
+        self.seconds = sorted(map(font.getGlyphID, seconds))
+
+    @staticmethod
+    def advance(value) -> int:
+        return (getattr(value, 'XAdvance', 0) or 0) if value is not None else 0
+
+    def kern(self, first: int, second: int) -> int:
+        first = self.glyph_order[first]
+        second = self.glyph_order[second]
+        total = 0
+        for subtables in self.lookups:
+            for subtable, coverage in subtables:
+                if first not in coverage:
+                    continue
+                if subtable.Format == 1:
+                    records = subtable.PairSet[coverage[first]].PairValueRecord
+                    values = [record.Value1 for record in records if record.SecondGlyph == second]
+                    if len(values) == 0:
+                        continue
+                    total += self.advance(values[0])
+                else:
+                    class1 = subtable.ClassDef1.classDefs.get(first, 0)
+                    class2 = subtable.ClassDef2.classDefs.get(second, 0)
+                    total += self.advance(subtable.Class1Record[class1].Class2Record[class2].Value1)
+                break
+        return total
+
+
+def sample_pairs(reference: ReferenceKerning, count: int):
+    """
+    随机抽取字偶。大多数字偶没有调整，因此第一个、第二个字形各有一半取自子表中出现的字形。
+    """
+    rng = random.Random(0)
+    num_glyphs = len(reference.glyph_order)
+    pairs = []
+    for _ in range(count):
+        first = rng.choice(reference.firsts) if rng.random() < 0.5 else rng.randrange(num_glyphs)
+        second = rng.choice(reference.seconds) if rng.random() < 0.5 else rng.randrange(num_glyphs)
+        pairs.append((first, second))
+    return pairs
+
+
+@pytest.mark.skipif(len(FONTS) == 0, reason='没有 DejaVu 字体')
+@pytest.mark.parametrize('filename', FONTS)
+def test_kerning_matches_fonttools(filename):
+    reference = ReferenceKerning(filename)
+    table = Font(filename, 0, True).gpos
+    pairs = sample_pairs(reference, 20000)
+    expected = [reference.kern(first, second) for first, second in pairs]
+    assert sum(value != 0 for value in expected) > 200  # 确实抽到了有调整的字偶
+    assert [table.get_kern(first, second) for first, second in pairs] == expected
+
+    # 成批查找：把各字偶连成一串，取其中相邻两个字形间的调整量
+    gids = [gid for pair in pairs for gid in pair]
+    assert list(table.get_kerns(gids))[::2] == expected
@@ -0,0 +1,69 @@
+from benchmark import make_document
+from incremental import Document
+from parser import parse
+from tokenizer import tokenize_with_braces
+from trees import signature
+
+
+def full_parse(text: str):
+    tokens, pairs = tokenize_with_braces(text)
+    return parse(tokens, text, pairs)
+
+
+def replace(document: Document, old: str, new: str, start: int = 0):
+    """
+    把文档中 start 之后第一处 old 换成 new，并检查结果与重新分析全文相同。
+    """
+    text = document.text
+    offset = text.index(old, start)
+    expected = text[:offset] + new + text[offset + len(old):]
+    root = document.edit(offset, len(old), new)
+    assert document.text == expected
+    assert signature(root) == signature(full_parse(expected))
+
+
+def test_edits_match_full_parse():
+    document = Document(make_document(12, 1))
+    assert signature(document.parse_tree) == signature(full_parse(document.text))
+
+    # 在歌词中逐字输入
+    offset = document.text.index('人间。') + len('人间。')
+    for i, char in enumerate('你好，世界'):
+        expected = document.text[:offset + i] + char + document.text[offset + i:]
+        assert signature(document.edit(offset + i, 0, char)) == signature(full_parse(expected))
+    replace(document, "6= 2=", "7= 2=")  # 乐谱
+    replace(document, '"思源宋体 Light"', '"思源宋体 Bold"')  # 字符串
+    replace(document, '  宽度 = 170mm\n', '  宽度 = 170mm; 音符字号 = 12\n  % 注释\n')  # 括号内的行尾
+    replace(document, '}\n谱表', '};谱表')  # 顶层的行尾换成分号
+    replace(document, '}\n歌词', '}\n\n\n歌词')  # 语句间的空行
+
+
+def test_edits_that_add_or_remove_clauses():
+    document = Document(make_document(12, 1))
+    clause = '歌词9 = 歌词英 {\n  Twinkle twinkle little star\n}\n'
+    replace(document, '谱表 {', clause + '谱表 {')  # 插入语句
+    replace(document, clause, '')  # 删除语句
+    replace(document, '谱表 {\n  谱行1, 谱行0{歌词-1}\n}\n', '')
+    # 跨越两个语句的修改
+    replace(document, '人间。\n}\n谱行3 = 简谱 { 拍号 = 4/4 } {\n  6= 2=', '人间')
+    replace(document, '我是笨蛋', '我是笨蛋\n}\n歌词10 = 歌词中 {\n  我')
+    # 文档末尾
+    replace(document, document.text[-40:], document.text[-40:] + clause)
+    replace(document, clause, clause[:-1])
+    replace(document, 'little', 'little little', len(document.text) - len(clause))
+    # 行尾落在注释中，要连同后面的语句一起分析，由后面的空行作为行尾
+    replace(document, '}\n谱行', '}\n\n谱行')
+    replace(document, '}\n\n谱行', '} % 注释\n\n谱行')
+    # 整篇文档换掉
+    replace(document, document.text, clause)
+    replace(document, 'star', 'star\n}\n' + clause[:-3])
+
+
+def test_arena_is_compacted():
+    document = Document(make_document(8, 2))
+    offset = document.text.index('人间。') + len('人间。')
+    for i in range(3000):
+        document.edit(offset + i, 0, '啊')
+    assert len(document.tree) <= 2 * len(full_parse(document.text).tree) + 4096
+    assert len(document.tree.values) <= len(document.tree)
+    assert signature(document.parse_tree) == signature(full_parse(document.text))
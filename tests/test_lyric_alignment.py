@@ -0,0 +1,46 @@
+import parser_jianpu
+import parser_lyric
+import parser_staff
+from lyric_alignment import align_lyrics, score_lyrics, singable_notes
+from parser import parse
+from tokenizer import tokenize_with_braces
+
+
+# 第 2 个音符是休止符，第 4、8 个是增时线，都不配歌词
+JIANPU = '1 2 0 3 - 4 5_ 6_ - 0'
+
+
+def test_align_jianpu():
+    sequence = parser_jianpu.tokenize_sequence(JIANPU)
+    assert list(singable_notes(sequence)) == [0, 1, 3, 5, 6, 7]
+    short, exact, long = align_lyrics(sequence, [parser_lyric.segment_cn('一二三'),
+                                                 parser_lyric.segment_cn('一二三四五六'),
+                                                 parser_lyric.segment_cn('我是笨蛋，我是傻子。')])
+    assert list(short) == [0, 1, 3]
+    assert list(exact) == [0, 1, 3, 5, 6, 7]
+    # 音节比音符多，多出来的配 -1
+    assert list(long) == [0, 1, 3, 5, 6, 7, -1, -1]
+
+
+def test_align_staff():
+    sequence = parser_staff.tokenize_sequence('c4 d e8 f g2')
+    verses = [parser_lyric.segment_en('twinkle twinkle little star'),
+              parser_lyric.segment_en('how I wonder what you are')]
+    assert [list(mapping) for mapping in align_lyrics(sequence, verses)] == [[0, 1, 2, 3], [0, 1, 2, 3, 4, -1]]
+    assert align_lyrics(sequence, []) == []
+    assert list(align_lyrics(parser_staff.tokenize_sequence(''), verses[:1])[0]) == [-1] * 4
+
+
+def test_score_lyrics():
+    # 同一行在谱表中配了两段歌词，依次为第一段、第二段；没配歌词的行不出现在结果中
+    content = ('谱行1 = 简谱 { 拍号 = 4/4 } {\n  %s\n}\n'
+               '谱行2 = 五线谱 { 拍号 = 4/4 } {\n  c4 d e\n}\n'
+               '歌词1 = 歌词中 {\n  一二三四\n}\n'
+               '歌词2 = 歌词中 {\n  我是笨蛋，我是傻子。\n}\n'
+               '谱表 {\n  谱行1{歌词1}, 谱行1{歌词2}, 谱行2\n}\n'
+               '谱表 {\n  谱行2{歌词2}\n}\n' % JIANPU)
+    tokens, pairs = tokenize_with_braces(content)
+    first, second = score_lyrics(parse(tokens, content, pairs))
+    assert list(first) == ['谱行1']
+    assert [list(mapping) for mapping in first['谱行1']] == [[0, 1, 3, 5], [0, 1, 3, 5, 6, 7, -1, -1]]
+    assert [list(mapping) for mapping in second['谱行2']] == [[0, 1, 2] + [-1] * 5]
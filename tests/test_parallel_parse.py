@@ -0,0 +1,37 @@
+from benchmark import make_document
+from parse_cache import ParseCache
+from parser import parse
+from tokenizer import tokenize_with_braces
+from trees import signature
+
+
+# 原文相同的中文、英文歌词，两者不能共用缓存
+LYRICS = ('中文歌词 = 歌词中 {\n  twinkle twinkle little star 一闪一闪亮晶晶\n}\n'
+          '英文歌词 = 歌词英 {\n  twinkle twinkle little star 一闪一闪亮晶晶\n}\n')
+
+
+def parse_text(content: str, **kwargs):
+    tokens, pairs = tokenize_with_braces(content)
+    return parse(tokens, content, pairs, **kwargs)
+
+
+def test_parallel_matches_serial():
+    content = make_document(300)
+    assert signature(parse_text(content, parallel=True, max_workers=2)) == signature(parse_text(content))
+
+
+def test_parallel_with_cache(tmp_path):
+    content = make_document(300) + LYRICS
+    expected = signature(parse_text(content))
+    cache = ParseCache(str(tmp_path))
+    assert signature(parse_text(content, parallel=True, max_workers=2, _cache=cache)) == expected
+    assert cache.hits == 0
+
+    # 整篇文档改了一处，其余的乐谱和歌词都从缓存中取
+    edited = content.replace('4/4', '3/4', 1)
+    cache = ParseCache(str(tmp_path))
+    assert signature(parse_text(edited, parallel=True, max_workers=2, _cache=cache)) == \
+        signature(parse_text(edited))
+    assert cache.hits > 0
+    assert signature(parse_text(content, parallel=True, max_workers=2, _cache=ParseCache(str(tmp_path)))) == \
+        expected
@@ -0,0 +1,66 @@
+import parser
+from item_type import ItemType
+from parse_cache import ParseCache
+from parser import parse
+from tokenizer import tokenize_with_braces
+from trees import signature
+
+
+NOTES = '1 2 3 4 5 6 7 1\' 7 6 5 4 3 2 1 0 3 3 4 5 5 4 3 2 1 1 2 3 3 2 2 -'
+DOCUMENT = ('谱行1 = 简谱 { 拍号 = 4/4 } {\n  %s\n}\n'
+            '谱行2 = 五线谱 { 调号 = D; 拍号 = 4/4 } {\n  c d e f g a b c\' b a g f e d c d e f g a b\n}\n'
+            '歌词1 = 歌词中 {\n  我是笨蛋，我是傻子。“天上”人间。我是笨蛋，我是傻子。“天上”人间。\n}\n'
+            '歌词2 = 歌词英 {\n  Twinkle twinkle little star, how I wonder what you are.\n}\n'
+            '谱表 {\n  谱行1{歌词1}, 谱行2{歌词2}\n}\n')
+
+
+def parse_text(content: str, cache=None):
+    tokens, pairs = tokenize_with_braces(content)
+    return parse(tokens, content, pairs, _cache=cache)
+
+
+def test_paragraph_sized_blocks_are_cached(tmp_path):
+    # 一般大小的乐谱、歌词也单独缓存：改动一段后，其他几段都从缓存中取
+    blocks = 4
+    original = DOCUMENT % NOTES
+    edited = DOCUMENT % NOTES.replace('1 0 3', '1 0 4')
+    lyric = '\n  我是笨蛋，我是傻子。“天上”人间。我是笨蛋，我是傻子。“天上”人间。\n'
+    assert len(lyric) >= parser.MIN_CACHED_BLOCK
+    parse_text(original, ParseCache(str(tmp_path)))
+
+    cache = ParseCache(str(tmp_path))
+    root = parse_text(edited, cache)
+    assert cache.hits == blocks - 1
+    assert cache.misses == 2  # 整篇文档和改动了的那一段
+    assert signature(root) == signature(parse_text(edited))
+
+    cache = ParseCache(str(tmp_path))
+    assert signature(parse_text(edited, cache)) == signature(parse_text(edited))
+    assert cache.hits == 1  # 整篇文档
+
+
+def lyrics(node):
+    if node.type == ItemType.LYRIC:
+        return [repr(node.value)]
+    return [text for child in node.children for text in lyrics(child)]
+
+
+def test_lyric_kinds_have_separate_keys(tmp_path):
+    # 歌词中、歌词英的原文相同时分词结果不同，不能共用缓存
+    body = 'twinkle twinkle little star 一闪一闪亮晶晶，满天都是小星星'
+    content = '歌词1 = 歌词英 {\n  %s\n}\n歌词2 = 歌词中 {\n  %s\n}\n' % (body, body)
+    expected = parse_text(content)
+    english, chinese = lyrics(expected)
+    assert english != chinese
+
+    cache = ParseCache(str(tmp_path))
+    assert signature(parse_text(content, cache)) == signature(expected)
+    assert cache.hits == 0
+    # 只留下两段歌词各自的缓存，再分别读出
+    for key in [parser.block_key(parser.parser_lyric.segment_en, '\n  %s\n' % body),
+                parser.block_key(parser.parser_lyric.segment_cn, '\n  %s\n' % body)]:
+        assert cache.get(key) is not None
+    cache = ParseCache(str(tmp_path))
+    content = content.replace('歌词2', '歌词3')  # 整篇文档的键变了
+    assert lyrics(parse_text(content, cache)) == [english, chinese]
+    assert cache.hits == 2
@@ -0,0 +1,40 @@
+import pytest
+
+from parser_staff import tokenize, tokenize_sequence
+
+
+# 相对音高：每个音符取与前一个音符（第一个音符为 f）相差不超过四度的那个八度，再加上增减八度的记号。
+# 期望值为绝对音高的写法，c 开头的第 0 个八度不加记号
+@pytest.mark.parametrize('content, expected', [
+    # preview.txt 中的音阶
+    ("d'4 e fis g a b cis d", "d'4 e'4 fis'4 g'4 a'4 b'4 cis''4 d''4"),
+    ('c d e f g a b c', "c0 d0 e0 f0 g0 a0 b0 c'0"),
+    ('c b a g f e d c', 'c0 b,0 a,0 g,0 f,0 e,0 d,0 c,0'),
+    # 四度不跨八度，五度反向取四度
+    ('f b', 'f0 b0'),
+    ('b f', 'b0 f0'),
+    ('c f c', 'c0 f0 c0'),
+    ('c g c', 'c0 g,0 c0'),
+    ('g c g', "g0 c'0 g0"),
+    ('e a e', 'e0 a0 e0'),
+    ('e b e', 'e0 b,0 e0'),
+    # 只看音名，不看变音记号：增四度、减五度
+    ('fis bes', 'fis0 bes0'),
+    ('bes fis', 'bes0 fis0'),
+    ('ais eis', 'ais0 eis0'),
+    # 增减八度的记号作用于后面所有的音符
+    ("c'' c,, c", "c''0 c0 c0"),
+    ("c c' c' c,", "c0 c'0 c''0 c'0"),
+    ("a, b c d", 'a,0 b,0 c0 d0'),
+    ("g'8 c c, a'16", "g'8 c''8 c'8 a'16"),
+])
+def test_relative_octaves(content, expected):
+    assert ' '.join(str(node.content) for node in tokenize(content)) == expected
+    sequence = tokenize_sequence(content)
+    assert ' '.join(map(str, (note.content for note in sequence))) == expected
+
+
+def test_pitches():
+    # 各音符的半音数，c 为 0；跨 b、c 之间时连续，重升的 f 与 g 同音
+    sequence = tokenize_sequence("a b c d ees' fisis, g")
+    assert list(sequence.pitches()) == [9, 11, 12, 14, 27, 19, 19]
@@ -0,0 +1,69 @@
+import pytest
+
+import shaping
+from font_files import DEJAVU_FONTS, make_ttf
+from font_library import Font
+from shaping import ShapingCache
+
+
+WORDS = ['office', 'fly', 'AVATAR', 'Wave', 'HELLO', 'office']
+
+
+@pytest.fixture(params=['generated'] + DEJAVU_FONTS[:1])
+def font_file(request, tmp_path):
+    if request.param != 'generated':
+        return request.param
+    filename = str(tmp_path / 'test.ttf')
+    make_ttf(filename)
+    return filename
+
+
+def test_warm_results_match_fresh_shaping(font_file):
+    font = Font(font_file, 0, True)
+    cache = ShapingCache()
+    cold = [cache.shape(font, 3.75, word) for word in WORDS]
+    assert cache.misses == len(set(WORDS)) and cache.hits == 1
+    warm = [cache.shape(font, 3.75, word) for word in WORDS]
+    assert cache.hits == 1 + len(WORDS)
+    fresh = [shaping.shape(Font(font_file, 0, True), 3.75, word) for word in WORDS]
+    assert warm == cold == fresh
+    assert all(result is cached for result, cached in zip(warm, cold))
+
+
+def test_shape_text_matches_words(font_file):
+    font = Font(font_file, 0, True)
+    cache = ShapingCache()
+    text = ' '.join(WORDS)
+    cold = cache.shape_text(font, 3.75, text)
+    warm = cache.shape_text(font, 3.75, text)
+    assert warm == cold
+    assert [run for run in cold if run.gids != (font.get_gid(ord(' ')),)] == \
+        [shaping.shape(font, 3.75, word) for word in WORDS]
+
+
+def test_key_covers_size(font_file):
+    font = Font(font_file, 0, True)
+    cache = ShapingCache()
+    small = cache.shape(font, 3.75, 'AVATAR')
+    large = cache.shape(font, 5.0, 'AVATAR')
+    assert cache.misses == 2
+    assert large == shaping.shape(font, 5.0, 'AVATAR')
+    assert large.width == pytest.approx(small.width * 5.0 / 3.75)
+
+
+@pytest.mark.skipif(len(DEJAVU_FONTS) == 0, reason='没有 DejaVu 字体')
+def test_key_covers_font_and_features():
+    # 特性（GSUB、GPOS）编译在各 Font 对象上；不同的 Font 对象字体编号不同，缓存的结果不会混用
+    filename = [name for name in DEJAVU_FONTS if name.endswith('/DejaVuSans.ttf')] or DEJAVU_FONTS
+    with_features = Font(filename[0], 0, True)
+    without_features = Font(filename[0], 0, True)
+    without_features.gsub = []
+    cache = ShapingCache()
+    for word in ['office', 'fly', 'AVATAR']:
+        ligated = cache.shape(with_features, 3.75, word)
+        plain = cache.shape(without_features, 3.75, word)
+        assert ligated == shaping.shape(with_features, 3.75, word)
+        assert plain == shaping.shape(without_features, 3.75, word)
+        assert plain.gids == tuple(with_features.get_gids(word))
+    assert cache.hits == 0 and cache.misses == 6
+    assert len(cache.shape(with_features, 3.75, 'office').gids) < len('office')
@@ -0,0 +1,65 @@
+import pytest
+
+import parser_jianpu
+import parser_staff
+from parser import parse
+from timeline import build_timeline, note_durations, score_timelines
+from tokenizer import tokenize_with_braces
+
+
+# 四分音符为 480。减时线依次为 _ = / \，增时线“-”和休止符“0”都是一拍
+JIANPU = '1 2_ 3_ 4= 5= 6_ 7 | - 0 1/ 1\\ 1\\ 1= 1_ 1'
+JIANPU_DURATIONS = [480, 240, 240, 120, 120, 240, 480, 480, 480, 60, 30, 30, 120, 240, 480]
+JIANPU_ONSETS = [0, 480, 720, 960, 1080, 1200, 1440, 1920, 2400, 2880, 2940, 2970, 3000, 3120, 3360]
+# 第一个音符没写时值，按四分音符；其余没写的沿用前一个
+STAFF = 'a d8 e f2 g16 a b8 c1'
+STAFF_DURATIONS = [480, 240, 240, 960, 120, 120, 240, 1920]
+STAFF_ONSETS = [0, 480, 720, 960, 1920, 2040, 2160, 2400]
+
+
+@pytest.mark.parametrize('numerator, measures, beats', [
+    (4, [0] * 7 + [1] * 8, [0, 1, 1, 2, 2, 2, 3, 0, 1, 2, 2, 2, 2, 2, 3]),
+    (3, [0] * 6 + [1] * 3 + [2] * 6, [0, 1, 1, 2, 2, 2, 0, 1, 2, 0, 0, 0, 0, 0, 1]),
+])
+def test_jianpu_timeline(numerator, measures, beats):
+    durations = note_durations(parser_jianpu.tokenize_sequence(JIANPU), 4)
+    assert list(durations) == JIANPU_DURATIONS
+    timeline = build_timeline(durations, numerator, 4)
+    assert list(timeline.onsets) == JIANPU_ONSETS
+    assert list(timeline.measures) == measures
+    assert list(timeline.beats) == beats
+    assert timeline.end == 3840
+
+
+@pytest.mark.parametrize('numerator, measures, beats', [
+    (4, [0, 0, 0, 0, 1, 1, 1, 1], [0, 1, 1, 2, 0, 0, 0, 1]),
+    (3, [0, 0, 0, 0, 1, 1, 1, 1], [0, 1, 1, 2, 1, 1, 1, 2]),
+])
+def test_staff_timeline(numerator, measures, beats):
+    durations = note_durations(parser_staff.tokenize_sequence(STAFF), 4)
+    assert list(durations) == STAFF_DURATIONS
+    timeline = build_timeline(durations, numerator, 4)
+    assert list(timeline.onsets) == STAFF_ONSETS
+    assert list(timeline.measures) == measures
+    assert list(timeline.beats) == beats
+    assert timeline.end == 4320
+
+
+def test_score_timelines():
+    # 拍号取自各谱行的第一个组
+    content = ('谱行1 = 简谱 { 拍号 = 3/4 } {\n  %s\n}\n'
+               '谱行2 = 五线谱 { 拍号 = 4/4 } {\n  %s\n}\n'
+               '谱表 {\n  谱行1, 谱行2\n}\n' % (JIANPU, STAFF))
+    tokens, pairs = tokenize_with_braces(content)
+    [timelines] = score_timelines(parse(tokens, content, pairs))
+    assert list(timelines) == ['谱行1', '谱行2']
+    assert list(timelines['谱行1'].onsets) == JIANPU_ONSETS
+    assert list(timelines['谱行1'].measures) == [0] * 6 + [1] * 3 + [2] * 6
+    assert list(timelines['谱行2'].onsets) == STAFF_ONSETS
+    assert list(timelines['谱行2'].barlines) == [1920, 3840]
+
+
+@pytest.mark.parametrize('content', ['c4 d3840', 'c4 d2000', 'c7'])
+def test_staff_length_must_divide_whole_note(content):
+    with pytest.raises(SystemExit):
+        note_durations(parser_staff.tokenize_sequence(content), 4)
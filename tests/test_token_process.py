@@ -0,0 +1,170 @@
+import pickle
+from itertools import chain
+
+import pytest
+
+import global_var
+import token_process
+from font_files import DEJAVU_FONTS, make_ttf
+from font_library import StaticResolver
+from shaping import ShapingCache
+from token_process import CharClass, GlyphRun, HBox, HorElementType
+from tokenizer import tokenize_text
+
+
+TEXT = '我是「笨蛋」，AVATAR office・fly。Wave！（歌词）中文abc中文 x+y=z…\n第二段：Tower, 𠀀 end.'
+
+
+@pytest.fixture(params=['generated'] + DEJAVU_FONTS[:1])
+def fonts(request, tmp_path):
+    western = request.param
+    if western == 'generated':
+        western = str(tmp_path / 'test.ttf')
+        make_ttf(western)
+    chinese = DEJAVU_FONTS[0] if len(DEJAVU_FONTS) > 0 else western
+    global_var.initialize_font_library('中文', '西文', resolver=StaticResolver({'中文': (chinese, 0),
+                                                                               '西文': (western, 0)}))
+    token_process.SHAPING_CACHE.clear()
+    return global_var.get_default_chinese_font(), global_var.get_default_western_font()
+
+
+def reference_adjust_glue(hlist):
+    # 原来的 adjust_glue：先移出最后一个字符，加入空白后再放回
+    if len(hlist) < 2:
+        return
+    second_last = hlist[-2].content
+    if hlist[-2].type != HorElementType.GLYPH:
+        return
+    last_box = hlist.pop()
+    last = last_box.content
+    glues = []
+    if second_last.cclass == CharClass.MID_PUNCT:
+        glue_width = second_last.width
+        if last.cclass == CharClass.MID_PUNCT:
+            glue_width += last.width
+        glue_width /= 2
+        glues.append([glue_width, 0.0, 0, glue_width, 2, second_last.width, True])
+    elif last.cclass == CharClass.MID_PUNCT:
+        glue_width = last.width / 2
+        if second_last.cclass == CharClass.COMMAS:
+            glues.append([second_last.width, 0.0, 0, second_last.width, 3, second_last.width, False])
+        elif second_last.cclass == CharClass.PERIODS:
+            glues.append([second_last.width, 0.0, 0, 0.0, 0, second_last.width, False])
+        glues.append([glue_width, 0.0, 0, glue_width, 2, 0.0, False])
+    elif second_last.cclass in [CharClass.RIGHT_PUNCT, CharClass.COMMAS]:
+        if last.cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
+            glues.append([second_last.width, 0.0, 0, second_last.width, 3, second_last.width, True])
+    elif second_last.cclass == CharClass.PERIODS:
+        if last.cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
+            glues.append([second_last.width, 0.0, 0, 0.0, 0, second_last.width, True])
+    elif last.cclass == CharClass.LEFT_PUNCT:
+        glues.append([last.width, 0.0, 0, last.width, 3, 0.0, True])
+    elif second_last.cclass == CharClass.IDEOGRAPHIC and last.cclass == CharClass.WESTERN:
+        base_width = second_last.width / 4
+        glues.append([base_width, base_width, 2, base_width / 2, 4, 0.0, True])
+    elif second_last.cclass == CharClass.WESTERN and last.cclass == CharClass.IDEOGRAPHIC:
+        base_width = last.width / 4
+        glues.append([base_width, base_width, 2, base_width / 2, 4, 0.0, True])
+    elif second_last.cclass == CharClass.IDEOGRAPHIC and last.cclass == CharClass.IDEOGRAPHIC:
+        glues.append([0.0, second_last.width / 4, 3, 0.0, 0, 0.0, True])
+    hlist.extend(HBox(HorElementType.SPACE, glue) for glue in glues)
+    hlist.append(last_box)
+
+
+def reference_western(hlist):
+    # 原来的 process_western_temp_list：逐个 HBox 写入 GID 和宽度
+    text = ''.join(chr(hbox.content.code) for hbox in hlist)
+    runs = ShapingCache().shape_text(token_process.WESTERN_FONT, token_process.WESTERN_FONT_SIZE, text)
+    gids = list(chain.from_iterable(run.gids for run in runs))
+    del hlist[len(gids):]
+    while len(hlist) < len(gids):
+        hlist.append(HBox(HorElementType.GLYPH, hlist[-1].content.code))
+    advances = chain.from_iterable(run.advances for run in runs)
+    kerns = chain.from_iterable(run.kerns for run in runs)
+    for hbox, gid, advance, kern in zip(hlist, gids, advances, kerns):
+        hbox.content.code = gid
+        hbox.content.width = advance + kern
+
+
+def reference_process(text):
+    """
+    原来的做法：每个字符一个 HBox（内含 Glyph），每个空白一个 HBox（内含 Glue）。
+    """
+    current = []
+    western = []
+
+    def flush():
+        reference_western(western)
+        current.append(western[0])
+        reference_adjust_glue(current)
+        current.extend(western[1:])
+        western.clear()
+
+    for token in tokenize_text(text):
+        if token.content is not None:
+            hbox = HBox(HorElementType.GLYPH, token.content)
+            if hbox.content.cclass == CharClass.WESTERN:
+                western.append(hbox)
+                continue
+            if len(western) > 0:
+                flush()
+            current.append(hbox)
+            reference_adjust_glue(current)
+        elif len(western) > 0:
+            flush()
+    return current
+
+
+def fields(hbox):
+    content = hbox.content
+    if hbox.type == HorElementType.GLYPH:
+        return hbox.type, content.cclass, content.font, content.code, content.yshift, content.width
+    return hbox.type, content.default, content.plus, content.plus_priority, content.minus, content.minus_priority,\
+        content.end_width, bool(content.allow_linebreak)
+
+
+def test_glyph_run_matches_per_glyph_objects(fonts):
+    run = token_process.process_token(tokenize_text(TEXT))
+    assert isinstance(run, GlyphRun)
+    expected = reference_process(TEXT)
+    assert [fields(hbox) for hbox in run] == pytest.approx([fields(hbox) for hbox in expected])
+    assert any(hbox.type == HorElementType.SPACE for hbox in run)
+    assert repr(run) == repr(expected)
+
+
+def test_glyph_run_list_api(fonts):
+    run = token_process.process_token(tokenize_text(TEXT))
+    expected = [fields(hbox) for hbox in run]
+    assert [fields(hbox) for hbox in run[3:9]] == expected[3:9]
+    assert [fields(hbox) for hbox in pickle.loads(pickle.dumps(run))] == expected
+    assert run[-1] == run[len(run) - 1]
+    with pytest.raises(IndexError):
+        run[len(run)]
+
+    copy = GlyphRun()
+    copy.extend(run[:5])
+    copy.extend(list(run[5:]))
+    assert [fields(hbox) for hbox in copy] == expected
+    last = copy.pop()
+    assert fields(last) == expected[-1] and len(copy) == len(run) - 1
+    copy.append(last)
+    copy.append(HBox(HorElementType.SPACE, [1.0, 2.0, 3, 4.0, 5, 6.0, True]))
+    assert fields(copy[-2]) == expected[-1]
+    assert fields(copy[-1]) == (HorElementType.SPACE, 1.0, 2.0, 3, 4.0, 5, 6.0, True)
+    with pytest.raises(TypeError):
+        copy.append(HBox(HorElementType.HBOX, None))
+
+    # 视图修改时写回数组
+    copy[0].content.width = 99.0
+    copy[-1].content.allow_linebreak = False
+    assert copy.widths[0] == 99.0 and copy.allow_linebreaks[-1] == 0
+
+
+def test_warm_shaping_cache_gives_same_run(fonts):
+    cold = token_process.process_token(tokenize_text(TEXT))
+    misses = token_process.SHAPING_CACHE.misses
+    hits = token_process.SHAPING_CACHE.hits
+    warm = token_process.process_token(tokenize_text(TEXT))
+    assert token_process.SHAPING_CACHE.misses == misses
+    assert token_process.SHAPING_CACHE.hits > hits
+    assert [fields(hbox) for hbox in warm] == [fields(hbox) for hbox in cold]
@@ -0,0 +1,79 @@
+import pytest
+
+from benchmark import make_document
+from file_reader import normalize, read_chunks, read_file
+from tokenizer import Lexer, tokenize, tokenize_stream, tokenize_with_braces
+
+
+# 分段处容易出错的写法：紧接着注释的词、跨行的字符串、右括号前的行尾、分号、全角字符
+TRICKY = ('版面 {\n  宽度 = 170mm;;\n  字体 = "思源宋体\n Light {}"\n  每拍宽度 = 5 % 注释\n\n}\n'
+          '谱行1 = 简谱 { 拍号 = 4/4 } {\n  1 2 3%注释\n4%又一个注释\n5 %\n 6\n\n  }\n'
+          '歌词1 = 歌词中 {\n  我是笨蛋，我是傻子。“天上”人间。\n};谱表 {\n  谱行1{歌词1} \t\n}  \n\n')
+
+
+def fields(tokens):
+    return [(token.type, token.content, token.start, token.end) for token in tokens]
+
+
+def split(text: str, size: int):
+    return [text[i:i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 7, 64, 4096])
+@pytest.mark.parametrize('text', [TRICKY, make_document(30, 3)], ids=['tricky', 'generated'])
+def test_stream_matches_one_shot(text, size):
+    expected = tokenize(text)
+    assert fields(tokenize_stream(split(text, size))) == fields(expected)
+
+    # 分段得到的括号配对表也相同
+    lexer = Lexer()
+    tokens = []
+    for chunk in split(text, size):
+        tokens.extend(lexer.feed(chunk))
+    tokens.extend(lexer.feed('', True))
+    assert fields(tokens) == fields(expected)
+    assert lexer.braces.pairs == tokenize_with_braces(text)[1]
+
+
+def reference_normalize(string):
+    # 原来逐个替换的做法
+    string = string.replace('　', '').replace('·', '・').replace('～', '〜')
+    for i in range(33, 128):
+        string = string.replace(chr(i - 32 + 0xFF00), chr(i))
+    return string
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 1 << 20])
+def test_read_chunks_matches_whole_file(tmp_path, size):
+    # 多字节字符会被切开，由增量解码器接上。全角字符中有一个双引号，末尾再补一个
+    text = TRICKY + '＝　Ａｂｃ～·！' + ''.join(map(chr, range(0xFF01, 0xFF5F))) + '＂'
+    filename = str(tmp_path / 'test.txt')
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write(text)
+    chunks = list(read_chunks(filename, size))
+    assert ''.join(chunks) == normalize(text) == reference_normalize(text)
+    assert read_file(filename) == normalize(text)
+    assert fields(tokenize_stream(chunks)) == fields(tokenize(normalize(text)))
+
+
+def test_read_chunks_empty_file(tmp_path):
+    filename = str(tmp_path / 'empty.txt')
+    open(filename, 'w').close()
+    assert list(read_chunks(filename)) == []
+    assert fields(tokenize_stream(read_chunks(filename))) == fields(tokenize(''))
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 5, 1 << 20])
+def test_read_chunks_translates_line_ends(tmp_path, size):
+    # CRLF 和单独的 CR 都换成 LF，与文本模式的 open 相同；CRLF 可能正好被分在两段中
+    lf_file = str(tmp_path / 'lf.txt')
+    crlf_file = str(tmp_path / 'crlf.txt')
+    with open(lf_file, 'wb') as f:
+        f.write(TRICKY.encode('utf-8'))
+    with open(crlf_file, 'wb') as f:
+        f.write(TRICKY.replace('\n', '\r\n').replace('\r\n\r\n', '\r\r', 1).encode('utf-8'))
+    with open(crlf_file, 'r', encoding='utf-8') as f:
+        assert f.read() == TRICKY
+    chunks = list(read_chunks(crlf_file, size))
+    assert ''.join(chunks) == ''.join(read_chunks(lf_file, size)) == normalize(TRICKY)
+    assert fields(tokenize_stream(chunks)) == fields(tokenize(read_file(lf_file)))
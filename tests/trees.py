@@ -0,0 +1,11 @@
+def signature(node):
+    """
+    语法树（NodeView 或 TokenNode）的内容：各结点的类型、位置，叶结点的值，用于比较两棵树。
+    简谱、五线谱的 content 中第一个组的语法树也逐个结点比较。
+    """
+    content = node.content
+    if isinstance(content, list):
+        content = [signature(item) if hasattr(item, 'start') else repr(item) for item in content]
+    else:
+        content = repr(content)
+    return node.type, node.start, node.end, content
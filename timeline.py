@@ -0,0 +1,217 @@
+from array import array
+from itertools import accumulate, repeat
+from operator import floordiv, mod
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from item_type import ItemType
+from parse_tree import NodeView
+from parser_jianpu import JianpuSequence
+from parser_staff import StaffSequence
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# 时间的单位：全音符为 TICKS_PER_WHOLE。能被 1～16 中常用的时值和三连音整除
+TICKS_PER_WHOLE = 1920
+# 没有写拍号时按 4/4 拍
+DEFAULT_TIME_SIGNATURE = (4, 4)
+
+
+class Timeline:
+    """
+    一行乐谱的时间轴。各音符的时值、开始时刻、所在小节和所在拍分别存于各数组。
+    """
+    __slots__ = ('durations', 'onsets', 'measures', 'beats', 'ticks_per_beat', 'ticks_per_measure')
+
+    def __init__(self, durations: array, onsets: array, measures: array, beats: array,
+                 ticks_per_beat: int, ticks_per_measure: int):
+        self.durations = durations
+        self.onsets = onsets
+        self.measures = measures  # 小节号，从 0 开始
+        self.beats = beats  # 在小节中的第几拍，从 0 开始
+        self.ticks_per_beat = ticks_per_beat
+        self.ticks_per_measure = ticks_per_measure
+
+    def __len__(self):
+        return len(self.onsets)
+
+    @property
+    def end(self) -> int:
+        """
+        最后一个音符结束的时刻。
+        """
+        return self.onsets[-1] + self.durations[-1] if len(self.onsets) > 0 else 0
+
+    @property
+    def barlines(self) -> range:
+        """
+        各小节之间的小节线的时刻，不含开头和结尾。
+        """
+        return range(self.ticks_per_measure, self.end, self.ticks_per_measure)
+
+    def as_numpy(self) -> dict:
+        """
+        以 NumPy 数组的形式取出各数组（不复制）。
+        :return: 键为 duration、onset、measure、beat 的字典；没有安装 NumPy 时为 None。
+        """
+        if numpy is None:
+            return None
+        return {'duration': numpy.frombuffer(self.durations, dtype=numpy.int32),
+                'onset': numpy.frombuffer(self.onsets, dtype=numpy.int32),
+                'measure': numpy.frombuffer(self.measures, dtype=numpy.int32),
+                'beat': numpy.frombuffer(self.beats, dtype=numpy.int32)}
+
+
+def parse_time_signature(text: str) -> Tuple[int, int]:
+    """
+    :param text: 拍号，如 "4/4"、"6/8"
+    :return: (每小节的拍数, 以几分音符为一拍)
+    """
+    numerator, _, denominator = text.partition('/')
+    if not numerator.isdigit() or not denominator.isdigit() or int(numerator) == 0\
+            or int(denominator) == 0 or TICKS_PER_WHOLE % int(denominator) != 0:
+        print('错误：拍号格式不对：%s' % text)
+        exit(1)
+    return int(numerator), int(denominator)
+
+
+def note_durations(sequence, denominator: int) -> array:
+    """
+    整列算出各音符的时值。五线谱的时值为几分音符，开头没写时值的按四分音符；
+    简谱不带减时线的音符为一拍，每条减时线减半。
+    五线谱的时值要能整除 TICKS_PER_WHOLE（如 1、2、3、4、6、8、16、32），否则报错。
+    :param sequence: JianpuSequence 或 StaffSequence
+    :param denominator: 拍号的分母
+    :return: 各音符的时值
+    """
+    if isinstance(sequence, StaffSequence):
+        if len(sequence) == 0:
+            return array('i')
+        for length in set(sequence.lengths):
+            if length > TICKS_PER_WHOLE or length != 0 and TICKS_PER_WHOLE % length != 0:
+                print('错误：五线谱的时值不对：%d' % length)
+                exit(1)
+        # 几分音符 -> 时值，按出现过的最大值做表
+        ticks = [TICKS_PER_WHOLE // 4] + [TICKS_PER_WHOLE // length for length in range(1, max(sequence.lengths) + 1)]
+        return array('i', map(ticks.__getitem__, sequence.lengths))
+    if isinstance(sequence, JianpuSequence):
+        return array('i', map((TICKS_PER_WHOLE // denominator).__rshift__, sequence.underlines))
+    raise TypeError('不是乐谱：%s' % type(sequence).__name__)
+
+
+def build_timeline(durations: array, numerator: int, denominator: int) -> Timeline:
+    """
+    由时值算出时间轴：开始时刻是时值的前缀和，小节号和拍数由开始时刻整列相除得到。
+    有 NumPy 时用 NumPy 计算。
+    """
+    ticks_per_beat = TICKS_PER_WHOLE // denominator
+    ticks_per_measure = ticks_per_beat * numerator
+    if numpy is not None:
+        values = numpy.frombuffer(durations, dtype=numpy.int32)
+        onsets = numpy.cumsum(values, dtype=numpy.int32) - values
+        measures, remainders = numpy.divmod(onsets, ticks_per_measure)
+        beats = remainders // ticks_per_beat
+        return Timeline(durations, array('i', onsets.tobytes()), array('i', measures.astype(numpy.int32).tobytes()),
+                        array('i', beats.astype(numpy.int32).tobytes()), ticks_per_beat, ticks_per_measure)
+    onsets = array('i', accumulate(durations, initial=0))
+    onsets.pop()
+    measures = array('i', map(floordiv, onsets, repeat(ticks_per_measure)))
+    beats = array('i', map(floordiv, map(mod, onsets, repeat(ticks_per_measure)), repeat(ticks_per_beat)))
+    return Timeline(durations, onsets, measures, beats, ticks_per_beat, ticks_per_measure)
+
+
+def timeline_of(music: NodeView) -> Timeline:
+    """
+    :param music: 简谱或五线谱结点，拍号取自其第一个组
+    """
+    header, sequence = music.content
+    signature = assignments(header).get('拍号')
+    numerator, denominator = DEFAULT_TIME_SIGNATURE if signature is None\
+        else parse_time_signature(str(signature.value))
+    return build_timeline(note_durations(sequence, denominator), numerator, denominator)
+
+
+def clauses(document: NodeView) -> Iterator[NodeView]:
+    """
+    依次给出 DOCUMENT 下各顶层语句的内容，即 ASSIGNMENT_LIST 或 LAYOUT_STAFF 结点。
+    """
+    clause, suffix = document.children
+    while True:
+        yield clause.children[0]
+        children = suffix.children
+        if len(children) == 1:  # DOCUMENT_SUFFIX -> EMPTY
+            return
+        _, clause, suffix = children
+
+
+def assignments(document: NodeView) -> Dict[str, NodeView]:
+    """
+    :return: DOCUMENT 下各赋值语句：变量名 -> 值的结点（RHS 的子结点）
+    """
+    result = {}
+    for clause in clauses(document):
+        if clause.type != ItemType.ASSIGNMENT_LIST:
+            continue
+        identifier, suffix = clause.children
+        children = suffix.children
+        if children[0].type == ItemType.EQ:
+            result[identifier.value] = children[1].children[0]
+    return result
+
+
+def score_items(layout: NodeView) -> List[Tuple[str, Optional[str]]]:
+    """
+    列出谱表中的各行。
+    :param layout: 谱表的 LAYOUT_STAFF 结点
+    :return: 列表，每一项为 (谱行的变量名, 所配歌词的变量名)，没有歌词时后者为 None。
+    """
+    result = []
+    for clause in clauses(layout.children[2]):
+        identifier, suffix = clause.children
+        if suffix.children[0].type == ItemType.EQ:
+            continue
+        item_suffix, list_suffix = suffix.children
+        while True:
+            lyric = item_suffix.children
+            result.append((identifier.value, lyric[1].value if len(lyric) == 3 else None))
+            children = list_suffix.children
+            if len(children) == 1:  # LIST_SUFFIX -> EMPTY
+                break
+            _, item, list_suffix = children
+            identifier, item_suffix = item.children
+    return result
+
+
+def score_timelines(root: NodeView) -> List[Dict[str, Timeline]]:
+    """
+    算出文档中每个谱表内各行的时间轴。
+    :param root: 语法树的根结点
+    :return: 列表，每一项对应一个谱表：谱行的变量名 -> 时间轴，按谱表中的顺序排列。
+    """
+    definitions = assignments(root)
+    result = []
+    for clause in clauses(root):
+        if clause.type != ItemType.LAYOUT_STAFF or clause.children[0].value != '谱表':
+            continue
+        timelines = {}
+        for name, _ in score_items(clause):
+            music = definitions.get(name)
+            if music is None or music.type not in (ItemType.JIANPU, ItemType.STAFF):
+                print('错误：谱表中的%s不是乐谱' % name)
+                exit(1)
+            timelines[name] = timeline_of(music)
+        result.append(timelines)
+    return result
+
+
+def align(timelines: List[Timeline]) -> Tuple[array, List[array]]:
+    """
+    上下对齐：把各行的开始时刻合并成一列，并求出各音符落在第几列。
+    :return: (所有行中出现过的开始时刻（升序）, 各行中各音符所在的列)
+    """
+    columns = array('i', sorted(set().union(*(timeline.onsets for timeline in timelines))))
+    column_of = dict(zip(columns, range(len(columns))))
+    return columns, [array('i', map(column_of.__getitem__, timeline.onsets)) for timeline in timelines]
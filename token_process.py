@@ -1,9 +1,20 @@
+from array import array
+from bisect import bisect_right
 from enum import Enum
+from itertools import chain, repeat
+from operator import add
 
 from typing import List
 
 from tokenizer import TokenType
 from global_var import get_default_chinese_font, get_default_western_font, get_font_encoding
+from font_library import UTF32
+from shaping import ShapingCache
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
 
 
 # 字体处理
@@ -15,6 +26,9 @@ CHINESE_SHIFT = 0
 CHINESE_FONT = None
 WESTERN_FONT = None
 
+# 西文按词排版的结果
+SHAPING_CACHE = ShapingCache()
+
 
 def set_chinese_font(font):
     global CHINESE_FONT, CHINESE_SHIFT
@@ -43,24 +57,16 @@ def set_font_size(size):
     CHINESE_SHIFT = (asc_real - 0.88) * size
 
 
+# 用中文字体的字符范围（首尾都包括在内）
+_CJK_RANGES = ((0x2460, 0x24FF), (0x3000, 0x318F), (0x3200, 0x32FF), (0x3400, 0x34BF), (0x4E00, 0x9FFF),
+               (0xAC00, 0xD7AF), (0xF900, 0xFAFF), (0x20000, 0x2FFFF))
+
+
 def is_cjk(char):
     char = ord(char)
-    if 0x2460 <= char <= 0x24FF:
-        return True
-    if 0x3000 <= char <= 0x318F:
-        return True
-    if 0x3200 <= char <= 0x32FF:
-        return True
-    if 0x3400 <= char <= 0x34BF:
-        return True
-    if 0x4E00 <= char <= 0x9FFF:
-        return True
-    if 0xAC00 <= char <= 0xD7AF:
-        return True
-    if 0xF900 <= char <= 0xFAFF:
-        return True
-    if 0x20000 <= char <= 0x2FFFF:
-        return True
+    for start, end in _CJK_RANGES:
+        if start <= char <= end:
+            return True
     return False
 
 
@@ -77,53 +83,92 @@ class CharClass(Enum):
     PERIODS = 6
     LONG_PUNCT = 7
     OTHER_PUNCT = 8
-    MATH_OP = 8
-    MATH_REL = 9
+    MATH_OP = 9
+    MATH_REL = 10
 
     @classmethod
     def get_class(cls, char):
-        if char in '([{‘“〔〈《「『【〖':
-            return cls.LEFT_PUNCT  # 左括号
-        if char in ')]}’”〕〉》」』】〗':
-            return cls.RIGHT_PUNCT  # 右括号
-        if char == '・':
-            return cls.MID_PUNCT  # 中点（左右加空）
-        if char in ',:;、':
-            return cls.COMMAS  # 句中标点
-        if char in '!.?。':
-            return cls.PERIODS  # 句末标点
-        if char in '—…':
-            return cls.LONG_PUNCT  # 长标点
-        if char in '‐–':
-            return cls.OTHER_PUNCT  # 短横线
-        if char in '+−±×÷∓':
-            return cls.MATH_OP  # 数学运算符
-        if char in '<=>≠≒≈≡≢≤≥≪≫∧∨⊂⊃⊄⊅⊆⊇⊊⊋∈∋∉∪∩∥∦⇒⇔↔∽≌∝⊥⊕⊗':
-            return cls.MATH_REL  # 数学关系符
-        if is_cjk(char):
-            return cls.IDEOGRAPHIC
-        return cls.WESTERN
+        code = ord(char)
+        if code < 0x10000:
+            return _CLASSES[_BMP_CLASSES[code]]
+        return _CLASSES[_SUPPLEMENTARY_CLASSES[bisect_right(_SUPPLEMENTARY_STARTS, code) - 1]]
+
+
+# 各类标点，排在前面的优先
+_PUNCTUATION = (
+    (CharClass.LEFT_PUNCT, '([{‘“〔〈《「『【〖'),  # 左括号
+    (CharClass.RIGHT_PUNCT, ')]}’”〕〉》」』】〗'),  # 右括号
+    (CharClass.MID_PUNCT, '・'),  # 中点（左右加空）
+    (CharClass.COMMAS, ',:;、'),  # 句中标点
+    (CharClass.PERIODS, '!.?。'),  # 句末标点
+    (CharClass.LONG_PUNCT, '—…'),  # 长标点
+    (CharClass.OTHER_PUNCT, '‐–'),  # 短横线
+    (CharClass.MATH_OP, '+−±×÷∓'),  # 数学运算符
+    (CharClass.MATH_REL, '<=>≠≒≈≡≢≤≥≪≫∧∨⊂⊃⊄⊅⊆⊇⊊⊋∈∋∉∪∩∥∦⇒⇔↔∽≌∝⊥⊕⊗'),  # 数学关系符
+)
+# 类的值 -> 类
+_CLASSES = {char_class.value: char_class for char_class in CharClass}
+
+
+def _build_class_tables():
+    """
+    基本多文种平面内各字符的类存成一张表（值为 CharClass 的值）；其他平面只有整段的汉字，存成分段表，二分查找。
+    """
+    bmp = bytearray(0x10000)  # 默认为西文
+    supplementary = [(0x10000, CharClass.WESTERN.value)]
+    for start, end in _CJK_RANGES:
+        if end < 0x10000:
+            bmp[start:end + 1] = bytes([CharClass.IDEOGRAPHIC.value]) * (end + 1 - start)
+        else:
+            supplementary.append((start, CharClass.IDEOGRAPHIC.value))
+            supplementary.append((end + 1, CharClass.WESTERN.value))
+    for char_class, chars in reversed(_PUNCTUATION):  # 优先的后写
+        for char in chars:
+            bmp[ord(char)] = char_class.value
+    supplementary.sort()
+    return bmp, array('I', [start for start, _ in supplementary]), bytes([value for _, value in supplementary])
+
+
+_BMP_CLASSES, _SUPPLEMENTARY_STARTS, _SUPPLEMENTARY_CLASSES = _build_class_tables()
+
+
+def classify(text: str) -> array:
+    """
+    一次查出一段文字中各字符的类。
+    :return: 各字符的类的值（见 CharClass）
+    """
+    codes = array('I', text.encode(UTF32))
+    if len(codes) > 0 and max(codes) >= 0x10000:
+        return array('B', [_BMP_CLASSES[code] if code < 0x10000
+                           else _SUPPLEMENTARY_CLASSES[bisect_right(_SUPPLEMENTARY_STARTS, code) - 1]
+                           for code in codes])
+    return array('B', map(_BMP_CLASSES.__getitem__, codes))
+
+
+def _glyph_fields(code):
+    """
+    :param code: 字符的 Unicode 编码
+    :return: (类, 字体编号, 编码或 GID, 纵向偏移, 宽度)；西文字符的 GID 和宽度之后在 process_western_temp_list 中成批查出
+    """
+    cclass = CharClass.get_class(chr(code))
+    font = 0
+    yshift = 0
+    width = CHINESE_FONT_SIZE
+    if cclass == CharClass.WESTERN:
+        font = get_font_encoding(WESTERN_FONT, WESTERN_FONT_SIZE)
+    elif cclass == CharClass.IDEOGRAPHIC:
+        yshift = CHINESE_SHIFT
+        code = CHINESE_FONT.get_gid(code)
+        font = get_font_encoding(CHINESE_FONT, CHINESE_FONT_SIZE)
+    elif cclass in [CharClass.LEFT_PUNCT, CharClass.RIGHT_PUNCT, CharClass.MID_PUNCT,
+                    CharClass.COMMAS, CharClass.PERIODS]:
+        width /= 2
+    return cclass, font, code, yshift, width
 
 
 class Glyph:
     def __init__(self, code):
-        self.cclass = CharClass.get_class(chr(code))
-        self.font = 0
-        self.code = code
-        self.yshift = 0
-        self.width = CHINESE_FONT_SIZE
-
-        if self.cclass == CharClass.WESTERN:
-            self.code = WESTERN_FONT.get_gid(code)
-            self.font = get_font_encoding(WESTERN_FONT, WESTERN_FONT_SIZE)
-            self.width = WESTERN_FONT_SIZE * WESTERN_FONT.get_glyph_width(self.code)
-        elif self.cclass == CharClass.IDEOGRAPHIC:
-            self.yshift = CHINESE_SHIFT
-            self.code = CHINESE_FONT.get_gid(code)
-            self.font = get_font_encoding(CHINESE_FONT, CHINESE_FONT_SIZE)
-        elif self.cclass in [CharClass.LEFT_PUNCT, CharClass.RIGHT_PUNCT, CharClass.MID_PUNCT,
-                             CharClass.COMMAS, CharClass.PERIODS]:
-            self.width /= 2
+        self.cclass, self.font, self.code, self.yshift, self.width = _glyph_fields(code)
 
 
 class Glue:
@@ -168,58 +213,301 @@ class HBox:
             return "{Glue, %s}" % self.content.__repr__()
 
 
-def append_glue_to(hlist: List[HBox], glue_arg: List):
-    hlist.append(HBox(HorElementType.SPACE, glue_arg))
+# 元素类型的值
+_GLYPH = HorElementType.GLYPH.value
+_SPACE = HorElementType.SPACE.value
+
+
+class GlyphRun:
+    """
+    以数组存储的水平列表（hlist），只含字符和空白。各元素的类型、字符的类、字体编号、编码（或 GID）、宽度、纵向偏移
+    以及空白的伸缩量、优先级等存于各数组，不必为每个元素建立 HBox、Glyph 或 Glue 对象。
+    空白的默认宽度存于 widths；字符的空白参数和空白的字符参数都为 0。
+    取下标或迭代时得到 HBoxView，与 HBox 用法相同；切片得到新的 GlyphRun。
+    """
+    __slots__ = ('types', 'cclasses', 'fonts', 'codes', 'widths', 'yshifts', 'plus', 'plus_priorities',
+                 'minus', 'minus_priorities', 'end_widths', 'allow_linebreaks')
+
+    def __init__(self):
+        self.types = array('B')  # HorElementType 的值
+        self.cclasses = array('B')  # CharClass 的值
+        self.fonts = array('H')
+        self.codes = array('I')
+        self.widths = array('d')
+        self.yshifts = array('d')
+        self.plus = array('d')
+        self.plus_priorities = array('b')
+        self.minus = array('d')
+        self.minus_priorities = array('b')
+        self.end_widths = array('d')
+        self.allow_linebreaks = array('B')
+
+    def columns(self) -> tuple:
+        """
+        :return: 各数组，顺序与 __slots__ 相同
+        """
+        return (self.types, self.cclasses, self.fonts, self.codes, self.widths, self.yshifts, self.plus,
+                self.plus_priorities, self.minus, self.minus_priorities, self.end_widths, self.allow_linebreaks)
+
+    def __len__(self):
+        return len(self.types)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            result = GlyphRun.__new__(GlyphRun)
+            result.__setstate__([column[index] for column in self.columns()])
+            return result
+        if index < 0:
+            index += len(self.types)
+        if not 0 <= index < len(self.types):
+            raise IndexError('水平列表下标越界')
+        return HBoxView(self, index)
+
+    def __delitem__(self, index):
+        for column in self.columns():
+            del column[index]
+
+    def __iter__(self):
+        return map(HBoxView, repeat(self), range(len(self.types)))
+
+    def __getstate__(self):
+        return self.columns()
+
+    def __setstate__(self, state):
+        for name, column in zip(GlyphRun.__slots__, state):
+            setattr(self, name, column)
+
+    def append_char(self, code):
+        """
+        加入一个字符，与 HBox(HorElementType.GLYPH, code) 相同。
+        """
+        self.append_glyph(*_glyph_fields(code))
+
+    def append_glyph(self, cclass: CharClass, font, code, yshift, width):
+        """
+        加入一个字符，参数与 Glyph 的各属性相同（由字符的编码算出各属性见 _glyph_fields）。
+        """
+        self.types.append(_GLYPH)
+        self.cclasses.append(cclass.value)
+        self.fonts.append(font)
+        self.codes.append(code)
+        self.widths.append(width)
+        self.yshifts.append(yshift)
+        self.plus.append(0.0)
+        self.plus_priorities.append(0)
+        self.minus.append(0.0)
+        self.minus_priorities.append(0)
+        self.end_widths.append(0.0)
+        self.allow_linebreaks.append(False)
+
+    def append_glue(self, default, plus, plus_priority, minus, minus_priority, end_width, allow_linebreak):
+        """
+        加入一个空白，参数与 Glue 相同。
+        """
+        self.types.append(_SPACE)
+        self.cclasses.append(0)
+        self.fonts.append(0)
+        self.codes.append(0)
+        self.widths.append(default)
+        self.yshifts.append(0.0)
+        self.plus.append(plus)
+        self.plus_priorities.append(plus_priority)
+        self.minus.append(minus)
+        self.minus_priorities.append(minus_priority)
+        self.end_widths.append(end_width)
+        self.allow_linebreaks.append(allow_linebreak)
+
+    def append(self, hbox):
+        """
+        加入一个元素，可以是其他 GlyphRun 中的 HBoxView，也可以是 HBox。
+        """
+        if isinstance(hbox, HBoxView):
+            index = hbox.index
+            for column, source in zip(self.columns(), hbox.run.columns()):
+                column.append(source[index])
+        elif hbox.type == HorElementType.GLYPH:
+            glyph = hbox.content
+            self.append_glyph(glyph.cclass, glyph.font, glyph.code, glyph.yshift, glyph.width)
+        elif hbox.type == HorElementType.SPACE:
+            glue = hbox.content
+            self.append_glue(glue.default, glue.plus, glue.plus_priority, glue.minus, glue.minus_priority,
+                             glue.end_width, glue.allow_linebreak)
+        else:
+            raise TypeError('水平列表中只能有字符和空白：%s' % hbox.type.name)
+
+    def extend(self, hboxes):
+        if isinstance(hboxes, GlyphRun):
+            for column, source in zip(self.columns(), hboxes.columns()):
+                column.extend(source)
+        else:
+            for hbox in hboxes:
+                self.append(hbox)
+
+    def pop(self) -> 'HBoxView':
+        """
+        :return: 最后一个元素，移出后存于一个只有这个元素的 GlyphRun 中
+        """
+        result = self[-1:]
+        if len(result) == 0:
+            raise IndexError('水平列表为空')
+        del self[-1]
+        return result[0]
+
+    def as_numpy(self) -> dict:
+        """
+        以 NumPy 数组的形式取出各数组（不复制），供成批计算宽度、伸缩量等。
+        :return: 键为 __slots__ 中各名称的字典；没有安装 NumPy 时为 None。
+        """
+        if numpy is None:
+            return None
+        return {name: numpy.frombuffer(column, dtype=column.typecode)
+                for name, column in zip(GlyphRun.__slots__, self.columns())}
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+def _column(name: str) -> property:
+    """
+    视图中的一个属性：读写 GlyphRun 中名为 name 的数组的对应项。
+    """
+    def getter(view):
+        return getattr(view.run, name)[view.index]
+
+    def setter(view, value):
+        getattr(view.run, name)[view.index] = value
+
+    return property(getter, setter)
+
+
+class GlyphView:
+    """
+    GlyphRun 中一个字符的视图，属性与 Glyph 相同，修改时写回数组。
+    """
+    __slots__ = ('run', 'index')
+
+    def __init__(self, run: GlyphRun, index: int):
+        self.run = run
+        self.index = index
+
+    @property
+    def cclass(self) -> CharClass:
+        return _CLASSES[self.run.cclasses[self.index]]
+
+    @cclass.setter
+    def cclass(self, value: CharClass):
+        self.run.cclasses[self.index] = value.value
+
+    font = _column('fonts')
+    code = _column('codes')
+    yshift = _column('yshifts')
+    width = _column('widths')
+
+
+class GlueView:
+    """
+    GlyphRun 中一个空白的视图，属性与 Glue 相同，修改时写回数组。
+    """
+    __slots__ = ('run', 'index')
+
+    def __init__(self, run: GlyphRun, index: int):
+        self.run = run
+        self.index = index
+
+    @property
+    def allow_linebreak(self) -> bool:
+        return bool(self.run.allow_linebreaks[self.index])
+
+    @allow_linebreak.setter
+    def allow_linebreak(self, value: bool):
+        self.run.allow_linebreaks[self.index] = value
+
+    default = _column('widths')
+    plus = _column('plus')
+    plus_priority = _column('plus_priorities')
+    minus = _column('minus')
+    minus_priority = _column('minus_priorities')
+    end_width = _column('end_widths')
+
+    __repr__ = Glue.__repr__
+
+
+class HBoxView:
+    """
+    GlyphRun 中一个元素的视图。type、content 与 HBox 相同，content 为 GlyphView 或 GlueView。
+    """
+    __slots__ = ('run', 'index')
+
+    def __init__(self, run: GlyphRun, index: int):
+        self.run = run
+        self.index = index
+
+    @property
+    def type(self) -> HorElementType:
+        return _ELEMENT_TYPES[self.run.types[self.index]]
+
+    @property
+    def content(self):
+        if self.run.types[self.index] == _GLYPH:
+            return GlyphView(self.run, self.index)
+        return GlueView(self.run, self.index)
+
+    def __eq__(self, other):
+        return isinstance(other, HBoxView) and self.run is other.run and self.index == other.index
+
+    def __hash__(self):
+        return hash((id(self.run), self.index))
+
+    __repr__ = HBox.__repr__
+
+
+# 元素类型的值 -> 元素类型
+_ELEMENT_TYPES = {element_type.value: element_type for element_type in HorElementType}
+
+
+def append_glue_to(hlist: GlyphRun, glue_arg: List):
+    hlist.append_glue(*glue_arg)
 
 
-def adjust_glue(hlist: List[HBox]):
-    # 在最后两个字符间增加合适的空格量。一般来说没有空格就无法在此处换行。
-    if len(hlist) < 2:
+def adjust_glue(hlist: GlyphRun, cclass: CharClass, width):
+    # 在最后一个字符与将要加入的字符（类为 cclass，宽度为 width）间增加合适的空格量。一般来说没有空格就无法在此处换行。
+    if len(hlist) < 1:
         return
-    second_last = hlist[-2]
-    if second_last.type != HorElementType.GLYPH:  # 不是字符
+    if hlist.types[-1] != _GLYPH:  # 不是字符
         return
-    last = hlist.pop()
-    if second_last.content.cclass == CharClass.MID_PUNCT:  # 中点之后
-        glue_width = second_last.content.width  # 两个都是中点
-        if last.content.cclass == CharClass.MID_PUNCT:
-            glue_width += last.content.width
+    last_class = _CLASSES[hlist.cclasses[-1]]
+    last_width = hlist.widths[-1]
+    if last_class == CharClass.MID_PUNCT:  # 中点之后
+        glue_width = last_width  # 两个都是中点
+        if cclass == CharClass.MID_PUNCT:
+            glue_width += width
         glue_width /= 2
-        append_glue_to(hlist, [glue_width, 0.0, 0, glue_width, 2, second_last.content.width, True])
-    elif last.content.cclass == CharClass.MID_PUNCT:  # 中点之前
-        glue_width = last.content.width / 2
-        if second_last.content.cclass == CharClass.COMMAS:  # 逗号加中点
-            append_glue_to(hlist, [second_last.content.width, 0.0, 0, second_last.content.width, 3,
-                                   second_last.content.width, False])
-        elif second_last.content.cclass == CharClass.PERIODS:  # 句号加中点
-            append_glue_to(hlist, [second_last.content.width, 0.0, 0, 0.0, 0,
-                                   second_last.content.width, False])
+        append_glue_to(hlist, [glue_width, 0.0, 0, glue_width, 2, last_width, True])
+    elif cclass == CharClass.MID_PUNCT:  # 中点之前
+        glue_width = width / 2
+        if last_class == CharClass.COMMAS:  # 逗号加中点
+            append_glue_to(hlist, [last_width, 0.0, 0, last_width, 3, last_width, False])
+        elif last_class == CharClass.PERIODS:  # 句号加中点
+            append_glue_to(hlist, [last_width, 0.0, 0, 0.0, 0, last_width, False])
         append_glue_to(hlist, [glue_width, 0.0, 0, glue_width, 2, 0.0, False])
-    elif second_last.content.cclass in [CharClass.RIGHT_PUNCT, CharClass.COMMAS]:  # 右标点之后
-        if last.content.cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
-            append_glue_to(hlist, [second_last.content.width, 0.0, 0, second_last.content.width, 3,
-                                   second_last.content.width, True])
-    elif second_last.content.cclass == CharClass.PERIODS:  # 句号
-        if last.content.cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
-            append_glue_to(hlist, [second_last.content.width, 0.0, 0, 0.0, 0,
-                                   second_last.content.width, True])
-    elif last.content.cclass == CharClass.LEFT_PUNCT:  # 左标点
-        append_glue_to(hlist, [last.content.width, 0.0, 0, last.content.width, 3, 0.0, True])
+    elif last_class in [CharClass.RIGHT_PUNCT, CharClass.COMMAS]:  # 右标点之后
+        if cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
+            append_glue_to(hlist, [last_width, 0.0, 0, last_width, 3, last_width, True])
+    elif last_class == CharClass.PERIODS:  # 句号
+        if cclass not in [CharClass.RIGHT_PUNCT, CharClass.COMMAS, CharClass.PERIODS]:
+            append_glue_to(hlist, [last_width, 0.0, 0, 0.0, 0, last_width, True])
+    elif cclass == CharClass.LEFT_PUNCT:  # 左标点
+        append_glue_to(hlist, [width, 0.0, 0, width, 3, 0.0, True])
     # 汉字和西文间
-    elif second_last.content.cclass == CharClass.IDEOGRAPHIC\
-            and last.content.cclass == CharClass.WESTERN:
-        base_width = second_last.content.width / 4
+    elif last_class == CharClass.IDEOGRAPHIC and cclass == CharClass.WESTERN:
+        base_width = last_width / 4
         append_glue_to(hlist, [base_width, base_width, 2, base_width / 2, 4, 0.0, True])
-    elif second_last.content.cclass == CharClass.WESTERN\
-            and last.content.cclass == CharClass.IDEOGRAPHIC:
-        base_width = last.content.width / 4
+    elif last_class == CharClass.WESTERN and cclass == CharClass.IDEOGRAPHIC:
+        base_width = width / 4
         append_glue_to(hlist, [base_width, base_width, 2, base_width / 2, 4, 0.0, True])
     # 汉字和汉字间
-    elif second_last.content.cclass == CharClass.IDEOGRAPHIC\
-            and last.content.cclass == CharClass.IDEOGRAPHIC:
-        append_glue_to(hlist, [0.0, second_last.content.width / 4, 3, 0.0, 0, 0.0, True])
-    hlist.append(last)
-    pass
+    elif last_class == CharClass.IDEOGRAPHIC and cclass == CharClass.IDEOGRAPHIC:
+        append_glue_to(hlist, [0.0, last_width / 4, 3, 0.0, 0, 0.0, True])
 
 
 class TokenIterator:
@@ -239,8 +527,21 @@ class TokenIterator:
         self.i += step
 
 
-def process_western_temp_list(hlist: List[HBox]):
-    pass
+def process_western_temp_list(hlist: GlyphRun):
+    """
+    处理一段连续的西文字符：按词排版（查出 GID，做连字等替换，再查出宽度和字偶距），排过的词直接从缓存中取。
+    字偶距计入前一个字符的宽度。替换后字形的个数可能与字符数不同，hlist 相应地截短或补长。
+    """
+    text = hlist.codes.tobytes().decode(UTF32)
+    runs = SHAPING_CACHE.shape_text(WESTERN_FONT, WESTERN_FONT_SIZE, text)
+    gids = array('I', chain.from_iterable(run.gids for run in runs))
+    del hlist[len(gids):]
+    while len(hlist) < len(gids):
+        hlist.append(hlist[-1])
+    advances = chain.from_iterable(run.advances for run in runs)
+    kerns = chain.from_iterable(run.kerns for run in runs)
+    hlist.codes[:] = gids
+    hlist.widths[:] = array('d', map(add, advances, kerns))
 
 
 def process_token(token_list):
@@ -252,28 +553,28 @@ def process_token(token_list):
     iterator = TokenIterator(token_list)
     paragraph_vlist = []
 
-    current_hlist = []
-    western_temp_list = []
+    current_hlist = GlyphRun()
+    western_temp_list = GlyphRun()
 
     while iterator.has_next():
         cur_token = iterator.next_token()
         if cur_token.category == TokenType.CHAR:
-            hbox_glyph = HBox(HorElementType.GLYPH, cur_token.content)
-            if hbox_glyph.content.cclass == CharClass.WESTERN:  # 西文字符特别处理
-                western_temp_list.append(hbox_glyph)
+            fields = _glyph_fields(cur_token.content)
+            if fields[0] == CharClass.WESTERN:  # 西文字符特别处理
+                western_temp_list.append_glyph(*fields)
             else:
                 if len(western_temp_list) > 0:
                     process_western_temp_list(western_temp_list)
-                    current_hlist.append(western_temp_list[0])
-                    adjust_glue(current_hlist)
-                    current_hlist.extend(western_temp_list[1:])
-                current_hlist.append(hbox_glyph)
-                adjust_glue(current_hlist)
+                    adjust_glue(current_hlist, CharClass.WESTERN, western_temp_list.widths[0])
+                    current_hlist.extend(western_temp_list)
+                    del western_temp_list[:]
+                adjust_glue(current_hlist, fields[0], fields[4])
+                current_hlist.append_glyph(*fields)
             pass
         if cur_token.category == TokenType.NEW_PARAGRAPH or cur_token.category == TokenType.END_OF_FILE:
             if len(western_temp_list) > 0:
                 process_western_temp_list(western_temp_list)
-                current_hlist.append(western_temp_list[0])
-                adjust_glue(current_hlist)
-                current_hlist.extend(western_temp_list[1:])
+                adjust_glue(current_hlist, CharClass.WESTERN, western_temp_list.widths[0])
+                current_hlist.extend(western_temp_list)
+                del western_temp_list[:]
     return current_hlist
@@ -1,82 +1,291 @@
 import re
 from enum import Enum
-from typing import List
+from typing import Dict, Iterable, Iterator, List, Tuple
 from item_type import ItemType, TokenNode
 
 
 # unit_factor = {'mm': 1.0, 'cm': 10.0, 'pt': 0.3514}
 
+# list_of_keywords = ['版面', '宽度', '音符字号', '歌词字号', '字体', '每拍宽度', '简谱', '五线谱', '谱表']
+KEYWORDS = frozenset(['版面', '简谱', '五线谱', '歌词中', '歌词英', '谱表'])
 
-def generate_token(content: str) -> TokenNode:
-    # list_of_keywords = ['版面', '宽度', '音符字号', '歌词字号', '字体', '每拍宽度', '简谱', '五线谱', '谱表']
-    list_of_keywords = ['版面', '简谱', '五线谱', '歌词中', '谱表']
-    if content in list_of_keywords:
-        return TokenNode(ItemType.KEYWORD, content)
+# 数字及长度：数字后面可以跟一个纯字母的单位
+_number_pattern = re.compile(r'(\d+(?:\.\d*)?)([A-Za-z]*)')
 
-    match = re.match(r'\d+(\.\d*)?', content)
+# 总的词法规则。每次匹配都对应一个完整的词素（连同前面的空白），不必再逐字符拼接。
+# 注释会连同行尾一起吃掉（不产生行尾 Token），且不会打断前面的词。
+_token_pattern = re.compile(r'''
+    [ \t]*
+    (?:
+        (?P<word>[^ \t\n;={},"%]+)
+      | (?P<eol>[\n;])
+      | (?P<eq>=)
+      | (?P<brace_left>\{)
+      | (?P<brace_right>\})
+      | (?P<comma>,)
+      | (?P<string>"[^"]*")
+      | (?P<comment>%[^\n]*\n?)
+      | (?P<quote>")
+      | \Z
+    )
+''', re.VERBOSE)
+
+
+def classify_word(content: str) -> Tuple[ItemType, object]:
+    """
+    判断一个词的类型。
+    :return: (Token 类型, Token 内容)
+    """
+    if content in KEYWORDS:
+        return ItemType.KEYWORD, content
+
+    match = _number_pattern.fullmatch(content)
     if match:
-        number = float(match.group(0))
-        remainder = content[match.end():]
-        if re.fullmatch(r'[A-Za-z]+', remainder):
+        number = float(match.group(1))
+        if match.group(2):
             # print('不合法单位：%s，默认视为毫米。' % remainder)
-            return TokenNode(ItemType.DIMEN, (number, remainder))
-        elif len(remainder) == 0:
-            return TokenNode(ItemType.NUMBER, number)
+            return ItemType.DIMEN, (number, match.group(2))
+        return ItemType.NUMBER, number
 
-    return TokenNode(ItemType.IDENTIFIER, content)
+    return ItemType.IDENTIFIER, content
 
 
-def tokenize(content: str) -> List[TokenNode]:
-    length = len(content)
-    result = []
-    current = ''
-
-    pos = 0
-    while pos < length:
-        current_char = content[pos]
-        if current_char in ' \t\n;={},"' and len(current) > 0:
-            result.append(generate_token(current))
-            current = ''
-        while current_char in ' \t':
-            pos += 1
-            current_char = content[pos]
-        if current_char == '%':
-            while current_char != '\n':
-                pos += 1
-                current_char = content[pos]
-        elif current_char == '=':
-            result.append(TokenNode(ItemType.EQ, None))
-        elif current_char == '{':
-            result.append(TokenNode(ItemType.BRACE_LEFT, pos))
-        elif current_char == '}':
-            if result[-1].type == ItemType.END_OF_LINE:
-                result.pop()
-            result.append(TokenNode(ItemType.BRACE_RIGHT, pos))
-        elif current_char == '\n' or current_char == ';':
-            if len(result) > 0 and result[-1].type != ItemType.END_OF_LINE\
-                    and result[-1].type != ItemType.BRACE_LEFT:
-                result.append(TokenNode(ItemType.END_OF_LINE, pos))
-        elif current_char == ',':
-            result.append(TokenNode(ItemType.COMMA, None))
-        elif current_char == '"':
-            pos += 1
-            current_char = content[pos]
-            while current_char != '"':
-                current += current_char
-                pos += 1
-                if pos == len(content):
-                    print("字符串双引号不匹配")
-                    exit(1)
-                current_char = content[pos]
+def generate_token(content: str, start: int = None, end: int = None) -> TokenNode:
+    token_type, value = classify_word(content)
+    return TokenNode(token_type, value, start, end)
+
+
+class BraceMatcher:
+    """
+    用一个栈一次扫描出所有大括号的配对关系。Token 可以分几批输入，下标按全部 Token 连续计算。
+    """
+    def __init__(self):
+        self.pairs: Dict[int, int] = {}  # 左括号的下标 -> 相应右括号的下标
+        self.stack = []  # 尚未配对的左括号的下标
+        self.unmatched = []  # 多余的右括号
+        self.count = 0  # 已扫描的 Token 数
+
+    def scan(self, tokens: List[TokenNode]):
+        stack = self.stack
+        for index, token in enumerate(tokens, self.count):
+            if token.type is ItemType.BRACE_LEFT:
+                stack.append((index, token))
+            elif token.type is ItemType.BRACE_RIGHT:
+                if len(stack) > 0:
+                    self.pairs[stack.pop()[0]] = index
+                else:
+                    self.unmatched.append(token)
+        self.count += len(tokens)
+
+    def check(self):
+        """
+        检查是否有未配对的括号，如有则一次性报告所有位置后退出。
+        """
+        unmatched = sorted([token for _, token in self.stack] + self.unmatched, key=lambda token: token.start)
+        if len(unmatched) > 0:
+            print('错误：括号未匹配，位置：%s' % '，'.join(
+                '%s%d' % ('{' if token.type is ItemType.BRACE_LEFT else '}', token.start) for token in unmatched))
+            exit(1)
+
+
+def match_braces(tokens: List[TokenNode]) -> Dict[int, int]:
+    """
+    求 Token 列表中大括号的配对表。
+    :param tokens: Token 列表
+    :return: 字典，键为左括号的下标，值为相应右括号的下标。
+    """
+    matcher = BraceMatcher()
+    matcher.scan(tokens)
+    matcher.check()
+    return matcher.pairs
+
+
+class Lexer:
+    """
+    可以分段输入的词法分析器。分段处可以在任意位置（包括词、字符串和注释的中间），
+    不完整的词素会留到下一段再处理，因此所需内存只与段的长度有关。
+    """
+    def __init__(self, offset: int = 0, last_type: ItemType = None):
+        """
+        :param offset: 第一段在全文中的位置。从文档中间开始分析时使用。
+        :param last_type: 此前最后一个 Token 的类型。从文档中间开始分析时使用。
+        """
+        self.buffer = ''  # 上一段末尾尚未处理的部分
+        self.offset = offset  # buffer[0] 在全文中的位置
+        self.held = None  # 暂不输出的行尾 Token（后面可能是右括号，或者已到文档结束）
+        self.last_type = last_type  # 已输出的最后一个 Token 的类型
+        self.braces = BraceMatcher()  # 大括号配对表在 braces.pairs 中
+        # 乐谱中同一个词会反复出现，分类结果可以直接复用
+        self.word_cache = {}
+        # 紧接着注释的词要等注释后面的部分接上以后才能生成 Token，resume 为接续部分应在的位置
+        self.word = None
+        self.word_start = self.word_end = self.resume = 0
+
+    def feed(self, chunk: str, final: bool = False) -> List[TokenNode]:
+        """
+        输入一段文本。
+        :param chunk: 文本
+        :param final: 是否为最后一段
+        :return: 本段中可以确定的 Token。最后一段的结果以 END_OF_FILE 结尾。
+        """
+        content = self.buffer + chunk if self.buffer else chunk
+        length = len(content)
+        base = self.offset
+        result = [self.held] if self.held is not None else []
+        append = result.append
+        end_of_line = ItemType.END_OF_LINE
+        brace_left = ItemType.BRACE_LEFT
+        word_cache = self.word_cache
+        word = self.word
+        word_start, word_end, resume = self.word_start, self.word_end, self.resume
+        cut = length
+
+        for match in _token_pattern.finditer(content):
+            kind = match.lastgroup
+            # 碰到段尾的词素可能还没完，字符串也可能在下一段才结束
+            if not final and (match.end() == length or kind == 'quote'):
+                cut = match.start()
+                break
+            if word is not None:
+                if kind is not None and base + match.start(kind) == resume:
+                    if kind == 'comment':
+                        resume = base + match.end()
+                        continue
+                    if kind == 'word':
+                        word += match.group(kind)
+                        word_end = resume = base + match.end()
+                        if not content.startswith('%', match.end()):
+                            append(generate_token(word, word_start, word_end))
+                            word = None
+                        continue
+                append(generate_token(word, word_start, word_end))
+                word = None
+
+            if kind == 'word':
+                end = match.end()
+                if content.startswith('%', end):
+                    word = match.group(kind)
+                    word_start = base + match.start(kind)
+                    word_end = resume = base + end
+                    continue
+                text = match.group(kind)
+                classified = word_cache.get(text)
+                if classified is None:
+                    classified = word_cache[text] = classify_word(text)
+                append(TokenNode(classified[0], classified[1], base + match.start(kind), base + end))
+            elif kind == 'eol':
+                pos = base + match.start(kind)
+                last_type = result[-1].type if len(result) > 0 else self.last_type
+                if last_type is not None and last_type is not end_of_line and last_type is not brace_left:
+                    append(TokenNode(end_of_line, pos, pos, pos + 1))
+            elif kind == 'brace_left':
+                pos = base + match.start(kind)
+                append(TokenNode(brace_left, pos, pos, pos + 1))
+            elif kind == 'brace_right':
+                pos = base + match.start(kind)
+                if len(result) > 0 and result[-1].type is end_of_line:
+                    result.pop()
+                append(TokenNode(ItemType.BRACE_RIGHT, pos, pos, pos + 1))
+            elif kind == 'eq':
+                pos = base + match.start(kind)
+                append(TokenNode(ItemType.EQ, None, pos, pos + 1))
+            elif kind == 'comma':
+                pos = base + match.start(kind)
+                append(TokenNode(ItemType.COMMA, None, pos, pos + 1))
+            elif kind == 'string':
+                append(TokenNode(ItemType.STRING, match.group(kind)[1:-1],
+                                 base + match.start(kind), base + match.end()))
+            elif kind == 'comment':
                 pass
-            result.append(TokenNode(ItemType.STRING, current))
-            current = ''
+            elif kind == 'quote':
+                print("字符串双引号不匹配")
+                exit(1)
+
+        self.buffer = content[cut:]
+        self.offset = base + cut
+        self.word = word
+        self.word_start, self.word_end, self.resume = word_start, word_end, resume
+
+        if final:
+            if word is not None:
+                append(generate_token(word, word_start, word_end))
+                self.word = None
+            while len(result) > 0 and result[-1].type == ItemType.END_OF_LINE:
+                result.pop()
+            end = base + length
+            append(TokenNode(ItemType.END_OF_FILE, None, end, end))
+            self.held = None
+        elif len(result) > 0 and result[-1].type is end_of_line:
+            self.held = result.pop()
         else:
-            current += current_char
-        pos += 1
+            self.held = None
+        if len(result) > 0:
+            self.last_type = result[-1].type
+        self.braces.scan(result)
+        if final:
+            self.braces.check()
+        return result
+
+
+def tokenize(content: str) -> List[TokenNode]:
+    """
+    词法分析。每个 Token 的 start、end 记录其在原文中的位置（左闭右开）。
+    :param content: 全文
+    :return: Token 列表，以 END_OF_FILE 结尾。
+    """
+    return Lexer().feed(content, True)
+
+
+def tokenize_with_braces(content: str) -> Tuple[List[TokenNode], Dict[int, int]]:
+    """
+    词法分析，同时求出大括号的配对表。
+    :param content: 全文
+    :return: (Token 列表, 配对表)，配对表的键为左括号的下标，值为相应右括号的下标。
+    """
+    lexer = Lexer()
+    tokens = lexer.feed(content, True)
+    return tokens, lexer.braces.pairs
+
+
+def tokenize_stream(chunks: Iterable[str]) -> Iterator[TokenNode]:
+    """
+    逐段进行词法分析，可以配合 `file_reader.read_chunks` 使用。
+    :param chunks: 依次输入的各段文本
+    :return: 逐个生成的 Token，以 END_OF_FILE 结尾。
+    """
+    lexer = Lexer()
+    for chunk in chunks:
+        yield from lexer.feed(chunk)
+    yield from lexer.feed('', True)
+
+
+class TokenType(Enum):
+    """
+    排版用的文字 Token（见 `token_process.process_token`）的类别。
+    """
+    CHAR = 0  # 一个字符，content 为其 Unicode 编码
+    NEW_PARAGRAPH = 1  # 分段（原文中的换行）
+    END_OF_FILE = 2  # 文字结束
+
+
+class TextToken:
+    __slots__ = ('category', 'content')
+
+    def __init__(self, category: TokenType, content=None):
+        self.category = category
+        self.content = content
+
+    def __repr__(self):
+        return "{%s, %s}" % (self.category.name, str(self.content))
 
-    while result[-1].type == ItemType.END_OF_LINE:
-        result.pop()
-    result.append(TokenNode(ItemType.END_OF_FILE, None))
 
+def tokenize_text(text: str) -> List[TextToken]:
+    """
+    把要排版的文字拆成 Token：每个字符一个 CHAR，换行处为 NEW_PARAGRAPH。
+    :param text: 文字
+    :return: Token 列表，以 END_OF_FILE 结尾。
+    """
+    result = [TextToken(TokenType.NEW_PARAGRAPH) if char == '\n' else TextToken(TokenType.CHAR, ord(char))
+              for char in text]
+    result.append(TextToken(TokenType.END_OF_FILE))
     return result